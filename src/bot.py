@@ -2,12 +2,27 @@ import discord
 from discord.ext import commands
 import asyncio
 import logging
+import re
+import time
 from typing import Optional
 
 from config import Config
-from llm_handler import LLMHandler
+from llm_handler import BUSY_MESSAGE, LLMHandler
 from mantis_client import MantisHubClient
 from database import DatabaseHandler
+from session_cache import SessionCache
+from response_cache import ResponseCache
+from message_coalescer import MessageCoalescer
+from streaming_reply import StreamingReply
+from ticket_batcher import TicketBatcher
+from outbox import CircuitBreaker, MantisOutbox
+from ticket_status import TicketStatusTracker
+from ticket_pager import TicketPager
+from maintenance import MaintenanceJob
+from scheduler import AdmissionScheduler
+from reply_queue import ReplyQueue
+from intent_classifier import IntentClassifier
+from metrics import REGISTRY, ACTIONS, MESSAGE_LATENCY, EventLoopLagMonitor, MetricsServer
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -17,15 +32,115 @@ intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix=Config.COMMAND_PREFIX, intents=intents)
 
-# Initializing components
-db = DatabaseHandler(Config.DATABASE_PATH)
-llm_handler = LLMHandler()
-mantis_client = MantisHubClient()
+# Components are created by configure() rather than at import time, so the
+# replay benchmark can run the handlers against stubbed services
+db: Optional[DatabaseHandler] = None
+response_cache: Optional[ResponseCache] = None
+llm_handler: Optional[LLMHandler] = None
+mantis_client: Optional[MantisHubClient] = None
+ticket_batcher: Optional[TicketBatcher] = None
+mantis_outbox: Optional[MantisOutbox] = None
+ticket_status: Optional[TicketStatusTracker] = None
+session_cache: Optional[SessionCache] = None
+maintenance: Optional[MaintenanceJob] = None
+# Held so the SOAP warm-up isn't garbage collected while it runs
+warm_up_task: Optional[asyncio.Task] = None
+
+def configure(database: Optional[DatabaseHandler] = None, llm: Optional[LLMHandler] = None,
+              mantis: Optional[MantisHubClient] = None):
+    """Create the bot's components, using any instances passed in instead of the defaults"""
+    global db, response_cache, llm_handler, mantis_client, ticket_batcher, mantis_outbox, ticket_status, session_cache, maintenance
+    
+    db = database or DatabaseHandler(Config.DATABASE_PATH, history_retention=Config.SESSION_HISTORY_RETENTION)
+    if llm is None:
+        response_cache = ResponseCache(
+            db if Config.RESPONSE_CACHE_PERSIST else None,
+            max_entries=Config.RESPONSE_CACHE_MAX_ENTRIES,
+            ttl=Config.RESPONSE_CACHE_TTL,
+            similarity_threshold=Config.RESPONSE_CACHE_SIMILARITY
+        )
+        llm = LLMHandler(response_cache=response_cache)
+    else:
+        response_cache = llm.response_cache
+    llm_handler = llm
+    mantis_client = mantis or MantisHubClient()
+    ticket_batcher = TicketBatcher(
+        mantis_client,
+        window=Config.TICKET_DEDUP_WINDOW,
+        similarity_threshold=Config.TICKET_DEDUP_SIMILARITY,
+        max_workers=Config.TICKET_WORKERS
+    )
+    mantis_outbox = MantisOutbox(
+        db,
+        mantis_client,
+        ticket_batcher,
+        poll_interval=Config.OUTBOX_POLL_INTERVAL,
+        max_attempts=Config.OUTBOX_MAX_ATTEMPTS,
+        base_backoff=Config.OUTBOX_BASE_BACKOFF,
+        max_backoff=Config.OUTBOX_MAX_BACKOFF,
+        breaker=CircuitBreaker(Config.OUTBOX_BREAKER_THRESHOLD, Config.OUTBOX_BREAKER_COOLDOWN)
+    )
+    ticket_status = TicketStatusTracker(
+        db,
+        mantis_client,
+        ttl=Config.TICKET_STATUS_TTL,
+        sync_interval=Config.TICKET_SYNC_INTERVAL,
+        concurrency=Config.TICKET_SYNC_CONCURRENCY
+    )
+    session_cache = SessionCache(
+        db,
+        context_size=Config.SESSION_CONTEXT_MESSAGES,
+        max_entries=Config.SESSION_CACHE_MAX_ENTRIES,
+        max_bytes=Config.SESSION_CACHE_MAX_BYTES,
+        ttl=Config.SESSION_CACHE_TTL,
+        flush_interval=Config.SESSION_FLUSH_INTERVAL
+    )
+    maintenance = MaintenanceJob(
+        db,
+        interval=Config.MAINTENANCE_INTERVAL,
+        session_ttl=Config.SESSION_IDLE_TTL,
+        ticket_archive_age=Config.TICKET_ARCHIVE_AGE,
+        batch_size=Config.MAINTENANCE_BATCH_SIZE,
+        quiet_period=Config.MAINTENANCE_QUIET_PERIOD,
+        vacuum_pages=Config.MAINTENANCE_VACUUM_PAGES
+    )
+
+def start_components():
+    """Start the components' background tasks (needs a running event loop)"""
+    session_cache.start()
+    mantis_outbox.start()
+    ticket_status.start()
+    maintenance.start()
+
+async def close_components():
+    """Stop background tasks, flush pending writes and close the database"""
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    await maintenance.close()
+    await ticket_status.close()
+    await mantis_outbox.close()
+    # Persist conversation history still held in memory
+    await session_cache.close()
+    db.close()
+
+loop_lag_monitor = EventLoopLagMonitor(interval=Config.LOOP_LAG_INTERVAL)
+metrics_server = MetricsServer(REGISTRY, host=Config.METRICS_HOST, port=Config.METRICS_PORT)
+
+@bot.event
+async def setup_hook():
+    start_components()
+    loop_lag_monitor.start()
+    if Config.METRICS_PORT:
+        await metrics_server.start()
 
 @bot.event
 async def on_ready():
     print(f'{bot.user} has connected to Discord!')
     print(f'Bot is ready to help with washing machine support!')
+    global warm_up_task
+    # on_ready fires again after reconnects; one warm-up at a time is enough
+    if warm_up_task is None or warm_up_task.done():
+        warm_up_task = asyncio.create_task(mantis_client.warm_up_async())
 
 @bot.event
 async def on_message(message):
@@ -33,6 +148,9 @@ async def on_message(message):
     if message.author == bot.user:
         return
     
+    # Compaction only runs once the bot has been idle for a while
+    maintenance.record_activity()
+    
     # Only respond in support channel or DMs
     if Config.SUPPORT_CHANNEL_ID and message.channel.id != Config.SUPPORT_CHANNEL_ID and not isinstance(message.channel, discord.DMChannel):
         return
@@ -42,77 +160,148 @@ async def on_message(message):
         await bot.process_commands(message)
         return
     
-    # Process the message
-    await handle_support_message(message)
+    # Process the message once the user's burst settles
+    message_coalescer.submit(str(message.author.id), message)
+
+# Urgent faults (leaks, sparks, smoke) go ahead of routine questions when busy
+priority_classifier = IntentClassifier()
+admission_scheduler = AdmissionScheduler(
+    concurrency=Config.SCHEDULER_CONCURRENCY,
+    class_limits=Config.SCHEDULER_CLASS_LIMITS,
+    max_queue=Config.SCHEDULER_MAX_QUEUE
+)
+
+# Replies are paced per channel and sent in the background, so handlers return at once
+reply_queue = ReplyQueue(
+    rate=Config.REPLY_RATE_LIMIT,
+    per=Config.REPLY_RATE_PERIOD,
+    global_rate=Config.REPLY_GLOBAL_RATE,
+    max_embeds=Config.REPLY_MAX_EMBEDS
+)
+
+async def handle_message_burst(messages):
+    """Handle a burst of messages from one user as a single query"""
+    user_message = "\n".join(m.content.strip() for m in messages if m.content.strip())
+    message = messages[-1]
+    priority = priority_classifier.priority(user_message)
+    admitted = await admission_scheduler.run(
+        priority,
+        str(message.author.id),
+        lambda: handle_support_message(message, user_message, priority)
+    )
+    if not admitted:
+        await reply_queue.reply(message, content=BUSY_MESSAGE)
+
+message_coalescer = MessageCoalescer(
+    handle_message_burst,
+    window=Config.COALESCE_WINDOW,
+    max_delay=Config.COALESCE_MAX_DELAY
+)
 
-async def handle_support_message(message):
-    """Handle support-related messages"""
+def model_router_stats():
+    """Per-model routing stats, flattened into metric-safe names"""
+    flat = {}
+    for name, stats in llm_handler.router.backend_stats().items():
+        prefix = re.sub(r'[^A-Za-z0-9]', '_', name)
+        for key, value in stats.items():
+            flat[f"{prefix}_{key}"] = value
+    return flat
+
+# Expose each component's counters alongside the latency metrics
+REGISTRY.register_stats('llm_tokens', lambda: llm_handler.token_stats)
+REGISTRY.register_stats('llm_model', model_router_stats)
+REGISTRY.register_stats('llm_parse', lambda: dict(llm_handler.parse_stats, failure_rate=llm_handler.parse_failure_rate))
+REGISTRY.register_stats('intent_classifier', lambda: llm_handler.intent_classifier.stats)
+REGISTRY.register_stats('response_cache', lambda: dict(response_cache.stats, hit_rate=response_cache.hit_rate) if response_cache else {})
+REGISTRY.register_stats('session_cache', lambda: session_cache.stats)
+REGISTRY.register_stats('mantis_categories', lambda: mantis_client.category_stats)
+REGISTRY.register_stats('ticket_batcher', lambda: ticket_batcher.stats)
+REGISTRY.register_stats('mantis_outbox', lambda: mantis_outbox.stats)
+REGISTRY.register_stats('ticket_status', lambda: ticket_status.stats)
+REGISTRY.register_stats('message_coalescer', lambda: message_coalescer.stats)
+REGISTRY.register_stats('scheduler', lambda: admission_scheduler.stats)
+REGISTRY.register_stats('reply_queue', lambda: dict(reply_queue.stats, depth=reply_queue.depth))
+REGISTRY.register_stats('db_maintenance', lambda: maintenance.stats)
+REGISTRY.register_stats('db_table_bytes', lambda: maintenance.table_sizes)
+
+async def handle_support_message(message, user_message: Optional[str] = None, priority: Optional[int] = None):
+    """Handle support-related messages, with the urgency they were admitted at"""
     user_id = str(message.author.id)
-    user_message = message.content.strip()
+    if user_message is None:
+        user_message = message.content.strip()
     
+    started = time.perf_counter()
     try:
         async with message.channel.typing():
-            # Get conversation history - FIX THE ERROR HERE
-            conversation_history = db.get_session(user_id)
-            if conversation_history is None:
-                conversation_history = {'messages': []}
-            
-            # Process with LLM
-            llm_response = await llm_handler.process_query(user_message, conversation_history.get('messages', []))
+            # Get recent conversation history
+            history = await session_cache.get_recent_messages(user_id)
             
-            # Update conversation history
-            if 'messages' not in conversation_history:
-                conversation_history['messages'] = []
-            
-            conversation_history['messages'].append({"role": "user", "content": user_message})
-            conversation_history['messages'].append({"role": "assistant", "content": llm_response['response']})
+            # Process with LLM, streaming partial text into a preview reply
+            stream_reply = None
+            if Config.LLM_STREAMING:
+                stream_reply = StreamingReply(message, interval=Config.STREAM_EDIT_INTERVAL, reply_queue=reply_queue)
+                llm_response = await llm_handler.process_query(user_message, history, on_partial=stream_reply.update,
+                                                               priority=priority)
+            else:
+                llm_response = await llm_handler.process_query(user_message, history, priority=priority)
             
             # Handle different actions
             if llm_response['action'] == 'create_ticket':
-                await handle_ticket_creation(message, llm_response, user_id)
+                await handle_ticket_creation(message, llm_response, user_id, user_message, stream_reply, priority)
             elif llm_response['action'] == 'troubleshoot':
-                await send_troubleshooting_response(message, llm_response)
+                await send_troubleshooting_response(message, llm_response, stream_reply)
             else:
-                await send_clarification_response(message, llm_response)
+                await send_clarification_response(message, llm_response, stream_reply)
+            ACTIONS.inc(action=llm_response['action'])
             
-            db.update_session(user_id, conversation_history)
+            # Update conversation history
+            await session_cache.append_messages(user_id, [
+                {"role": "user", "content": user_message},
+                {"role": "assistant", "content": llm_response['response']}
+            ])
             
     except Exception as e:
         logger.error(f"Error handling message: {e}")
-        await message.reply("I'm sorry, I encountered an error. Please try again later.")
+        await reply_queue.reply(message, content="I'm sorry, I encountered an error. Please try again later.")
+    finally:
+        MESSAGE_LATENCY.observe(time.perf_counter() - started)
+
+async def send_reply(message, stream_reply: Optional[StreamingReply] = None, content=None, embed=None):
+    """Queue a reply to a message, replacing the streamed preview if one was started"""
+    if stream_reply is None or not await stream_reply.finish(content=content, embed=embed):
+        await reply_queue.reply(message, content=content, embed=embed)
 
-async def handle_ticket_creation(message, llm_response, user_id):
+async def handle_ticket_creation(message, llm_response, user_id, user_message, stream_reply=None, priority=None):
     """Handle ticket creation process"""
     
-    # Create ticket in Mantis Hub
-    ticket_id = mantis_client.create_ticket(
-        summary=llm_response.get('ticket_summary', 'Washing Machine Issue'),
-        description=f"Issue reported by Discord user {message.author.display_name}:\n\n{message.content}",
+    # Queue the ticket locally; the outbox delivers it to Mantis in the background
+    summary = llm_response.get('ticket_summary', 'Washing Machine Issue')
+    reference = await mantis_outbox.submit_ticket(
+        user_id,
+        f"discord-message-{message.id}",
+        summary=summary,
+        description=f"Issue reported by Discord user {message.author.display_name}:\n\n{user_message}",
         reporter_name=message.author.display_name,
         category=llm_response.get('category', 'General'),
-        priority=llm_response.get('priority', 40)
+        # Never file a ticket as less urgent than the message was admitted at
+        priority=min(llm_response.get('priority', 40), priority or 50),
+        report=user_message
     )
     
-    if ticket_id:
-        # Save to database
-        db.create_ticket_record(user_id, ticket_id, llm_response.get('ticket_summary', 'Washing Machine Issue'))
-        
-        # Create embed for ticket confirmation
-        embed = discord.Embed(
-            title="🎫 Support Ticket Created",
-            description=llm_response['response'],
-            color=0x00ff00
-        )
-        embed.add_field(name="Ticket Number", value=f"#{ticket_id}", inline=True)
-        embed.add_field(name="Status", value="New", inline=True)
-        embed.add_field(name="Category", value=llm_response.get('category', 'General'), inline=True)
-        embed.set_footer(text="You can reference this ticket number for future updates.")
-        
-        await message.reply(embed=embed)
-    else:
-        await message.reply("I apologize, but I couldn't create a support ticket at the moment. Please try again later or contact support directly.")
+    # Create embed for ticket confirmation
+    embed = discord.Embed(
+        title="🎫 Support Ticket Created",
+        description=llm_response['response'],
+        color=0x00ff00
+    )
+    embed.add_field(name="Reference", value=f"#{reference}", inline=True)
+    embed.add_field(name="Status", value="Submitting", inline=True)
+    embed.add_field(name="Category", value=llm_response.get('category', 'General'), inline=True)
+    embed.set_footer(text="Use !tickets to see your ticket number once it's confirmed, or !status with this reference.")
+    
+    await send_reply(message, stream_reply, embed=embed)
 
-async def send_troubleshooting_response(message, llm_response):
+async def send_troubleshooting_response(message, llm_response, stream_reply=None):
     """Send troubleshooting response to user"""
     
     embed = discord.Embed(
@@ -122,9 +311,9 @@ async def send_troubleshooting_response(message, llm_response):
     )
     embed.set_footer(text="If these steps don't help, let me know and I can create a support ticket for you.")
     
-    await message.reply(embed=embed)
+    await send_reply(message, stream_reply, embed=embed)
 
-async def send_clarification_response(message, llm_response):
+async def send_clarification_response(message, llm_response, stream_reply=None):
     """Send clarification response to user"""
     
     embed = discord.Embed(
@@ -133,51 +322,61 @@ async def send_clarification_response(message, llm_response):
         color=0xffaa00
     )
     
-    await message.reply(embed=embed)
+    await send_reply(message, stream_reply, embed=embed)
 
 # Commands
 @bot.command(name='tickets')
-async def show_tickets(ctx):
-    """Show user's tickets"""
+async def show_tickets(ctx, *args: str):
+    """Show user's tickets: !tickets [page] [status], in either order (e.g. !tickets open 2)"""
+    page, status = 1, None
+    for arg in args[:2]:
+        if arg.isdigit():
+            page = int(arg)
+        else:
+            status = arg.lower()
     user_id = str(ctx.author.id)
-    tickets = db.get_user_tickets(user_id)
+    pager = TicketPager(db, user_id, page_size=Config.TICKETS_PAGE_SIZE, status=status)
+    embed = await pager.load(max(page, 1))
     
-    if not tickets:
-        await ctx.reply("You don't have any support tickets.")
+    if embed is None:
+        if page > 1 or status:
+            await ctx.reply("No tickets found for that page or status.")
+        else:
+            await ctx.reply("You don't have any support tickets.")
         return
     
-    embed = discord.Embed(
-        title="📋 Your Support Tickets",
-        color=0x0099ff
-    )
-    
-    for ticket in tickets[:5]:
-        ticket_id, summary, created_at, status = ticket
-        embed.add_field(
-            name=f"Ticket #{ticket_id}",
-            value=f"**{summary}**\nCreated: {created_at}\nStatus: {status}",
-            inline=False
-        )
-    
-    await ctx.reply(embed=embed)
+    await ctx.reply(embed=embed, view=pager)
 
 @bot.command(name='status')
 async def check_ticket_status(ctx, ticket_id: str):
     """Check status of a specific ticket"""
     
-    ticket_info = mantis_client.get_ticket_status(ticket_id)
+    # Provisional references stand for tickets still in the outbox
+    ticket_id = ticket_id.lstrip('#')
+    state, resolved_id = await mantis_outbox.resolve_reference(ticket_id)
+    if state == 'pending':
+        await ctx.reply(f"Ticket #{ticket_id} is still being submitted to our support system. Please check again shortly.")
+        return
+    if state == 'failed':
+        await ctx.reply(f"Ticket #{ticket_id} could not be submitted to our support system. "
+                        f"Please describe the problem again so we can open a new ticket.")
+        return
+    if state == 'unknown':
+        await ctx.reply(f"Could not find ticket #{ticket_id}. Please check the number in `!tickets`.")
+        return
+    ticket_id = resolved_id
+    
+    ticket_info = await ticket_status.get(ticket_id)
     
     if ticket_info:
-        issue = ticket_info.get('issues', [{}])[0]
-        
         embed = discord.Embed(
             title=f"🎫 Ticket #{ticket_id} Status",
             color=0x00ff00
         )
-        embed.add_field(name="Summary", value=issue.get('summary', 'N/A'), inline=False)
-        embed.add_field(name="Status", value=issue.get('status', {}).get('name', 'Unknown'), inline=True)
-        embed.add_field(name="Priority", value=issue.get('priority', {}).get('name', 'Unknown'), inline=True)
-        embed.add_field(name="Assigned To", value=issue.get('handler', {}).get('name', 'Unassigned'), inline=True)
+        embed.add_field(name="Summary", value=ticket_info.get('summary', 'N/A'), inline=False)
+        embed.add_field(name="Status", value=ticket_info.get('status', 'Unknown'), inline=True)
+        embed.add_field(name="Priority", value=ticket_info.get('priority', 'Unknown'), inline=True)
+        embed.add_field(name="Assigned To", value=ticket_info.get('handler', 'Unassigned'), inline=True)
         
         await ctx.reply(embed=embed)
     else:
@@ -202,7 +401,7 @@ async def help_command(ctx):
     embed.add_field(
         name="Available Commands:",
         value="""
-        `!tickets` - View your support tickets
+        `!tickets [status] [page]` - View your support tickets, e.g. `!tickets open`
         `!status <ticket_id>` - Check ticket status
         `!help_washing` - Show this help message
         """,
@@ -231,5 +430,16 @@ async def on_command_error(ctx, error):
     logger.error(f"Command error: {error}")
     await ctx.reply("An error occurred while processing your command.")
 
+async def main():
+    configure()
+    async with bot:
+        try:
+            await bot.start(Config.DISCORD_TOKEN)
+        finally:
+            await reply_queue.close()
+            await metrics_server.close()
+            await loop_lag_monitor.close()
+            await close_components()
+
 if __name__ == "__main__":
-    bot.run(Config.DISCORD_TOKEN)
+    asyncio.run(main())
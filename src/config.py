@@ -10,16 +10,116 @@ class Config:
     # Google Gemini API Key (REPLACED OpenAI)
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
     
+    # Gemini inference pool
+    LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+    LLM_MAX_QUEUE_DEPTH = int(os.getenv('LLM_MAX_QUEUE_DEPTH', '100'))
+    LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '30'))
+    
+    # Model routing: comma-separated models, cheapest/fastest first. Messages
+    # up to LLM_SHORT_MESSAGE_CHARS go to the first model and longer ones to
+    # the last; another model is only used when that one is unhealthy. A call
+    # slower than the model's p95 latency (LLM_HEDGE_DELAY until measured) is hedged
+    LLM_MODELS = [name.strip() for name in os.getenv('LLM_MODELS', 'gemini-1.5-flash').split(',') if name.strip()]
+    LLM_SHORT_MESSAGE_CHARS = int(os.getenv('LLM_SHORT_MESSAGE_CHARS', '280'))
+    LLM_HEDGING = os.getenv('LLM_HEDGING', 'true').lower() == 'true'
+    LLM_HEDGE_QUANTILE = float(os.getenv('LLM_HEDGE_QUANTILE', '0.95'))
+    LLM_HEDGE_DELAY = float(os.getenv('LLM_HEDGE_DELAY', '3'))
+    LLM_HEDGE_MIN_DELAY = float(os.getenv('LLM_HEDGE_MIN_DELAY', '0.5'))
+    
+    # Prompt size limits (estimated tokens)
+    LLM_HISTORY_TOKEN_BUDGET = int(os.getenv('LLM_HISTORY_TOKEN_BUDGET', '600'))
+    LLM_MESSAGE_TOKEN_LIMIT = int(os.getenv('LLM_MESSAGE_TOKEN_LIMIT', '200'))
+    
+    # Streamed replies (seconds between Discord message edits)
+    LLM_STREAMING = os.getenv('LLM_STREAMING', 'true').lower() == 'true'
+    STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', '1.5'))
+    
+    # Local intent classifier (answers without Gemini at or above this confidence, >1 disables)
+    INTENT_CONFIDENCE_THRESHOLD = float(os.getenv('INTENT_CONFIDENCE_THRESHOLD', '0.8'))
+    
+    # LLM response cache
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1000'))
+    RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '86400'))
+    RESPONSE_CACHE_SIMILARITY = float(os.getenv('RESPONSE_CACHE_SIMILARITY', '0.85'))
+    RESPONSE_CACHE_PERSIST = os.getenv('RESPONSE_CACHE_PERSIST', 'true').lower() == 'true'
+    
     # Mantis Hub Configuration
     MANTIS_BASE_URL = os.getenv('MANTIS_BASE_URL')
     MANTIS_API_TOKEN = os.getenv('MANTIS_API_TOKEN')
     MANTIS_USERNAME = os.getenv('MANTIS_USERNAME')
     MANTIS_PASSWORD = os.getenv('MANTIS_PASSWORD')
     MANTIS_PROJECT_ID = os.getenv('MANTIS_PROJECT_ID', '1')
+    MANTIS_POOL_SIZE = int(os.getenv('MANTIS_POOL_SIZE', '10'))
+    MANTIS_CONNECT_TIMEOUT = float(os.getenv('MANTIS_CONNECT_TIMEOUT', '5'))
+    MANTIS_READ_TIMEOUT = float(os.getenv('MANTIS_READ_TIMEOUT', '30'))
+    MANTIS_MAX_RETRIES = int(os.getenv('MANTIS_MAX_RETRIES', '2'))
+    MANTIS_RETRY_BACKOFF = float(os.getenv('MANTIS_RETRY_BACKOFF', '0.5'))
+    MANTIS_WSDL_CACHE_PATH = os.getenv('MANTIS_WSDL_CACHE_PATH', 'wsdl_cache.db')
+    MANTIS_WSDL_CACHE_TTL = int(os.getenv('MANTIS_WSDL_CACHE_TTL', '86400'))
+    MANTIS_CATEGORY_CACHE_TTL = int(os.getenv('MANTIS_CATEGORY_CACHE_TTL', '3600'))
+    
+    # Duplicate ticket grouping
+    TICKET_DEDUP_WINDOW = float(os.getenv('TICKET_DEDUP_WINDOW', '600'))
+    TICKET_DEDUP_SIMILARITY = float(os.getenv('TICKET_DEDUP_SIMILARITY', '0.7'))
+    TICKET_WORKERS = int(os.getenv('TICKET_WORKERS', '4'))
+    
+    # Ticket status cache and background sync (seconds)
+    TICKET_STATUS_TTL = float(os.getenv('TICKET_STATUS_TTL', '300'))
+    TICKET_SYNC_INTERVAL = float(os.getenv('TICKET_SYNC_INTERVAL', '300'))
+    TICKET_SYNC_CONCURRENCY = int(os.getenv('TICKET_SYNC_CONCURRENCY', '5'))
+    
+    # Mantis outbox delivery (seconds)
+    OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '10'))
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '12'))
+    OUTBOX_BASE_BACKOFF = float(os.getenv('OUTBOX_BASE_BACKOFF', '5'))
+    OUTBOX_MAX_BACKOFF = float(os.getenv('OUTBOX_MAX_BACKOFF', '1800'))
+    OUTBOX_BREAKER_THRESHOLD = int(os.getenv('OUTBOX_BREAKER_THRESHOLD', '5'))
+    OUTBOX_BREAKER_COOLDOWN = float(os.getenv('OUTBOX_BREAKER_COOLDOWN', '60'))
     
     # Bot Configuration
     COMMAND_PREFIX = '!'
+    TICKETS_PAGE_SIZE = int(os.getenv('TICKETS_PAGE_SIZE', '5'))
     SUPPORT_CHANNEL_ID = int(os.getenv('SUPPORT_CHANNEL_ID', '0'))
     
+    # Per-user message coalescing (seconds)
+    COALESCE_WINDOW = float(os.getenv('COALESCE_WINDOW', '1.5'))
+    COALESCE_MAX_DELAY = float(os.getenv('COALESCE_MAX_DELAY', '6'))
+    
+    # Admission scheduling by priority class (10=immediate ... 50=low); class
+    # limits cap how many of the total slots one class may hold
+    SCHEDULER_CONCURRENCY = int(os.getenv('SCHEDULER_CONCURRENCY', '8'))
+    SCHEDULER_CLASS_LIMITS = {
+        int(priority): int(limit)
+        for priority, limit in (item.split(':') for item in os.getenv('SCHEDULER_CLASS_LIMITS', '30:6,40:4,50:2').split(',') if item)
+    }
+    SCHEDULER_MAX_QUEUE = int(os.getenv('SCHEDULER_MAX_QUEUE', '50'))
+    
+    # Outbound replies: Discord allows about 5 messages per 5 seconds per channel
+    REPLY_RATE_LIMIT = int(os.getenv('REPLY_RATE_LIMIT', '5'))
+    REPLY_RATE_PERIOD = float(os.getenv('REPLY_RATE_PERIOD', '5'))
+    REPLY_GLOBAL_RATE = int(os.getenv('REPLY_GLOBAL_RATE', '50'))
+    REPLY_MAX_EMBEDS = int(os.getenv('REPLY_MAX_EMBEDS', '10'))
+    
     # Database
     DATABASE_PATH = 'bot_database.db'
+    
+    # Conversation history
+    SESSION_HISTORY_RETENTION = int(os.getenv('SESSION_HISTORY_RETENTION', '50'))
+    SESSION_CONTEXT_MESSAGES = int(os.getenv('SESSION_CONTEXT_MESSAGES', '4'))
+    SESSION_CACHE_MAX_ENTRIES = int(os.getenv('SESSION_CACHE_MAX_ENTRIES', '10000'))
+    SESSION_CACHE_MAX_BYTES = int(os.getenv('SESSION_CACHE_MAX_BYTES', '50000000'))
+    SESSION_CACHE_TTL = float(os.getenv('SESSION_CACHE_TTL', '1800'))
+    SESSION_FLUSH_INTERVAL = float(os.getenv('SESSION_FLUSH_INTERVAL', '5'))
+    
+    # Metrics endpoint (port 0 disables it)
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+    METRICS_PORT = int(os.getenv('METRICS_PORT', '9100'))
+    LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', '0.5'))
+    
+    # Database maintenance (seconds; compaction waits for a quiet period)
+    MAINTENANCE_INTERVAL = float(os.getenv('MAINTENANCE_INTERVAL', '3600'))
+    SESSION_IDLE_TTL = float(os.getenv('SESSION_IDLE_TTL', '2592000'))
+    TICKET_ARCHIVE_AGE = float(os.getenv('TICKET_ARCHIVE_AGE', '7776000'))
+    MAINTENANCE_BATCH_SIZE = int(os.getenv('MAINTENANCE_BATCH_SIZE', '500'))
+    MAINTENANCE_QUIET_PERIOD = float(os.getenv('MAINTENANCE_QUIET_PERIOD', '300'))
+    MAINTENANCE_VACUUM_PAGES = int(os.getenv('MAINTENANCE_VACUUM_PAGES', '1000'))
@@ -1,18 +1,69 @@
 import sqlite3
 import json
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+
+from metrics import DB_QUERY_TIME
 
 class DatabaseHandler:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, history_retention: int = 50):
         self.db_path = db_path
+        # Messages kept per user in session_messages; older ones are pruned on append
+        self.history_retention = history_retention
+
+        # One long-lived connection owned by a single worker thread, so every
+        # query is serialized there and never runs on the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite')
+        self._conn: Optional[sqlite3.Connection] = None
+        self._execute(self._connect)
         self.init_database()
-    
+
+    def _connect(self):
+        """Open the shared connection and apply performance pragmas"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256)
+        # Only takes effect on a new database; see enable_incremental_vacuum for existing ones
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=5000')
+        self._conn = conn
+
+    def _execute(self, func, *args):
+        """Run func on the database thread and wait for its result"""
+        return self._executor.submit(self._timed, func, *args).result()
+
+    async def _execute_async(self, func, *args):
+        """Run func on the database thread without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._timed, func, *args))
+
+    @staticmethod
+    def _timed(func, *args):
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            DB_QUERY_TIME.observe(time.perf_counter() - started, operation=func.__name__.lstrip('_'))
+
+    def close(self):
+        """Close the shared connection and stop the database thread"""
+        if self._conn is not None:
+            self._execute(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
+
     def init_database(self):
         """Initialize database tables"""
-        with sqlite3.connect(self.db_path) as conn:
+        self._execute(self._init_database)
+
+    def _init_database(self):
+        with self._conn as conn:
             cursor = conn.cursor()
-            
+
             # User tickets table
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS user_tickets (
@@ -24,7 +75,31 @@ class DatabaseHandler:
                     status TEXT DEFAULT 'open'
                 )
             ''')
-            
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_user_tickets_user_created
+                ON user_tickets (discord_user_id, created_at DESC, id DESC)
+            ''')
+
+            # Lets maintenance find old finished tickets without a table scan
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_user_tickets_status_created
+                ON user_tickets (status, created_at)
+            ''')
+
+            # Finished tickets moved out of user_tickets by the maintenance job
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS user_tickets_archive (
+                    id INTEGER PRIMARY KEY,
+                    discord_user_id TEXT NOT NULL,
+                    mantis_ticket_id TEXT NOT NULL,
+                    ticket_summary TEXT NOT NULL,
+                    created_at TIMESTAMP,
+                    status TEXT,
+                    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
             # User sessions table for conversation context
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS user_sessions (
@@ -33,51 +108,529 @@ class DatabaseHandler:
                     last_interaction TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
-            
-            conn.commit()
-    
-    def create_ticket_record(self, discord_user_id: str, mantis_ticket_id: str, summary: str) -> int:
-        """Create a new ticket record"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+
+            # Append-only conversation messages, one row per message
             cursor.execute('''
-                INSERT INTO user_tickets (discord_user_id, mantis_ticket_id, ticket_summary)
-                VALUES (?, ?, ?)
-            ''', (discord_user_id, mantis_ticket_id, summary))
-            conn.commit()
-            return cursor.lastrowid
-    
-    def get_user_tickets(self, discord_user_id: str) -> list:
-        """Get all tickets for a user"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+                CREATE TABLE IF NOT EXISTS session_messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    discord_user_id TEXT NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
             cursor.execute('''
-                SELECT mantis_ticket_id, ticket_summary, created_at, status
-                FROM user_tickets
-                WHERE discord_user_id = ?
-                ORDER BY created_at DESC
-            ''', (discord_user_id,))
-            return cursor.fetchall()
-    
-    def update_session(self, discord_user_id: str, conversation_history: dict):
-        """Update user conversation session"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+                CREATE INDEX IF NOT EXISTS idx_user_sessions_last_interaction
+                ON user_sessions (last_interaction)
+            ''')
             cursor.execute('''
-                INSERT OR REPLACE INTO user_sessions (discord_user_id, conversation_history, last_interaction)
-                VALUES (?, ?, CURRENT_TIMESTAMP)
-            ''', (discord_user_id, json.dumps(conversation_history)))
-            conn.commit()
-    
-    def get_session(self, discord_user_id: str) -> Optional[dict]:
-        """Get user conversation session"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+                CREATE INDEX IF NOT EXISTS idx_session_messages_user
+                ON session_messages (discord_user_id, id)
+            ''')
+
+            # Persistent tier of the LLM response cache
             cursor.execute('''
-                SELECT conversation_history FROM user_sessions
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    latency REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+
+            # Durable queue of Mantis writes awaiting delivery
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS mantis_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    idempotency_key TEXT NOT NULL UNIQUE,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL DEFAULT 0,
+                    result TEXT,
+                    last_error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_mantis_outbox_due
+                ON mantis_outbox (status, next_attempt_at)
+            ''')
+
+            self._migrate_session_blobs(cursor)
+
+    def _migrate_session_blobs(self, cursor: sqlite3.Cursor):
+        """Move legacy JSON conversation blobs from user_sessions into session_messages"""
+        rows = cursor.execute('''
+            SELECT discord_user_id, conversation_history FROM user_sessions
+            WHERE conversation_history IS NOT NULL
+        ''').fetchall()
+
+        for discord_user_id, blob in rows:
+            try:
+                messages = json.loads(blob).get('messages', [])
+            except (json.JSONDecodeError, AttributeError):
+                messages = []
+            cursor.executemany('''
+                INSERT INTO session_messages (discord_user_id, role, content)
+                VALUES (?, ?, ?)
+            ''', [(discord_user_id, msg['role'], msg['content'])
+                  for msg in messages[-self.history_retention:]])
+            cursor.execute('''
+                UPDATE user_sessions SET conversation_history = NULL
                 WHERE discord_user_id = ?
             ''', (discord_user_id,))
-            result = cursor.fetchone()
-            if result:
-                return json.loads(result[0])
+
+        if rows:
+            print(f"Migrated {len(rows)} conversation sessions to session_messages")
+
+    def create_ticket_record(self, discord_user_id: str, mantis_ticket_id: str, summary: str) -> int:
+        """Create a new ticket record"""
+        return self._execute(self._create_ticket_record, discord_user_id, mantis_ticket_id, summary)
+
+    async def create_ticket_record_async(self, discord_user_id: str, mantis_ticket_id: str, summary: str) -> int:
+        """Async variant of create_ticket_record"""
+        return await self._execute_async(self._create_ticket_record, discord_user_id, mantis_ticket_id, summary)
+
+    def _create_ticket_record(self, discord_user_id: str, mantis_ticket_id: str, summary: str) -> int:
+        with self._conn as conn:
+            cursor = conn.execute('''
+                INSERT INTO user_tickets (discord_user_id, mantis_ticket_id, ticket_summary)
+                VALUES (?, ?, ?)
+            ''', (discord_user_id, mantis_ticket_id, summary))
+            return cursor.lastrowid
+
+    def get_user_tickets(self, discord_user_id: str, limit: int = 5, after: Optional[tuple] = None,
+                         status: Optional[str] = None) -> list:
+        """Get a page of a user's tickets, newest first
+
+        Rows are (mantis_ticket_id, ticket_summary, created_at, status, id).
+        Pass the (created_at, id) of the previous page's last row as `after`
+        to continue from it.
+        """
+        return self._execute(self._get_user_tickets, discord_user_id, limit, after, status)
+
+    async def get_user_tickets_async(self, discord_user_id: str, limit: int = 5, after: Optional[tuple] = None,
+                                     status: Optional[str] = None) -> list:
+        """Async variant of get_user_tickets"""
+        return await self._execute_async(self._get_user_tickets, discord_user_id, limit, after, status)
+
+    def _get_user_tickets(self, discord_user_id: str, limit: int, after: Optional[tuple], status: Optional[str]) -> list:
+        query = '''
+            SELECT mantis_ticket_id, ticket_summary, created_at, status, id
+            FROM user_tickets
+            WHERE discord_user_id = ?
+        '''
+        params = [discord_user_id]
+        if status is not None:
+            query += ' AND status = ?'
+            params.append(status)
+        if after is not None:
+            query += ' AND (created_at < ? OR (created_at = ? AND id < ?))'
+            params.extend([after[0], after[0], after[1]])
+        query += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+        params.append(limit)
+        return self._conn.execute(query, params).fetchall()
+
+    async def get_ticket_page_start_async(self, discord_user_id: str, page: int, page_size: int,
+                                          status: Optional[str] = None) -> Optional[tuple]:
+        """Keyset cursor (created_at, id) to pass as `after` to reach the given 1-based page"""
+        return await self._execute_async(self._get_ticket_page_start, discord_user_id, page, page_size, status)
+
+    def _get_ticket_page_start(self, discord_user_id: str, page: int, page_size: int,
+                               status: Optional[str]) -> Optional[tuple]:
+        if page <= 1:
             return None
+        query = 'SELECT created_at, id FROM user_tickets WHERE discord_user_id = ?'
+        params = [discord_user_id]
+        if status is not None:
+            query += ' AND status = ?'
+            params.append(status)
+        # Only used to jump straight to a page; walks the index, not the table
+        query += ' ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET ?'
+        params.append((page - 1) * page_size - 1)
+        return self._conn.execute(query, params).fetchone()
+
+    def append_session_messages(self, discord_user_id: str, messages: List[Dict[str, str]]):
+        """Append messages to a user's conversation and trim it to the retention window"""
+        self._execute(self._append_session_messages, discord_user_id, messages)
+
+    async def append_session_messages_async(self, discord_user_id: str, messages: List[Dict[str, str]]):
+        """Async variant of append_session_messages"""
+        await self._execute_async(self._append_session_messages, discord_user_id, messages)
+
+    def _append_session_messages(self, discord_user_id: str, messages: List[Dict[str, str]]):
+        self._append_session_batch({discord_user_id: messages})
+
+    def append_session_batch(self, batch: Dict[str, List[Dict[str, str]]]):
+        """Append messages for several users in a single transaction"""
+        self._execute(self._append_session_batch, batch)
+
+    async def append_session_batch_async(self, batch: Dict[str, List[Dict[str, str]]]):
+        """Async variant of append_session_batch"""
+        await self._execute_async(self._append_session_batch, batch)
+
+    def _append_session_batch(self, batch: Dict[str, List[Dict[str, str]]]):
+        with self._conn as conn:
+            for discord_user_id, messages in batch.items():
+                conn.executemany('''
+                    INSERT INTO session_messages (discord_user_id, role, content)
+                    VALUES (?, ?, ?)
+                ''', [(discord_user_id, msg['role'], msg['content']) for msg in messages])
+                conn.execute('''
+                    INSERT INTO user_sessions (discord_user_id, last_interaction)
+                    VALUES (?, CURRENT_TIMESTAMP)
+                    ON CONFLICT(discord_user_id) DO UPDATE SET last_interaction = CURRENT_TIMESTAMP
+                ''', (discord_user_id,))
+                # Drop everything older than the newest history_retention messages
+                conn.execute('''
+                    DELETE FROM session_messages
+                    WHERE discord_user_id = ? AND id <= (
+                        SELECT id FROM session_messages
+                        WHERE discord_user_id = ?
+                        ORDER BY id DESC LIMIT 1 OFFSET ?
+                    )
+                ''', (discord_user_id, discord_user_id, self.history_retention))
+
+    def get_recent_messages(self, discord_user_id: str, limit: int) -> List[Dict[str, str]]:
+        """Get the last `limit` messages of a user's conversation, oldest first"""
+        return self._execute(self._get_recent_messages, discord_user_id, limit)
+
+    async def get_recent_messages_async(self, discord_user_id: str, limit: int) -> List[Dict[str, str]]:
+        """Async variant of get_recent_messages"""
+        return await self._execute_async(self._get_recent_messages, discord_user_id, limit)
+
+    def _get_recent_messages(self, discord_user_id: str, limit: int) -> List[Dict[str, str]]:
+        cursor = self._conn.execute('''
+            SELECT role, content FROM session_messages
+            WHERE discord_user_id = ?
+            ORDER BY id DESC LIMIT ?
+        ''', (discord_user_id, limit))
+        return [{"role": role, "content": content} for role, content in reversed(cursor.fetchall())]
+
+    def get_cached_response(self, cache_key: str) -> Optional[tuple]:
+        """Get a persisted LLM response as (response, latency, seconds_left)"""
+        return self._execute(self._get_cached_response, cache_key)
+
+    async def get_cached_response_async(self, cache_key: str) -> Optional[tuple]:
+        """Async variant of get_cached_response"""
+        return await self._execute_async(self._get_cached_response, cache_key)
+
+    def _get_cached_response(self, cache_key: str) -> Optional[tuple]:
+        now = time.time()
+        cursor = self._conn.execute('''
+            SELECT response, latency, expires_at FROM response_cache
+            WHERE cache_key = ? AND expires_at > ?
+        ''', (cache_key, now))
+        result = cursor.fetchone()
+        if result:
+            return json.loads(result[0]), result[1], result[2] - now
+        return None
+
+    def put_cached_response(self, cache_key: str, response: Dict[str, Any], latency: float, ttl: float):
+        """Persist an LLM response for ttl seconds"""
+        self._execute(self._put_cached_response, cache_key, response, latency, ttl)
+
+    async def put_cached_response_async(self, cache_key: str, response: Dict[str, Any], latency: float, ttl: float):
+        """Async variant of put_cached_response"""
+        await self._execute_async(self._put_cached_response, cache_key, response, latency, ttl)
+
+    def _put_cached_response(self, cache_key: str, response: Dict[str, Any], latency: float, ttl: float):
+        with self._conn as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO response_cache (cache_key, response, latency, expires_at)
+                VALUES (?, ?, ?, ?)
+            ''', (cache_key, json.dumps(response), latency, time.time() + ttl))
+
+    def enqueue_ticket(self, discord_user_id: str, idempotency_key: str, payload: Dict[str, Any], summary: str) -> str:
+        """Queue a ticket creation and record it for the user; returns its provisional reference"""
+        return self._execute(self._enqueue_ticket, discord_user_id, idempotency_key, payload, summary)
+
+    async def enqueue_ticket_async(self, discord_user_id: str, idempotency_key: str, payload: Dict[str, Any], summary: str) -> str:
+        """Async variant of enqueue_ticket"""
+        return await self._execute_async(self._enqueue_ticket, discord_user_id, idempotency_key, payload, summary)
+
+    def _enqueue_ticket(self, discord_user_id: str, idempotency_key: str, payload: Dict[str, Any], summary: str) -> str:
+        with self._conn as conn:
+            outbox_id, created = self._insert_outbox(conn, 'create_ticket', idempotency_key, payload)
+            reference = f"P-{outbox_id}"
+            if created:
+                conn.execute('''
+                    INSERT INTO user_tickets (discord_user_id, mantis_ticket_id, ticket_summary, status)
+                    VALUES (?, ?, ?, 'pending')
+                ''', (discord_user_id, reference, summary))
+            return reference
+
+    def enqueue_outbox(self, kind: str, idempotency_key: str, payload: Dict[str, Any]) -> int:
+        """Queue a Mantis write; a repeated idempotency key returns the existing entry"""
+        return self._execute(self._enqueue_outbox, kind, idempotency_key, payload)
+
+    async def enqueue_outbox_async(self, kind: str, idempotency_key: str, payload: Dict[str, Any]) -> int:
+        """Async variant of enqueue_outbox"""
+        return await self._execute_async(self._enqueue_outbox, kind, idempotency_key, payload)
+
+    def _enqueue_outbox(self, kind: str, idempotency_key: str, payload: Dict[str, Any]) -> int:
+        with self._conn as conn:
+            return self._insert_outbox(conn, kind, idempotency_key, payload)[0]
+
+    @staticmethod
+    def _insert_outbox(conn: sqlite3.Connection, kind: str, idempotency_key: str, payload: Dict[str, Any]) -> tuple:
+        cursor = conn.execute('''
+            INSERT OR IGNORE INTO mantis_outbox (idempotency_key, kind, payload)
+            VALUES (?, ?, ?)
+        ''', (idempotency_key, kind, json.dumps(payload)))
+        if cursor.rowcount:
+            return cursor.lastrowid, True
+        row = conn.execute('''
+            SELECT id FROM mantis_outbox WHERE idempotency_key = ?
+        ''', (idempotency_key,)).fetchone()
+        return row[0], False
+
+    async def get_due_outbox_async(self, limit: int) -> list:
+        """Get pending outbox entries whose next attempt is due, as (id, kind, payload, attempts)"""
+        return await self._execute_async(self._get_due_outbox, limit)
+
+    def _get_due_outbox(self, limit: int) -> list:
+        cursor = self._conn.execute('''
+            SELECT id, kind, payload, attempts FROM mantis_outbox
+            WHERE status = 'pending' AND next_attempt_at <= ?
+            ORDER BY id LIMIT ?
+        ''', (time.time(), limit))
+        return [(row[0], row[1], json.loads(row[2]), row[3]) for row in cursor.fetchall()]
+
+    async def mark_outbox_delivered_async(self, outbox_id: int, result: str, note: Optional[str] = None):
+        """Record a successful delivery and swap the provisional ticket reference for the real id
+
+        A note, if given, is queued for the resulting ticket in the same transaction.
+        """
+        await self._execute_async(self._mark_outbox_delivered, outbox_id, result, note)
+
+    def _mark_outbox_delivered(self, outbox_id: int, result: str, note: Optional[str] = None):
+        with self._conn as conn:
+            conn.execute('''
+                UPDATE mantis_outbox SET status = 'delivered', result = ?, attempts = attempts + 1, last_error = NULL
+                WHERE id = ?
+            ''', (result, outbox_id))
+            if self._outbox_kind(conn, outbox_id) == 'create_ticket':
+                conn.execute('''
+                    UPDATE user_tickets SET mantis_ticket_id = ?, status = 'open'
+                    WHERE mantis_ticket_id = ?
+                ''', (result, f"P-{outbox_id}"))
+            if note is not None:
+                self._insert_outbox(conn, 'add_note', f"outbox-{outbox_id}-note", {'ticket_ref': result, 'note': note})
+
+    async def defer_outbox_async(self, outbox_id: int, next_attempt_at: float):
+        """Push back an entry that isn't ready to send, without counting an attempt"""
+        await self._execute_async(self._defer_outbox, outbox_id, next_attempt_at)
+
+    def _defer_outbox(self, outbox_id: int, next_attempt_at: float):
+        with self._conn as conn:
+            conn.execute('''
+                UPDATE mantis_outbox SET next_attempt_at = ? WHERE id = ?
+            ''', (next_attempt_at, outbox_id))
+
+    async def mark_outbox_failed_async(self, outbox_id: int, error: str, next_attempt_at: Optional[float]):
+        """Record a failed attempt; next_attempt_at None gives up on the entry"""
+        await self._execute_async(self._mark_outbox_failed, outbox_id, error, next_attempt_at)
+
+    def _mark_outbox_failed(self, outbox_id: int, error: str, next_attempt_at: Optional[float]):
+        with self._conn as conn:
+            if next_attempt_at is None:
+                conn.execute('''
+                    UPDATE mantis_outbox SET status = 'failed', attempts = attempts + 1, last_error = ?
+                    WHERE id = ?
+                ''', (error, outbox_id))
+                if self._outbox_kind(conn, outbox_id) == 'create_ticket':
+                    conn.execute('''
+                        UPDATE user_tickets SET status = 'failed' WHERE mantis_ticket_id = ?
+                    ''', (f"P-{outbox_id}",))
+            else:
+                conn.execute('''
+                    UPDATE mantis_outbox SET attempts = attempts + 1, last_error = ?, next_attempt_at = ?
+                    WHERE id = ?
+                ''', (error, next_attempt_at, outbox_id))
+
+    @staticmethod
+    def _outbox_kind(conn: sqlite3.Connection, outbox_id: int) -> Optional[str]:
+        row = conn.execute('SELECT kind FROM mantis_outbox WHERE id = ?', (outbox_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_outbox_entry(self, outbox_id: int) -> Optional[tuple]:
+        """Get an outbox entry as (status, result, attempts, last_error)"""
+        return self._execute(self._get_outbox_entry, outbox_id)
+
+    async def get_outbox_entry_async(self, outbox_id: int) -> Optional[tuple]:
+        """Async variant of get_outbox_entry"""
+        return await self._execute_async(self._get_outbox_entry, outbox_id)
+
+    def _get_outbox_entry(self, outbox_id: int) -> Optional[tuple]:
+        return self._conn.execute('''
+            SELECT status, result, attempts, last_error FROM mantis_outbox WHERE id = ?
+        ''', (outbox_id,)).fetchone()
+
+    async def get_open_ticket_ids_async(self) -> List[str]:
+        """Get the distinct Mantis ids of delivered tickets that aren't resolved or closed"""
+        return await self._execute_async(self._get_open_ticket_ids)
+
+    def _get_open_ticket_ids(self) -> List[str]:
+        cursor = self._conn.execute('''
+            SELECT DISTINCT mantis_ticket_id FROM user_tickets
+            WHERE status NOT IN ('resolved', 'closed', 'pending', 'failed')
+        ''')
+        return [row[0] for row in cursor.fetchall()]
+
+    async def update_ticket_statuses_async(self, statuses: Dict[str, str]):
+        """Write refreshed statuses, keyed by Mantis ticket id, in one transaction"""
+        await self._execute_async(self._update_ticket_statuses, statuses)
+
+    def _update_ticket_statuses(self, statuses: Dict[str, str]):
+        with self._conn as conn:
+            conn.executemany('''
+                UPDATE user_tickets SET status = ? WHERE mantis_ticket_id = ?
+            ''', [(status, ticket_id) for ticket_id, status in statuses.items()])
+
+    async def expire_sessions_async(self, idle_seconds: float, batch_size: int) -> int:
+        """Delete up to batch_size sessions idle longer than idle_seconds, with their messages"""
+        return await self._execute_async(self._expire_sessions, idle_seconds, batch_size)
+
+    def _expire_sessions(self, idle_seconds: float, batch_size: int) -> int:
+        with self._conn as conn:
+            user_ids = [(row[0],) for row in conn.execute('''
+                SELECT discord_user_id FROM user_sessions
+                WHERE last_interaction < datetime('now', ?)
+                LIMIT ?
+            ''', (f"-{int(idle_seconds)} seconds", batch_size))]
+            conn.executemany('DELETE FROM session_messages WHERE discord_user_id = ?', user_ids)
+            conn.executemany('DELETE FROM user_sessions WHERE discord_user_id = ?', user_ids)
+            return len(user_ids)
+
+    async def archive_tickets_async(self, age_seconds: float, batch_size: int) -> int:
+        """Move up to batch_size finished tickets older than age_seconds into user_tickets_archive"""
+        return await self._execute_async(self._archive_tickets, age_seconds, batch_size)
+
+    def _archive_tickets(self, age_seconds: float, batch_size: int) -> int:
+        with self._conn as conn:
+            ids = [(row[0],) for row in conn.execute('''
+                SELECT id FROM user_tickets
+                WHERE status IN ('resolved', 'closed', 'failed') AND created_at < datetime('now', ?)
+                LIMIT ?
+            ''', (f"-{int(age_seconds)} seconds", batch_size))]
+            conn.executemany('''
+                INSERT OR REPLACE INTO user_tickets_archive
+                    (id, discord_user_id, mantis_ticket_id, ticket_summary, created_at, status)
+                SELECT id, discord_user_id, mantis_ticket_id, ticket_summary, created_at, status
+                FROM user_tickets WHERE id = ?
+            ''', ids)
+            conn.executemany('DELETE FROM user_tickets WHERE id = ?', ids)
+            return len(ids)
+
+    async def purge_expired_async(self, outbox_age_seconds: float, batch_size: int) -> int:
+        """Delete up to batch_size expired response cache rows and old finished outbox entries"""
+        return await self._execute_async(self._purge_expired, outbox_age_seconds, batch_size)
+
+    def _purge_expired(self, outbox_age_seconds: float, batch_size: int) -> int:
+        with self._conn as conn:
+            purged = conn.execute('''
+                DELETE FROM response_cache WHERE cache_key IN (
+                    SELECT cache_key FROM response_cache WHERE expires_at < ? LIMIT ?
+                )
+            ''', (time.time(), batch_size)).rowcount
+            purged += conn.execute('''
+                DELETE FROM mantis_outbox WHERE id IN (
+                    SELECT id FROM mantis_outbox
+                    WHERE status IN ('delivered', 'failed') AND created_at < datetime('now', ?)
+                    LIMIT ?
+                )
+            ''', (f"-{int(outbox_age_seconds)} seconds", batch_size)).rowcount
+            return purged
+
+    async def incremental_vacuum_async(self, pages: int) -> int:
+        """Return up to `pages` free pages to the filesystem; returns bytes reclaimed"""
+        return await self._execute_async(self._incremental_vacuum, pages)
+
+    def _incremental_vacuum(self, pages: int) -> int:
+        if not self._incremental_vacuum_enabled():
+            return 0
+        before = self._file_bytes()
+        # execute() steps the pragma once, which frees a single page; executescript runs it to completion
+        self._conn.executescript(f'PRAGMA incremental_vacuum({int(pages)})')
+        return before - self._file_bytes()
+
+    async def incremental_vacuum_enabled_async(self) -> bool:
+        """Whether free pages can be returned a few at a time"""
+        return await self._execute_async(self._incremental_vacuum_enabled)
+
+    def _incremental_vacuum_enabled(self) -> bool:
+        return self._conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+
+    def enable_incremental_vacuum(self):
+        """Convert a database created before incremental vacuuming to that mode
+
+        Needs one full VACUUM, which rewrites the whole file and holds the
+        database thread until it is done, so run it while the bot is stopped.
+        """
+        self._execute(self._enable_incremental_vacuum)
+
+    def _enable_incremental_vacuum(self):
+        if not self._incremental_vacuum_enabled():
+            self._conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            self._conn.execute('VACUUM')
+
+    async def free_pages_async(self) -> int:
+        """Number of unused pages waiting to be vacuumed"""
+        return await self._execute_async(self._free_pages)
+
+    def _free_pages(self) -> int:
+        return self._conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+    async def optimize_async(self):
+        """Refresh query planner statistics for tables that need it"""
+        await self._execute_async(self._optimize)
+
+    def _optimize(self):
+        # Bounded ANALYZE: samples each index instead of reading it in full
+        self._conn.execute('PRAGMA analysis_limit=400')
+        self._conn.execute('PRAGMA optimize')
+
+    def get_storage_stats(self) -> Dict[str, Any]:
+        """Database file size and free space in bytes, from page counts alone"""
+        return self._execute(self._get_storage_stats)
+
+    async def get_storage_stats_async(self) -> Dict[str, Any]:
+        """Database file size and free space in bytes, from page counts alone"""
+        return await self._execute_async(self._get_storage_stats)
+
+    def _get_storage_stats(self) -> Dict[str, Any]:
+        page_size = self._conn.execute('PRAGMA page_size').fetchone()[0]
+        return {
+            'file_bytes': self._file_bytes(),
+            'free_bytes': self._free_pages() * page_size,
+        }
+
+    async def get_table_sizes_async(self) -> Dict[str, int]:
+        """Bytes per table and index
+
+        This reads every page, so it runs on its own read-only connection in
+        a worker thread; with WAL it doesn't hold up the database thread.
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, self._read_table_sizes)
+
+    def _read_table_sizes(self) -> Dict[str, int]:
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        try:
+            try:
+                return {name: size for name, size in conn.execute('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name')}
+            except sqlite3.OperationalError:
+                # SQLite built without dbstat; fall back to row counts
+                tables = {}
+                for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+                    tables[f"{name}_rows"] = conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+                return tables
+        finally:
+            conn.close()
+
+    def _file_bytes(self) -> int:
+        page_count = self._conn.execute('PRAGMA page_count').fetchone()[0]
+        page_size = self._conn.execute('PRAGMA page_size').fetchone()[0]
+        return page_count * page_size
@@ -0,0 +1,277 @@
+"""Local HTTP stand-in for a MantisConnect SOAP endpoint
+
+Serves a cut-down MantisConnect WSDL (with its types in a separately
+imported XSD, like the real one) and answers the operations the bot uses
+with real SOAP envelopes, so benchmarks go through zeep's HTTP connection
+pool, timeouts and XML serialization rather than the in-process
+FakeMantisService from replay.py. Every request waits for the configured
+latency before it replies (after applying the change, so a client that
+times out has still created the issue); document downloads have their own
+latency, to stand in for a slow Mantis serving the WSDL.
+
+    server = FakeMantisServer(latency=0.05)
+    server.start()
+    client = MantisHubClient(soap_url=server.wsdl_url)
+    ...
+    server.stop()
+"""
+
+import itertools
+import threading
+import time
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from xml.sax.saxutils import escape
+
+NAMESPACE = 'http://futureware.biz/mantisconnect'
+SOAP_ENV = 'http://schemas.xmlsoap.org/soap/envelope/'
+CATEGORIES = ['General', 'Hardware', 'Maintenance', 'Software']
+
+SCHEMA = f'''<?xml version="1.0" encoding="UTF-8"?>
+<xsd:schema xmlns:xsd="http://www.w3.org/2001/XMLSchema" xmlns:tns="{NAMESPACE}"
+            targetNamespace="{NAMESPACE}">
+  <xsd:complexType name="ObjectRef">
+    <xsd:sequence>
+      <xsd:element name="id" type="xsd:integer" minOccurs="0"/>
+      <xsd:element name="name" type="xsd:string" minOccurs="0"/>
+    </xsd:sequence>
+  </xsd:complexType>
+  <xsd:complexType name="AccountData">
+    <xsd:sequence>
+      <xsd:element name="id" type="xsd:integer" minOccurs="0"/>
+      <xsd:element name="name" type="xsd:string" minOccurs="0"/>
+    </xsd:sequence>
+  </xsd:complexType>
+  <xsd:complexType name="IssueData">
+    <xsd:sequence>
+      <xsd:element name="id" type="xsd:integer" minOccurs="0"/>
+      <xsd:element name="project" type="tns:ObjectRef" minOccurs="0"/>
+      <xsd:element name="category" type="xsd:string" minOccurs="0"/>
+      <xsd:element name="priority" type="tns:ObjectRef" minOccurs="0"/>
+      <xsd:element name="severity" type="tns:ObjectRef" minOccurs="0"/>
+      <xsd:element name="status" type="tns:ObjectRef" minOccurs="0"/>
+      <xsd:element name="reproducibility" type="tns:ObjectRef" minOccurs="0"/>
+      <xsd:element name="view_state" type="tns:ObjectRef" minOccurs="0"/>
+      <xsd:element name="handler" type="tns:AccountData" minOccurs="0"/>
+      <xsd:element name="summary" type="xsd:string" minOccurs="0"/>
+      <xsd:element name="description" type="xsd:string" minOccurs="0"/>
+    </xsd:sequence>
+  </xsd:complexType>
+  <xsd:complexType name="IssueNoteData">
+    <xsd:sequence>
+      <xsd:element name="id" type="xsd:integer" minOccurs="0"/>
+      <xsd:element name="text" type="xsd:string" minOccurs="0"/>
+    </xsd:sequence>
+  </xsd:complexType>
+  <xsd:complexType name="StringArray">
+    <xsd:sequence>
+      <xsd:element name="item" type="xsd:string" minOccurs="0" maxOccurs="unbounded"/>
+    </xsd:sequence>
+  </xsd:complexType>
+  <xsd:complexType name="IntegerArray">
+    <xsd:sequence>
+      <xsd:element name="item" type="xsd:integer" minOccurs="0" maxOccurs="unbounded"/>
+    </xsd:sequence>
+  </xsd:complexType>
+  <xsd:complexType name="FilterSearchData">
+    <xsd:sequence>
+      <xsd:element name="project_id" type="xsd:integer" minOccurs="0" maxOccurs="unbounded"/>
+      <xsd:element name="search" type="xsd:string" minOccurs="0"/>
+    </xsd:sequence>
+  </xsd:complexType>
+</xsd:schema>
+'''
+
+# (operation, [(part, type)], response type)
+OPERATIONS = [
+    ('mc_issue_add', [('issue', 'tns:IssueData')], 'xsd:integer'),
+    ('mc_issue_get', [('issue_id', 'xsd:integer')], 'tns:IssueData'),
+    ('mc_issue_note_add', [('issue_id', 'xsd:integer'), ('note', 'tns:IssueNoteData')], 'xsd:integer'),
+    ('mc_project_get_categories', [('project_id', 'xsd:integer')], 'tns:StringArray'),
+    ('mc_filter_search_issue_ids', [('filter', 'tns:FilterSearchData'), ('page_number', 'xsd:integer'),
+                                    ('per_page', 'xsd:integer')], 'tns:IntegerArray'),
+]
+
+def _wsdl(base_url: str) -> str:
+    messages, port_operations, binding_operations = [], [], []
+    for name, parts, response_type in OPERATIONS:
+        request_parts = ''.join(f'<part name="{part}" type="{part_type}"/>' for part, part_type in parts)
+        messages.append(f'''
+  <message name="{name}Request">
+    <part name="username" type="xsd:string"/><part name="password" type="xsd:string"/>{request_parts}
+  </message>
+  <message name="{name}Response"><part name="return" type="{response_type}"/></message>''')
+        port_operations.append(f'''
+    <operation name="{name}">
+      <input message="tns:{name}Request"/><output message="tns:{name}Response"/>
+    </operation>''')
+        binding_operations.append(f'''
+    <operation name="{name}">
+      <soap:operation soapAction="{NAMESPACE}/{name}" style="rpc"/>
+      <input><soap:body use="literal" namespace="{NAMESPACE}"/></input>
+      <output><soap:body use="literal" namespace="{NAMESPACE}"/></output>
+    </operation>''')
+    return f'''<?xml version="1.0" encoding="UTF-8"?>
+<definitions xmlns="http://schemas.xmlsoap.org/wsdl/" xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/"
+             xmlns:xsd="http://www.w3.org/2001/XMLSchema" xmlns:tns="{NAMESPACE}"
+             targetNamespace="{NAMESPACE}" name="MantisConnect">
+  <types>
+    <xsd:schema targetNamespace="{NAMESPACE}-types">
+      <xsd:import namespace="{NAMESPACE}" schemaLocation="{base_url}/mantisconnect.xsd"/>
+    </xsd:schema>
+  </types>{''.join(messages)}
+  <portType name="MantisConnectPortType">{''.join(port_operations)}
+  </portType>
+  <binding name="MantisConnectBinding" type="tns:MantisConnectPortType">
+    <soap:binding style="rpc" transport="http://schemas.xmlsoap.org/soap/http"/>{''.join(binding_operations)}
+  </binding>
+  <service name="MantisConnect">
+    <port name="MantisConnectPort" binding="tns:MantisConnectBinding">
+      <soap:address location="{base_url}/api/soap/mantisconnect.php"/>
+    </port>
+  </service>
+</definitions>
+'''
+
+def _local(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+def _fields(element: ET.Element) -> Dict[str, ET.Element]:
+    return {_local(child.tag): child for child in element}
+
+class FakeMantisServer:
+    """Threaded HTTP server answering MantisConnect SOAP requests from memory"""
+
+    def __init__(self, latency: float = 0.0, document_latency: float = 0.0):
+        self.latency = latency
+        self.document_latency = document_latency
+        self._issues: Dict[int, Dict[str, str]] = {}
+        self.notes: Dict[int, List[str]] = {}
+        self._ids = itertools.count(1000)
+        self._lock = threading.Lock()
+        self.stats = {'documents': 0, 'calls': 0, 'connections': 0}
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+        self.wsdl_url = f"{self.base_url}/api/soap/mantisconnect.php?wsdl"
+        self._documents = {'/api/soap/mantisconnect.php?wsdl': _wsdl(self.base_url), '/mantisconnect.xsd': SCHEMA}
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='fake-mantis', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so the client's connection pool is what decides how many sockets exist
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes; don't let Nagle hold the body back
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.stats['connections'] += 1
+
+            def do_GET(self):
+                document = server._documents.get(self.path)
+                if document is None:
+                    self._send(404, 'text/plain', 'Not found')
+                    return
+                time.sleep(server.document_latency)
+                with server._lock:
+                    server.stats['documents'] += 1
+                self._send(200, 'text/xml', document)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                # Applied before the delay, so a client that times out has still changed Mantis
+                status, envelope = server._dispatch(body)
+                time.sleep(server.latency)
+                self._send(status, 'text/xml; charset=utf-8', envelope)
+
+            def _send(self, status: int, content_type: str, text: str):
+                data = text.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client timed out and hung up
+                    self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _dispatch(self, body: bytes):
+        with self._lock:
+            self.stats['calls'] += 1
+        request = ET.fromstring(body)
+        call = next(iter(request.find(f'{{{SOAP_ENV}}}Body')))
+        operation = _local(call.tag)
+        args = _fields(call)
+        handler = getattr(self, f"_{operation}", None)
+        if handler is None:
+            return 500, self._fault(f"Unknown operation {operation}")
+        return 200, self._envelope(operation, handler(args))
+
+    def _mc_issue_add(self, args) -> str:
+        issue = _fields(args['issue'])
+        with self._lock:
+            issue_id = next(self._ids)
+            self._issues[issue_id] = {'summary': issue['summary'].text or '',
+                                      'description': issue['description'].text or ''}
+        return str(issue_id)
+
+    def _mc_issue_get(self, args) -> str:
+        issue_id = int(args['issue_id'].text)
+        with self._lock:
+            issue = self._issues.get(issue_id)
+        if issue is None:
+            return ''
+        return (f"<id>{issue_id}</id><priority><id>30</id><name>normal</name></priority>"
+                f"<status><id>10</id><name>new</name></status>"
+                f"<summary>{escape(issue['summary'])}</summary><description>{escape(issue['description'])}</description>")
+
+    def _mc_issue_note_add(self, args) -> str:
+        text = _fields(args['note'])['text'].text or ''
+        with self._lock:
+            self.notes.setdefault(int(args['issue_id'].text), []).append(text)
+            return str(next(self._ids))
+
+    def _mc_project_get_categories(self, args) -> List[str]:
+        return CATEGORIES
+
+    def _mc_filter_search_issue_ids(self, args) -> List[str]:
+        words = (_fields(args['filter'])['search'].text or '').lower().split()
+        with self._lock:
+            return [str(issue_id) for issue_id, issue in self._issues.items()
+                    if all(word in f"{issue['summary']} {issue['description']}".lower() for word in words)]
+
+    def _envelope(self, operation: str, result) -> str:
+        if isinstance(result, list):
+            value = '<return>' + ''.join(f"<item>{escape(item)}</item>" for item in result) + '</return>'
+        else:
+            value = f"<return>{result}</return>"
+        return (f'<?xml version="1.0" encoding="UTF-8"?>'
+                f'<SOAP-ENV:Envelope xmlns:SOAP-ENV="{SOAP_ENV}" xmlns:ns1="{NAMESPACE}"><SOAP-ENV:Body>'
+                f'<ns1:{operation}Response>{value}</ns1:{operation}Response>'
+                f'</SOAP-ENV:Body></SOAP-ENV:Envelope>')
+
+    def _fault(self, message: str) -> str:
+        return (f'<?xml version="1.0" encoding="UTF-8"?>'
+                f'<SOAP-ENV:Envelope xmlns:SOAP-ENV="{SOAP_ENV}"><SOAP-ENV:Body><SOAP-ENV:Fault>'
+                f'<faultcode>SOAP-ENV:Server</faultcode><faultstring>{escape(message)}</faultstring>'
+                f'</SOAP-ENV:Fault></SOAP-ENV:Body></SOAP-ENV:Envelope>')
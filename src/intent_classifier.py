@@ -0,0 +1,162 @@
+import re
+from typing import Dict, Any, Optional, Tuple
+
+# Keyword rules per intent as (regex, weight). Longer phrases come first so the
+# combined pattern prefers them over the single words they contain.
+INTENT_PATTERNS = {
+    'drain': [
+        (r"(?:won'?t|will not|doesn'?t|does not|not|isn'?t) drain(?:ing)?", 0.9),
+        (r"standing water|water (?:left|sitting|stays) in", 0.6),
+        (r"drain(?:ing|s)?", 0.6),
+    ],
+    'detergent': [
+        (r"not dispens(?:ing|e)|(?:detergent|soap) (?:left|stays|remains|stuck)", 0.9),
+        (r"detergent|dispenser|softener drawer", 0.6),
+        (r"soap", 0.5),
+    ],
+    'startup': [
+        (r"won'?t (?:start|turn on|power on)|not (?:starting|turning on)|doesn'?t (?:start|turn on)|no power", 0.9),
+        (r"dead", 0.5),
+    ],
+    'noise': [
+        (r"loud noise|noise (?:on|during) (?:the )?spin|(?:banging|grinding|squeaking|rattling) (?:noise|sound)", 0.9),
+        (r"noise|noisy|loud|banging|grinding|squeaking|rattling", 0.5),
+    ],
+}
+
+# Signals that the user has already tried the basics or wants a human, which
+# the canned answers can't handle well
+ESCALATION_PATTERN = re.compile(
+    r"\b(?:still|already|tried|again|ticket|technician|engineer|refund|warranty)\b"
+)
+ESCALATION_PENALTY = 0.4
+
+# Safety hazards that make a message immediate (priority 10) whatever else it says
+URGENT_PATTERN = re.compile(
+    r"\b(?:leak(?:s|ing|ed)?|flood(?:s|ing|ed)?|spark(?:s|ing|ed)?|smok(?:e|es|ing|y)|burn(?:ing|t)|"
+    r"fire|flames?|shock(?:s|ed)?|electrocut\w*|melt(?:ing|ed)?)\b"
+)
+# Reports of an earlier fix attempt or of the problem clearing up, which need
+# the LLM to read the whole message rather than a canned first-steps answer
+RESOLUTION_PATTERN = re.compile(
+    r"\b(?:(?:after|since|once) (?:i|we) (?:had |have )?(?:cleaned|checked|replaced|fixed|repaired|reset|changed|"
+    r"unblocked|cleared|levell?ed|moved|installed|tightened|removed|descaled)|"
+    r"(?:i|we) (?:cleaned|checked|replaced|fixed|unblocked|cleared)|"
+    r"(?:is|its|it's|now) (?:fixed|working|fine|ok(?:ay)?|sorted)|works? (?:now|again|fine)|resolved|"
+    r"sorted it|no longer|already|tried)\b"
+)
+# Priorities on the system prompt's scale (10=immediate ... 50=low): hazards,
+# and the fallback when nothing matches
+IMMEDIATE_PRIORITY = 10
+DEFAULT_PRIORITY = 40
+
+INTENT_RESPONSES = {
+    'drain': {
+        "action": "troubleshoot",
+        "response": """**Drainage Issue - Try These Steps:**
+
+🔧 **Quick Fixes:**
+1. **Check the drain hose** - Ensure it's not kinked or clogged
+2. **Clean the drain filter** - Usually located at bottom front of machine
+3. **Remove blockages** - Check for lint, coins, or debris
+4. **Verify drain height** - Hose shouldn't be higher than 96cm
+
+If these don't work, I can create a support ticket for professional help.""",
+        "category": "Hardware",
+        "priority": 30
+    },
+    'detergent': {
+        "action": "troubleshoot",
+        "response": """**Detergent Dispensing Issue - Try These Steps:**
+
+🧽 **Quick Fixes:**
+1. **Clean the detergent drawer** - Remove and wash thoroughly with warm water
+2. **Check water pressure** - Ensure strong water flow to machine
+3. **Use correct amount** - Don't overfill compartments
+4. **Right detergent type** - Use HE detergent for high-efficiency machines
+
+If problem continues, I can create a support ticket.""",
+        "category": "Maintenance",
+        "priority": 30
+    },
+    'startup': {
+        "action": "create_ticket",
+        "response": "Power and startup issues often require technical diagnosis. I'll create a support ticket so our technicians can properly assist you with this problem.",
+        "ticket_summary": "Washing machine power/startup failure",
+        "category": "Hardware",
+        "priority": 20
+    },
+    'noise': {
+        "action": "create_ticket",
+        "response": "Unusual noises can indicate mechanical issues that need professional attention. I'll create a support ticket for a technician to diagnose the problem safely.",
+        "ticket_summary": "Washing machine making unusual noises",
+        "category": "Hardware",
+        "priority": 30
+    },
+}
+
+class IntentClassifier:
+    """Single-pass keyword classifier for the common washing machine problems"""
+
+    def __init__(self):
+        # One combined regex; each alternative is a named group "<intent>__<index>"
+        alternatives = []
+        self._weights: Dict[str, Tuple[str, float]] = {}
+        for intent, patterns in INTENT_PATTERNS.items():
+            for index, (pattern, weight) in enumerate(patterns):
+                group = f"{intent}__{index}"
+                alternatives.append(f"(?P<{group}>{pattern})")
+                self._weights[group] = (intent, weight)
+        self._pattern = re.compile(r"\b(?:" + "|".join(alternatives) + r")\b")
+
+        self.stats = {'classified': 0, 'confident': 0}
+
+    def classify(self, user_message: str) -> Tuple[Optional[str], float]:
+        """Return the most likely intent and a confidence between 0 and 1"""
+        self.stats['classified'] += 1
+        return self._classify(user_message.lower().replace('’', "'"))
+
+    def priority(self, user_message: str) -> int:
+        """Cheap urgency estimate on the 10 (immediate) to 50 (low) scale, for scheduling"""
+        text = user_message.lower().replace('’', "'")
+        if URGENT_PATTERN.search(text):
+            return IMMEDIATE_PRIORITY
+        intent, _ = self._classify(text)
+        priority = INTENT_RESPONSES[intent]['priority'] if intent is not None else DEFAULT_PRIORITY
+        # Someone who has already tried the basics moves up a class, short of immediate
+        if ESCALATION_PATTERN.search(text):
+            priority = max(20, priority - 10)
+        return priority
+
+    def _classify(self, text: str) -> Tuple[Optional[str], float]:
+        scores: Dict[str, float] = {}
+        for match in self._pattern.finditer(text):
+            intent, weight = self._weights[match.lastgroup]
+            scores[intent] = scores.get(intent, 0.0) + weight
+
+        if not scores:
+            return None, 0.0
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        intent, score = ranked[0]
+        # Competing intents mean a compound problem, which the LLM handles better
+        if len(ranked) > 1:
+            score -= ranked[1][1]
+        if ESCALATION_PATTERN.search(text):
+            score -= ESCALATION_PENALTY
+        return intent, max(0.0, min(1.0, score))
+
+    def answer(self, user_message: str, threshold: float) -> Optional[Dict[str, Any]]:
+        """Canned response for a confidently classified message, otherwise None
+
+        Hazards and reports of a fix attempt or outcome always go to the LLM,
+        however confident the keyword match is.
+        """
+        intent, confidence = self.classify(user_message)
+        if intent is None or confidence < threshold:
+            return None
+        text = user_message.lower().replace('’', "'")
+        if URGENT_PATTERN.search(text) or RESOLUTION_PATTERN.search(text):
+            return None
+        self.stats['confident'] += 1
+        return dict(INTENT_RESPONSES[intent])
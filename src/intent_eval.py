@@ -0,0 +1,118 @@
+"""Accuracy of the local intent classifier's canned answers on a labelled set
+
+Each line of the labelled set is {"text": ..., "intent": ...}, where intent
+is the canned answer that is right for the message, or null when it must go
+to Gemini (hazards, fix attempts, compound or unrelated problems). For each
+confidence threshold the report shows how many messages would be answered
+locally (the share of Gemini calls avoided), how many of those got the
+right answer, how many should never have been answered locally at all, and
+how long the classifier takes per message.
+
+    python intent_eval.py
+    python intent_eval.py my_labels.jsonl --min-precision 0.98 --json results.json
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict, List
+
+from config import Config
+from intent_classifier import IntentClassifier
+
+DEFAULT_LABELS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'intent_eval.jsonl')
+THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+# Passes over the labelled set when timing, so each figure averages many calls
+TIMING_PASSES = 50
+
+def load_labels(path: str) -> List[Dict[str, Any]]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def evaluate(labels: List[Dict[str, Any]], threshold: float) -> Dict[str, Any]:
+    """Outcome counts for answering locally at the given confidence threshold"""
+    classifier = IntentClassifier()
+    answerable = sum(1 for label in labels if label['intent'] is not None)
+    correct, wrong_intent, should_escalate, missed = 0, [], [], []
+    for label in labels:
+        if classifier.answer(label['text'], threshold) is None:
+            if label['intent'] is not None:
+                missed.append(label['text'])
+            continue
+        intent, _ = classifier.classify(label['text'])
+        if intent == label['intent']:
+            correct += 1
+        elif label['intent'] is None:
+            should_escalate.append(label['text'])
+        else:
+            wrong_intent.append(label['text'])
+
+    answered = correct + len(wrong_intent) + len(should_escalate)
+    mean_us, p99_us = time_classification(classifier, labels, threshold)
+    return {
+        'threshold': threshold,
+        'answered': answered,
+        'llm_calls_avoided': answered / len(labels) if labels else 0.0,
+        'precision': correct / answered if answered else 1.0,
+        'recall': correct / answerable if answerable else 0.0,
+        'wrong_intent': wrong_intent,
+        'should_escalate': should_escalate,
+        'missed': missed,
+        'mean_us': mean_us,
+        'p99_us': p99_us,
+    }
+
+def time_classification(classifier: IntentClassifier, labels: List[Dict[str, Any]], threshold: float):
+    """Mean and p99 time of one answer() call, in microseconds"""
+    timings = []
+    for _ in range(TIMING_PASSES):
+        for label in labels:
+            started = time.perf_counter_ns()
+            classifier.answer(label['text'], threshold)
+            timings.append(time.perf_counter_ns() - started)
+    if not timings:
+        return 0.0, 0.0
+    timings.sort()
+    return sum(timings) / len(timings) / 1000, timings[int(0.99 * (len(timings) - 1))] / 1000
+
+def print_report(results: List[Dict[str, Any]], total: int, recommended):
+    print(f"{total} labelled messages")
+    print("threshold  answered  LLM avoided  precision  recall  wrong  unsafe  mean us  p99 us")
+    for result in results:
+        print(f"{result['threshold']:>9.2f}  {result['answered']:>8}  {result['llm_calls_avoided']:>11.0%}  "
+              f"{result['precision']:>9.0%}  {result['recall']:>6.0%}  {len(result['wrong_intent']):>5}  "
+              f"{len(result['should_escalate']):>6}  {result['mean_us']:>7.1f}  {result['p99_us']:>6.1f}")
+    for result in results:
+        for text in result['wrong_intent'] + result['should_escalate']:
+            print(f"  at {result['threshold']:.2f} answered locally: {text}")
+        if result['threshold'] == Config.INTENT_CONFIDENCE_THRESHOLD:
+            for text in result['missed']:
+                print(f"  at {result['threshold']:.2f} sent to Gemini: {text}")
+    if recommended is None:
+        print("No threshold meets the precision target")
+    else:
+        print(f"Lowest threshold meeting the precision target: {recommended:.2f} "
+              f"(configured: {Config.INTENT_CONFIDENCE_THRESHOLD})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the local intent classifier against labelled messages")
+    parser.add_argument('labels', nargs='?', default=DEFAULT_LABELS, help="JSONL file of labelled messages")
+    parser.add_argument('--min-precision', type=float, default=0.95,
+                        help="Share of local answers that must be right, with none that should have escalated")
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    labels = load_labels(args.labels)
+    thresholds = sorted(set(THRESHOLDS) | {Config.INTENT_CONFIDENCE_THRESHOLD})
+    results = [evaluate(labels, threshold) for threshold in thresholds]
+    recommended = next((result['threshold'] for result in results
+                        if result['precision'] >= args.min_precision and not result['should_escalate']), None)
+
+    print_report(results, len(labels), recommended)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'results': results, 'recommended_threshold': recommended}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,75 @@
 import google.generativeai as genai
-import json
 import asyncio
-from typing import Dict, Any, Optional
+import re
+import time
+from typing import Awaitable, Callable, Dict, Any, Optional
 from config import Config
+from metrics import LLM_ERRORS, LLM_FIRST_TEXT, LLM_LATENCY
+from model_router import ModelBackend, ModelRouter
+from response_cache import ResponseCache
+from intent_classifier import IntentClassifier, INTENT_RESPONSES, IMMEDIATE_PRIORITY, URGENT_PATTERN
+from response_parser import ResponseParseError, parse_llm_response
+
+class LLMOverloadedError(Exception):
+    """Raised when the inference queue is full and a call is shed"""
+
+BUSY_MESSAGE = ("I'm handling a lot of requests right now, please try again in a few minutes. "
+                "If your machine is leaking, sparking or smoking, switch it off at the wall and unplug it.")
+
+JSON_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+def extract_partial_field(text: str, field: str) -> Optional[str]:
+    """Decode the (possibly unterminated) string value of `field` from partial JSON"""
+    match = re.search(r'"%s"\s*:\s*"' % re.escape(field), text)
+    if match is None:
+        return None
+    
+    chars = []
+    i = match.end()
+    while i < len(text):
+        char = text[i]
+        if char == '"':
+            break
+        if char == '\\':
+            if i + 1 >= len(text):
+                break
+            escape = text[i + 1]
+            if escape == 'u':
+                # Wait for all four hex digits before decoding
+                if i + 6 > len(text):
+                    break
+                chars.append(chr(int(text[i + 2:i + 6], 16)))
+                i += 6
+                continue
+            chars.append(JSON_ESCAPES.get(escape, escape))
+            i += 2
+            continue
+        chars.append(char)
+        i += 1
+    return ''.join(chars)
 
 class LLMHandler:
-    def __init__(self):
-        genai.configure(api_key=Config.GEMINI_API_KEY)
-        # self.model = genai.GenerativeModel('gemini-pro')
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+    def __init__(self, response_cache: Optional[ResponseCache] = None, model=None,
+                 router: Optional[ModelRouter] = None):
+        # A model object with Gemini's generate_content_async interface, or a
+        # whole router, can be passed in place of the configured Gemini models
+        if model is None and router is None:
+            genai.configure(api_key=Config.GEMINI_API_KEY)
+        
+        # Bounded inference pool (semaphore is created on first use so it
+        # binds to the running event loop)
+        self.max_in_flight = Config.LLM_MAX_CONCURRENCY
+        self.max_queue_depth = Config.LLM_MAX_QUEUE_DEPTH
+        self.timeout = Config.LLM_TIMEOUT
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+        
+        # Repeated questions are answered from here without calling Gemini
+        self.response_cache = response_cache
+        
+        # Common problems are answered locally when the match is confident
+        self.intent_classifier = IntentClassifier()
+        self.intent_threshold = Config.INTENT_CONFIDENCE_THRESHOLD
         
         self.system_prompt = """
 You are a helpful washing machine support assistant. Your goal is to help users with washing machine problems.
@@ -43,116 +104,254 @@ Create tickets for:
 - Issues needing technician visit
 - Problems basic troubleshooting can't resolve
         """
+        
+        # Calls go through a router that picks a model per message and hedges slow calls
+        if router is None:
+            if model is not None:
+                backends = [ModelBackend('injected', model)]
+            else:
+                # The system prompt is sent as the model's system instruction rather
+                # than being pasted into every request body
+                # self.model = genai.GenerativeModel('gemini-pro')
+                backends = [
+                    ModelBackend(name, genai.GenerativeModel(
+                        name,
+                        system_instruction=self.system_prompt,
+                        # JSON mode: the model emits a bare JSON object, no code fences
+                        generation_config={"response_mime_type": "application/json"}
+                    ), tier=tier)
+                    for tier, name in enumerate(Config.LLM_MODELS)
+                ]
+            router = ModelRouter(
+                backends,
+                short_message_chars=Config.LLM_SHORT_MESSAGE_CHARS,
+                hedging=Config.LLM_HEDGING,
+                hedge_quantile=Config.LLM_HEDGE_QUANTILE,
+                hedge_delay=Config.LLM_HEDGE_DELAY,
+                min_hedge_delay=Config.LLM_HEDGE_MIN_DELAY
+            )
+        self.router = router
+        
+        # History sent with each call is trimmed to these (estimated) token budgets
+        self.history_token_budget = Config.LLM_HISTORY_TOKEN_BUDGET
+        self.message_token_limit = Config.LLM_MESSAGE_TOKEN_LIMIT
+        
+        # Token usage reported by Gemini, per call and in aggregate
+        self.last_usage: Dict[str, int] = {}
+        self.token_stats = {'calls': 0, 'input_tokens': 0, 'output_tokens': 0}
+        
+        # Outcomes of parsing Gemini replies
+        self.parse_stats = {'attempts': 0, 'repaired': 0, 'reasked': 0, 'failed': 0}
     
-    async def process_query(self, user_message: str, conversation_history: Optional[list] = None) -> Dict[str, Any]:
-        """Process user query and determine appropriate response"""
+    async def process_query(self, user_message: str, conversation_history: Optional[list] = None,
+                            on_partial: Optional[Callable[[str], Awaitable[None]]] = None,
+                            priority: Optional[int] = None) -> Dict[str, Any]:
+        """Process user query and determine appropriate response
+        
+        When on_partial is given the reply is streamed and on_partial is called
+        with the "response" text decoded so far each time a chunk arrives.
+        priority is the urgency the message was admitted with; immediate
+        messages always get a full LLM answer rather than a canned one.
+        """
+        
+        if priority is None or priority > IMMEDIATE_PRIORITY:
+            local_answer = self.intent_classifier.answer(user_message, self.intent_threshold)
+            if local_answer is not None:
+                return local_answer
+        
+        if self.response_cache is not None:
+            cached = await self.response_cache.get(user_message, conversation_history)
+            if cached is not None:
+                return cached
         
         try:
-            # Build the full prompt
-            context = ""
-            if conversation_history:
-                # Add recent conversation context
-                recent_messages = conversation_history[-4:]  # Last 4 messages for context
-                for msg in recent_messages:
-                    context += f"{msg['role']}: {msg['content']}\n"
-            
+            # Build the prompt from trimmed history and the current message
+            context = self._format_history(conversation_history)
             full_prompt = f"""
-{self.system_prompt}
-
-{f"Previous conversation context:{context}" if context else ""}
-
 Current user message: {user_message}
 
 Respond with JSON only:"""
+            if context:
+                full_prompt = f"Previous conversation context:\n{context}\n{full_prompt}"
 
-            response = self.model.generate_content(full_prompt)            
+            started = time.perf_counter()
+            if on_partial is None:
+                response = await self._generate(full_prompt, user_message)
+            else:
+                response = await self._generate_streaming(full_prompt, user_message, on_partial, started)
+            latency = time.perf_counter() - started
+            self._record_usage(response)
             try:
-                # Clean the response text (remove code block markers if present)
-                response_text = response.text.strip()
-                if response_text.startswith('```json'):
-                    response_text = response_text[7:-3].strip()
-                elif response_text.startswith('```'):
-                    response_text = response_text[3:-3].strip()
-                
-                parsed_response = json.loads(response_text)
-                
-                # Validate required fields
-                if not all(key in parsed_response for key in ['action', 'response', 'category', 'priority']):
-                    raise ValueError("Missing required fields in response")
-                
-                return parsed_response
-                
-            except (json.JSONDecodeError, ValueError) as e:
+                parsed_response = self._parse(response.text)
+            except ResponseParseError as e:
+                # One targeted re-ask instead of discarding the paid-for round trip
                 print(f"JSON parsing error: {e}")
                 print(f"Raw response: {response.text}")
-                # Return fallback response
-                return self.get_fallback_response(user_message)
+                self.parse_stats['reasked'] += 1
+                retry_prompt = f"""{full_prompt}
+
+Your previous reply could not be used ({e}). Previous reply:
+{response.text[:2000]}
+
+Reply again with one valid JSON object in the required format and nothing else."""
+                response = await self._generate(retry_prompt, user_message)
+                latency = time.perf_counter() - started
+                self._record_usage(response)
+                try:
+                    parsed_response = self._parse(response.text)
+                except ResponseParseError as e:
+                    print(f"JSON parsing error after re-ask: {e}")
+                    self.parse_stats['failed'] += 1
+                    return self.get_fallback_response(user_message)
+            
+            if self.response_cache is not None:
+                await self.response_cache.put(user_message, conversation_history, parsed_response, latency)
+            
+            return parsed_response
                 
+        except LLMOverloadedError as e:
+            print(f"Gemini request shed: {e}")
+            return self.get_busy_response(user_message)
+        except asyncio.TimeoutError:
+            print(f"Gemini request timed out after {self.timeout}s")
+            return self.get_busy_response(user_message)
         except Exception as e:
             print(f"Error processing with Gemini: {e}")
             return self.get_fallback_response(user_message)
     
+    def _parse(self, response_text: str) -> Dict[str, Any]:
+        """Parse a reply with the tolerant parser, counting outcomes"""
+        self.parse_stats['attempts'] += 1
+        parsed_response, repaired = parse_llm_response(response_text)
+        if repaired:
+            self.parse_stats['repaired'] += 1
+        return parsed_response
+    
+    @property
+    def parse_failure_rate(self) -> float:
+        """Fraction of Gemini replies that needed a re-ask"""
+        calls = self.parse_stats['attempts'] - self.parse_stats['reasked']
+        return self.parse_stats['reasked'] / calls if calls else 0.0
+    
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """Cheap token estimate (about four characters per token) used for budgeting"""
+        return (len(text) + 3) // 4
+    
+    def _format_history(self, conversation_history: Optional[list]) -> str:
+        """Render recent history newest-first into the token budget, truncating long messages"""
+        if not conversation_history:
+            return ""
+        
+        lines = []
+        budget = self.history_token_budget
+        for msg in reversed(conversation_history[-Config.SESSION_CONTEXT_MESSAGES:]):
+            content = msg['content']
+            if self.estimate_tokens(content) > self.message_token_limit:
+                content = content[:self.message_token_limit * 4].rstrip() + "…"
+            line = f"{msg['role']}: {content}"
+            cost = self.estimate_tokens(line)
+            if cost > budget:
+                break
+            budget -= cost
+            lines.append(line)
+        return "\n".join(reversed(lines))
+    
+    def _record_usage(self, response):
+        """Add the call's reported token usage to the running totals"""
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is None:
+            return
+        self.last_usage = {
+            'input_tokens': usage.prompt_token_count,
+            'output_tokens': usage.candidates_token_count
+        }
+        self.token_stats['calls'] += 1
+        self.token_stats['input_tokens'] += usage.prompt_token_count
+        self.token_stats['output_tokens'] += usage.candidates_token_count
+    
+    async def _generate_streaming(self, prompt: str, user_message: str,
+                                  on_partial: Callable[[str], Awaitable[None]], started: float):
+        """Stream a Gemini call, reporting the partial "response" field as it grows"""
+        received = []
+        last_partial = ''
+        
+        async def on_chunk(chunk_text: str):
+            nonlocal last_partial
+            received.append(chunk_text)
+            partial = extract_partial_field(''.join(received), 'response')
+            if partial and partial != last_partial:
+                if not last_partial:
+                    LLM_FIRST_TEXT.observe(time.perf_counter() - started)
+                last_partial = partial
+                await on_partial(partial)
+        
+        return await self._generate(prompt, user_message, on_chunk)
+    
+    async def _generate(self, prompt: str, user_message: str = '',
+                        on_chunk: Optional[Callable[[str], Awaitable[None]]] = None):
+        """Run a single Gemini call through the bounded inference pool
+
+        The user message alone (without history) decides which model the
+        router sends the prompt to.
+        """
+        
+        # Backpressure: refuse new work once the in-flight + waiting limit is hit
+        if self._pending >= self.max_in_flight + self.max_queue_depth:
+            LLM_ERRORS.inc(reason='overloaded')
+            raise LLMOverloadedError(f"{self._pending} requests already pending")
+        
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        
+        self._pending += 1
+        try:
+            async with self._slots:
+                # Timeout covers the API call only, not time spent queued
+                # Hedges take their own slot, so the pool bounds them too
+                call = self.router.generate(prompt, user_message, on_chunk, slots=self._slots)
+                with LLM_LATENCY.time():
+                    return await asyncio.wait_for(call, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            LLM_ERRORS.inc(reason='timeout')
+            raise
+        except Exception:
+            LLM_ERRORS.inc(reason='error')
+            raise
+        finally:
+            self._pending -= 1
+    
+    def get_busy_response(self, user_message: str) -> Dict[str, Any]:
+        """Reply for a shed or timed-out call, which must never open a ticket
+        
+        Under overload a ticket per message would just move the flood to Mantis,
+        so only self-help steps are offered, or a request to try again later.
+        """
+        intent, _ = self.intent_classifier.classify(user_message)
+        text = user_message.lower().replace('’', "'")
+        if (intent is not None and INTENT_RESPONSES[intent]['action'] == 'troubleshoot'
+                and not URGENT_PATTERN.search(text)):
+            return dict(INTENT_RESPONSES[intent])
+        
+        return {
+            "action": "clarify",
+            "response": BUSY_MESSAGE,
+            "category": "General",
+            "priority": 40
+        }
+    
     def get_fallback_response(self, user_message: str) -> Dict[str, Any]:
         """Provide fallback response when AI processing fails"""
         
-        user_message_lower = user_message.lower()
+        # Keyword-based responses, accepting any keyword match at all
+        intent, _ = self.intent_classifier.classify(user_message)
+        if intent is not None:
+            return dict(INTENT_RESPONSES[intent])
         
-        # Simple keyword-based responses
-        if any(keyword in user_message_lower for keyword in ['drain', 'draining', 'water won\'t drain', 'not draining']):
-            return {
-                "action": "troubleshoot",
-                "response": """**Drainage Issue - Try These Steps:**
-
-🔧 **Quick Fixes:**
-1. **Check the drain hose** - Ensure it's not kinked or clogged
-2. **Clean the drain filter** - Usually located at bottom front of machine
-3. **Remove blockages** - Check for lint, coins, or debris
-4. **Verify drain height** - Hose shouldn't be higher than 96cm
-
-If these don't work, I can create a support ticket for professional help.""",
-                "category": "Hardware",
-                "priority": 30
-            }
-        
-        elif any(keyword in user_message_lower for keyword in ['detergent', 'soap', 'dispenser', 'not dispensing']):
-            return {
-                "action": "troubleshoot",
-                "response": """**Detergent Dispensing Issue - Try These Steps:**
-
-🧽 **Quick Fixes:**
-1. **Clean the detergent drawer** - Remove and wash thoroughly with warm water
-2. **Check water pressure** - Ensure strong water flow to machine
-3. **Use correct amount** - Don't overfill compartments
-4. **Right detergent type** - Use HE detergent for high-efficiency machines
-
-If problem continues, I can create a support ticket.""",
-                "category": "Maintenance", 
-                "priority": 30
-            }
-        
-        elif any(keyword in user_message_lower for keyword in ['won\'t start', 'not starting', 'no power', 'dead']):
-            return {
-                "action": "create_ticket",
-                "response": "Power and startup issues often require technical diagnosis. I'll create a support ticket so our technicians can properly assist you with this problem.",
-                "ticket_summary": "Washing machine power/startup failure",
-                "category": "Hardware",
-                "priority": 20
-            }
-        
-        elif any(keyword in user_message_lower for keyword in ['noise', 'loud', 'banging', 'grinding', 'squeaking']):
-            return {
-                "action": "create_ticket",
-                "response": "Unusual noises can indicate mechanical issues that need professional attention. I'll create a support ticket for a technician to diagnose the problem safely.",
-                "ticket_summary": "Washing machine making unusual noises",
-                "category": "Hardware", 
-                "priority": 30
-            }
-        
-        else:
-            return {
-                "action": "create_ticket",
-                "response": "I'll create a support ticket for your washing machine issue so our technical team can provide the best assistance.",
-                "ticket_summary": f"Washing machine issue: {user_message[:50]}{'...' if len(user_message) > 50 else ''}",
-                "category": "General",
-                "priority": 30
-            }
+        return {
+            "action": "create_ticket",
+            "response": "I'll create a support ticket for your washing machine issue so our technical team can provide the best assistance.",
+            "ticket_summary": f"Washing machine issue: {user_message[:50]}{'...' if len(user_message) > 50 else ''}",
+            "category": "General",
+            "priority": 30
+        }
@@ -0,0 +1,160 @@
+"""Database maintenance job and its one-off migration
+
+Compaction returns free pages a few at a time with incremental vacuum, which
+only works on a database in auto_vacuum=INCREMENTAL mode. Databases created
+before that was the default need a one-off full VACUUM to convert, which
+rewrites the whole file; run it while the bot is stopped:
+
+    python maintenance.py --enable-incremental-vacuum
+    python maintenance.py --enable-incremental-vacuum path/to/bot_database.db
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Optional, Dict, Any, Callable, Awaitable
+
+from database import DatabaseHandler
+
+class MaintenanceJob:
+    """Periodic expiry, archiving and compaction of the bot's SQLite database"""
+
+    def __init__(self, db: DatabaseHandler, interval: float = 3600, session_ttl: float = 2592000,
+                 ticket_archive_age: float = 7776000, batch_size: int = 500,
+                 quiet_period: float = 300, vacuum_pages: int = 1000):
+        self.db = db
+        self.interval = interval
+        self.session_ttl = session_ttl
+        self.ticket_archive_age = ticket_archive_age
+        self.batch_size = batch_size
+        self.quiet_period = quiet_period
+        self.vacuum_pages = vacuum_pages
+
+        self._last_activity = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self._warned_no_vacuum = False
+
+        self.last_report: Dict[str, Any] = {}
+        self.table_sizes: Dict[str, int] = {}
+        self.stats = {'runs': 0, 'expired_sessions': 0, 'archived_tickets': 0, 'purged_rows': 0,
+                      'reclaimed_bytes': 0, 'database_bytes': 0}
+
+    def start(self):
+        """Start the periodic maintenance task"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop the maintenance task"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def record_activity(self):
+        """Note live traffic; compaction waits for quiet_period seconds without any"""
+        self._last_activity = time.monotonic()
+
+    @property
+    def is_quiet(self) -> bool:
+        return time.monotonic() - self._last_activity >= self.quiet_period
+
+    async def run(self) -> Dict[str, Any]:
+        """Run one maintenance pass and return what it did"""
+        before = await self.db.get_storage_stats_async()
+
+        expired = await self._in_batches(lambda: self.db.expire_sessions_async(self.session_ttl, self.batch_size))
+        archived = await self._in_batches(lambda: self.db.archive_tickets_async(self.ticket_archive_age, self.batch_size))
+        purged = await self._in_batches(lambda: self.db.purge_expired_async(self.ticket_archive_age, self.batch_size))
+
+        reclaimed = 0
+        if self.is_quiet:
+            vacuum = await self.db.incremental_vacuum_enabled_async()
+            if not vacuum and not self._warned_no_vacuum:
+                print("⚠️ Database isn't in incremental vacuum mode; free pages stay in the file until "
+                      "`python maintenance.py --enable-incremental-vacuum` is run with the bot stopped")
+                self._warned_no_vacuum = True
+            # Small vacuum steps so queued live queries run in between
+            while vacuum and self.is_quiet and await self.db.free_pages_async() > 0:
+                step = await self.db.incremental_vacuum_async(self.vacuum_pages)
+                reclaimed += step
+                if step <= 0:
+                    break
+                await asyncio.sleep(0.05)
+            if self.is_quiet:
+                await self.db.optimize_async()
+
+        after = await self.db.get_storage_stats_async()
+        tables = await self.db.get_table_sizes_async()
+        report = {
+            'expired_sessions': expired,
+            'archived_tickets': archived,
+            'purged_rows': purged,
+            'reclaimed_bytes': reclaimed,
+            'database_bytes': after['file_bytes'],
+            'free_bytes': after['free_bytes'],
+            'tables': tables,
+            'database_bytes_before': before['file_bytes'],
+        }
+
+        self.last_report = report
+        self.table_sizes = tables
+        self.stats['runs'] += 1
+        self.stats['expired_sessions'] += expired
+        self.stats['archived_tickets'] += archived
+        self.stats['purged_rows'] += purged
+        self.stats['reclaimed_bytes'] += reclaimed
+        self.stats['database_bytes'] = after['file_bytes']
+
+        print(f"🧹 Maintenance: expired {expired} sessions, archived {archived} tickets, "
+              f"purged {purged} rows, reclaimed {reclaimed} bytes; database is {after['file_bytes']} bytes")
+        largest = sorted(tables.items(), key=lambda item: -item[1])[:5]
+        print("   Largest: " + ", ".join(f"{name} {size}" for name, size in largest))
+        return report
+
+    async def _in_batches(self, batch: Callable[[], Awaitable[int]]) -> int:
+        """Repeat a batched job until it comes back short, yielding between transactions"""
+        total = 0
+        while True:
+            done = await batch()
+            total += done
+            if done < self.batch_size:
+                return total
+            await asyncio.sleep(0.05)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run()
+            except Exception as e:
+                print(f"Error running database maintenance: {e}")
+
+def main():
+    parser = argparse.ArgumentParser(description="One-off maintenance of the bot's database")
+    parser.add_argument('db_path', nargs='?', help="Database file (defaults to DATABASE_PATH)")
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help="Convert the database to incremental vacuum mode with one full VACUUM")
+    args = parser.parse_args()
+    if not args.enable_incremental_vacuum:
+        parser.error("nothing to do; pass --enable-incremental-vacuum")
+
+    if args.db_path is None:
+        from config import Config
+        args.db_path = Config.DATABASE_PATH
+    db = DatabaseHandler(args.db_path)
+    try:
+        before = db.get_storage_stats()
+        started = time.perf_counter()
+        db.enable_incremental_vacuum()
+        after = db.get_storage_stats()
+    finally:
+        db.close()
+    print(f"✅ {args.db_path} now uses incremental vacuum ({before['file_bytes']} -> {after['file_bytes']} bytes "
+          f"in {time.perf_counter() - started:.1f}s)")
+
+if __name__ == "__main__":
+    main()
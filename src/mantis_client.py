@@ -1,22 +1,124 @@
 from zeep import Client
+from zeep.cache import InMemoryCache, SqliteCache
+from zeep.exceptions import Fault
 from zeep.transports import Transport
 from requests import Session
+from requests.adapters import HTTPAdapter
+import requests
+import asyncio
 import base64
-from typing import Optional, Dict, Any
+import functools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List
 from config import Config
+from metrics import SOAP_ERRORS, SOAP_LATENCY
+
+# Preferred Mantis categories for each LLM category, most specific first
+CATEGORY_ALIASES = {
+    'hardware': ['Hardware', 'Bug', 'Issue'],
+    'software': ['Software', 'Bug', 'Issue'],
+    'maintenance': ['Maintenance', 'Support'],
+    'general': ['General', 'Support'],
+}
+DEFAULT_CATEGORIES = ['General', 'Support', 'Bug', 'Issue', 'Default']
 
 class MantisHubClient:
-    def __init__(self):
-        self.soap_url = Config.MANTIS_BASE_URL
+    def __init__(self, soap_url: Optional[str] = None, client: Optional[Client] = None):
+        self.soap_url = soap_url or Config.MANTIS_BASE_URL
         self.username = Config.MANTIS_USERNAME
         self.password = Config.MANTIS_PASSWORD
         self.project_id = Config.MANTIS_PROJECT_ID
         self.api_token = Config.MANTIS_API_TOKEN
         
-        # Create SOAP client
-        session = Session()
-        transport = Transport(session=session)
-        self.client = Client(self.soap_url, transport=transport)
+        self.pool_size = Config.MANTIS_POOL_SIZE
+        self.max_retries = Config.MANTIS_MAX_RETRIES
+        self.retry_backoff = Config.MANTIS_RETRY_BACKOFF
+        timeouts = (Config.MANTIS_CONNECT_TIMEOUT, Config.MANTIS_READ_TIMEOUT)
+        
+        # SOAP client is built on first use, not at import time, unless one
+        # is passed in (the replay benchmark passes an in-process fake)
+        self._client: Optional[Client] = client
+        self._client_lock = threading.Lock()
+        
+        self.transport: Optional[Transport] = None
+        if client is None:
+            # Keep-alive connection pool shared by the worker threads
+            session = Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            
+            # Parsed WSDL/XSD documents are cached so restarts skip the download
+            if Config.MANTIS_WSDL_CACHE_PATH:
+                cache = SqliteCache(path=Config.MANTIS_WSDL_CACHE_PATH, timeout=Config.MANTIS_WSDL_CACHE_TTL)
+            else:
+                cache = InMemoryCache(timeout=Config.MANTIS_WSDL_CACHE_TTL)
+            self.transport = Transport(session=session, cache=cache, timeout=Config.MANTIS_READ_TIMEOUT, operation_timeout=timeouts)
+        
+        # Project categories, fetched once and reused until the TTL expires
+        self.category_cache_ttl = Config.MANTIS_CATEGORY_CACHE_TTL
+        self._categories: Optional[List[str]] = None
+        self._categories_fetched_at = 0.0
+        self._categories_lock = threading.Lock()
+        self.category_stats = {'cache_hits': 0, 'cache_refreshes': 0, 'fallbacks': 0}
+        
+        # SOAP calls are blocking, so they run here instead of on the event loop
+        self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='mantis')
+    
+    @property
+    def client(self) -> Client:
+        """SOAP client, created lazily on first ticket operation"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    started = time.perf_counter()
+                    self._client = Client(self.soap_url, transport=self.transport)
+                    print(f"SOAP client ready in {time.perf_counter() - started:.2f}s")
+        return self._client
+    
+    async def warm_up_async(self):
+        """Load the WSDL in the background so the first ticket doesn't pay for it"""
+        try:
+            await self._run(lambda: self.client)
+        except Exception as e:
+            print(f"Error loading Mantis WSDL: {e}")
+    
+    def _call(self, operation: str, idempotent: bool = True, **kwargs):
+        """Invoke a SOAP operation, retrying transient network errors with jittered backoff"""
+        
+        # Writes are not retried on read timeouts, the server may already have applied them
+        retryable = (requests.ConnectionError, requests.Timeout) if idempotent else (requests.ConnectionError,)
+        
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                response = getattr(self.client.service, operation)(
+                    username=self.username,
+                    password=self.password,
+                    **kwargs
+                )
+            except Exception as e:
+                # Latency of the attempt itself, not the backoff that follows
+                SOAP_LATENCY.observe(time.perf_counter() - started, operation=operation)
+                SOAP_ERRORS.inc(operation=operation)
+                if not isinstance(e, retryable):
+                    raise
+                if attempt == self.max_retries:
+                    raise
+                delay = random.uniform(0, self.retry_backoff * (2 ** attempt))
+                print(f"⚠️ SOAP {operation} failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+            SOAP_LATENCY.observe(time.perf_counter() - started, operation=operation)
+            return response
+    
+    async def _run(self, func, *args, **kwargs):
+        """Run a blocking client method on the SOAP worker pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
         
     def create_ticket(self, summary: str, description: str, reporter_name: str, 
                     category: str = "General", priority: int = 30) -> Optional[str]:
@@ -27,60 +129,103 @@ class MantisHubClient:
             priority_map = {10: 60, 20: 50, 30: 40, 40: 30, 50: 20}
             soap_priority = priority_map.get(priority, 40)
             
-            # Try different default categories if the provided one fails
-            categories_to_try = [category, "General", "Bug", "Support", "Issue", "Default"]
+            # Resolve against the project's real categories so one call is enough
+            cat_name = self.resolve_category(category)
             
-            for cat_name in categories_to_try:
-                try:
-                    # Create issue data structure with category
-                    issue_data = {
-                        'summary': summary,
-                        'description': description,
-                        'project': {'id': int(self.project_id)},
-                        'category': cat_name,
-                        'priority': {'id': soap_priority},
-                        'severity': {'id': 50},
-                        'status': {'id': 10},
-                        'reproducibility': {'id': 10},
-                        'view_state': {'id': 10}
-                    }
-                    
-                    response = self.client.service.mc_issue_add(
-                        username=self.username,
-                        password=self.password,
-                        issue=issue_data
-                    )
-                    
-                    if response:
-                        print(f"✅ SOAP ticket created successfully: #{response} (category: {cat_name})")
-                        return str(response)
-                        
-                except Exception as category_error:
-                    print(f"⚠️ Category '{cat_name}' failed: {category_error}")
-                    continue
+            def issue_data(cat_name: str) -> Dict[str, Any]:
+                return {
+                    'summary': summary,
+                    'description': description,
+                    'project': {'id': int(self.project_id)},
+                    'category': cat_name,
+                    'priority': {'id': soap_priority},
+                    'severity': {'id': 50},
+                    'status': {'id': 10},
+                    'reproducibility': {'id': 10},
+                    'view_state': {'id': 10}
+                }
             
-            print("❌ All category attempts failed")
+            try:
+                response = self._call('mc_issue_add', idempotent=False, issue=issue_data(cat_name))
+            except Fault as category_error:
+                # Category list may have changed on the server; refresh once and retry
+                print(f"⚠️ Category '{cat_name}' failed: {category_error}")
+                self.invalidate_categories()
+                retry_name = self.resolve_category(category)
+                if retry_name == cat_name:
+                    raise
+                cat_name = retry_name
+                response = self._call('mc_issue_add', idempotent=False, issue=issue_data(cat_name))
+            
+            if response:
+                print(f"✅ SOAP ticket created successfully: #{response} (category: {cat_name})")
+                return str(response)
+            
+            print("❌ Ticket creation returned no issue id")
             return None
             
         except Exception as e:
             print(f"❌ SOAP Error creating ticket: {e}")
             return None
 
+    def get_categories(self) -> List[str]:
+        """Get the project's categories, refreshing the cached list when stale"""
+        with self._categories_lock:
+            expired = time.monotonic() - self._categories_fetched_at > self.category_cache_ttl
+            if self._categories is not None and not expired:
+                self.category_stats['cache_hits'] += 1
+                return self._categories
+            
+            try:
+                response = self._call('mc_project_get_categories', project_id=int(self.project_id))
+                self._categories = [str(name) for name in (response or [])]
+                self._categories_fetched_at = time.monotonic()
+                self.category_stats['cache_refreshes'] += 1
+            except Exception as e:
+                print(f"Error fetching SOAP categories: {e}")
+                # Keep serving a stale list rather than nothing
+                if self._categories is None:
+                    return []
+            return self._categories
+    
+    def invalidate_categories(self):
+        """Drop the cached category list so the next lookup refetches it"""
+        with self._categories_lock:
+            self._categories_fetched_at = 0.0
+    
+    def resolve_category(self, category: str) -> str:
+        """Map an LLM category onto a category that exists in the Mantis project"""
+        available = self.get_categories()
+        if not available:
+            self.category_stats['fallbacks'] += 1
+            return category
+        
+        # Global categories come back as "[All Projects] General"
+        by_name = {name.split('] ', 1)[-1].lower(): name for name in available}
+        candidates = [category] + CATEGORY_ALIASES.get(category.lower(), []) + DEFAULT_CATEGORIES
+        
+        for index, candidate in enumerate(candidates):
+            if candidate.lower() in by_name:
+                if index > 0:
+                    self.category_stats['fallbacks'] += 1
+                return by_name[candidate.lower()]
+        
+        self.category_stats['fallbacks'] += 1
+        return available[0]
+    
     def get_ticket_status(self, ticket_id: str) -> Optional[Dict[str, Any]]:
         """Get ticket status using SOAP API"""
         try:
-            response = self.client.service.mc_issue_get(
-                username=self.username,
-                password=self.password,
-                issue_id=int(ticket_id)
-            )
+            response = self._call('mc_issue_get', issue_id=int(ticket_id))
             
             if response:
+                handler = getattr(response, 'handler', None)
                 return {
                     'id': response.id,
                     'summary': response.summary,
                     'status': response.status.name if hasattr(response, 'status') else 'Unknown',
-                    'priority': response.priority.name if hasattr(response, 'priority') else 'Unknown'
+                    'priority': response.priority.name if hasattr(response, 'priority') else 'Unknown',
+                    'handler': handler.name if handler is not None else 'Unassigned'
                 }
             return None
             
@@ -88,6 +233,21 @@ class MantisHubClient:
             print(f"Error fetching SOAP ticket: {e}")
             return None
     
+    def find_ticket_by_text(self, text: str) -> Optional[str]:
+        """Id of a project issue whose description contains text, or None if there is none
+
+        Used before repeating a creation whose outcome is unknown. Raises if
+        Mantis can't be searched, since that doesn't mean the issue is absent.
+        """
+        search = {'project_id': [int(self.project_id)], 'search': text}
+        issue_ids = self._call('mc_filter_search_issue_ids', filter=search, page_number=1, per_page=10)
+        # Free-text search matches words anywhere, so confirm the exact text
+        for issue_id in issue_ids or []:
+            issue = self._call('mc_issue_get', issue_id=int(issue_id))
+            if issue is not None and text in (getattr(issue, 'description', None) or ''):
+                return str(issue_id)
+        return None
+
     def add_note_to_ticket(self, ticket_id: str, note: str) -> bool:
         """Add a note to existing ticket via SOAP"""
         try:
@@ -95,12 +255,7 @@ class MantisHubClient:
                 'text': note
             }
             
-            response = self.client.service.mc_issue_note_add(
-                username=self.username,
-                password=self.password,
-                issue_id=int(ticket_id),
-                note=note_data
-            )
+            response = self._call('mc_issue_note_add', idempotent=False, issue_id=int(ticket_id), note=note_data)
             
             return bool(response)
             
@@ -108,13 +263,26 @@ class MantisHubClient:
             print(f"Error adding SOAP note: {e}")
             return False
     
+    async def create_ticket_async(self, *args, **kwargs) -> Optional[str]:
+        """Async variant of create_ticket that runs off the event loop"""
+        return await self._run(self.create_ticket, *args, **kwargs)
+    
+    async def get_ticket_status_async(self, ticket_id: str) -> Optional[Dict[str, Any]]:
+        """Async variant of get_ticket_status that runs off the event loop"""
+        return await self._run(self.get_ticket_status, ticket_id)
+    
+    async def find_ticket_by_text_async(self, text: str) -> Optional[str]:
+        """Async variant of find_ticket_by_text that runs off the event loop"""
+        return await self._run(self.find_ticket_by_text, text)
+
+    async def add_note_to_ticket_async(self, ticket_id: str, note: str) -> bool:
+        """Async variant of add_note_to_ticket that runs off the event loop"""
+        return await self._run(self.add_note_to_ticket, ticket_id, note)
+    
     def list_projects(self) -> Optional[list]:
         """List available projects (for testing)"""
         try:
-            response = self.client.service.mc_projects_get_user_accessible(
-                username=self.username,
-                password=self.password
-            )
+            response = self._call('mc_projects_get_user_accessible')
             return response
         except Exception as e:
             print(f"Error listing projects: {e}")
@@ -0,0 +1,62 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Set
+
+class MessageCoalescer:
+    """Merges bursts of messages from one user and processes each user serially"""
+
+    def __init__(self, handler: Callable[[List[Any]], Awaitable[None]], window: float, max_delay: float):
+        # handler receives every message of a burst, oldest first
+        self.handler = handler
+        self.window = window
+        self.max_delay = max_delay
+
+        self._buffers: Dict[str, List[Any]] = {}
+        self._first_seen: Dict[str, float] = {}
+        self._timers: Dict[str, asyncio.Task] = {}
+        # Strong references so running bursts aren't garbage collected
+        self._tasks: Set[asyncio.Task] = set()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # Bursts holding or waiting for each user's lock, so idle locks can be dropped
+        self._lock_users: Dict[str, int] = {}
+
+        self.stats = {'messages': 0, 'batches': 0}
+
+    def submit(self, user_id: str, message: Any):
+        """Add a message to the user's burst and restart the debounce timer"""
+        self.stats['messages'] += 1
+        self._buffers.setdefault(user_id, []).append(message)
+        self._first_seen.setdefault(user_id, time.monotonic())
+
+        timer = self._timers.get(user_id)
+        if timer is not None:
+            timer.cancel()
+        task = asyncio.create_task(self._flush_after_quiet(user_id))
+        self._timers[user_id] = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush_after_quiet(self, user_id: str):
+        # Wait for a quiet window, but never hold a burst longer than max_delay
+        deadline = self._first_seen[user_id] + self.max_delay
+        await asyncio.sleep(max(0.0, min(self.window, deadline - time.monotonic())))
+
+        # Past this point new messages start a fresh burst instead of cancelling us
+        if self._timers.get(user_id) is asyncio.current_task():
+            del self._timers[user_id]
+        batch = self._buffers.pop(user_id, [])
+        self._first_seen.pop(user_id, None)
+        if not batch:
+            return
+
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        self._lock_users[user_id] = self._lock_users.get(user_id, 0) + 1
+        try:
+            async with lock:
+                self.stats['batches'] += 1
+                await self.handler(batch)
+        finally:
+            self._lock_users[user_id] -= 1
+            if not self._lock_users[user_id]:
+                del self._lock_users[user_id]
+                del self._locks[user_id]
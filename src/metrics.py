@@ -0,0 +1,255 @@
+import asyncio
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Latency buckets in seconds, from sub-millisecond SQLite queries to slow LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Counter:
+    """Monotonically increasing count, optionally split by labels"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        # SOAP and SQLite worker threads record metrics too
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+class Gauge:
+    """Point-in-time value, either set directly or read from a callback at scrape time"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._callbacks: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        self._values[tuple(str(labels[name]) for name in self.labelnames)] = value
+
+    def set_function(self, callback: Callable[[], float], **labels):
+        self._callbacks[tuple(str(labels[name]) for name in self.labelnames)] = callback
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        values = dict(self._values)
+        for key, callback in self._callbacks.items():
+            values[key] = callback()
+        for key, value in values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram: 'Histogram', labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+class Histogram:
+    """Bucketed distribution of observed values, optionally split by labels"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Per label set: [count per bucket (non-cumulative) + overflow, sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels) -> _Timer:
+        """Context manager that observes the elapsed wall time"""
+        return _Timer(self, labels)
+
+    def totals(self) -> Dict[Tuple[str, ...], Tuple[int, float]]:
+        """(count, sum) of observations per label set"""
+        with self._lock:
+            return {key: (count, total) for key, (_, total, count) in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+class Registry:
+    """Collection of metrics rendered together in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: list = []
+        self._stats: List[Tuple[str, Callable[[], dict]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_stats(self, prefix: str, stats: Callable[[], dict]):
+        """Expose a component's numeric stats dict as gauges named <prefix>_<key>"""
+        self._stats.append((prefix, stats))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for prefix, stats in self._stats:
+            for key, value in stats().items():
+                if isinstance(value, (int, float)):
+                    lines.append(f"# TYPE {prefix}_{key} gauge")
+                    lines.append(f"{prefix}_{key} {value}")
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+MESSAGE_LATENCY = REGISTRY.register(Histogram(
+    'bot_message_latency_seconds', 'End-to-end handle_support_message latency'))
+ACTIONS = REGISTRY.register(Counter(
+    'bot_actions_total', 'Responses sent by action', ['action']))
+LLM_LATENCY = REGISTRY.register(Histogram(
+    'llm_request_latency_seconds', 'Gemini call latency'))
+LLM_ERRORS = REGISTRY.register(Counter(
+    'llm_request_errors_total', 'Failed or shed Gemini calls', ['reason']))
+SOAP_LATENCY = REGISTRY.register(Histogram(
+    'mantis_soap_latency_seconds', 'MantisConnect SOAP call latency', ['operation']))
+SOAP_ERRORS = REGISTRY.register(Counter(
+    'mantis_soap_errors_total', 'Failed MantisConnect SOAP calls', ['operation']))
+DB_QUERY_TIME = REGISTRY.register(Histogram(
+    'db_query_seconds', 'SQLite time per DatabaseHandler operation', ['operation']))
+LOOP_LAG = REGISTRY.register(Histogram(
+    'event_loop_lag_seconds', 'Delay of event loop wake-ups beyond their schedule'))
+SCHEDULER_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'scheduler_queue_depth', 'Messages waiting for admission per priority class', ['priority']))
+SCHEDULER_WAIT = REGISTRY.register(Histogram(
+    'scheduler_wait_seconds', 'Time from arrival to admission per priority class', ['priority']))
+SCHEDULER_SHED = REGISTRY.register(Counter(
+    'scheduler_shed_total', 'Messages turned away because their class queue was full', ['priority']))
+REPLY_DELAY = REGISTRY.register(Histogram(
+    'reply_queue_delay_seconds', 'Time replies wait in the outbound Discord queue'))
+LLM_FIRST_TEXT = REGISTRY.register(Histogram(
+    'llm_stream_first_text_seconds', 'Time from starting a streamed Gemini call until reply text arrives'))
+STREAM_FIRST_VISIBLE = REGISTRY.register(Histogram(
+    'stream_first_visible_seconds', 'Time from starting a streamed reply until its preview is on Discord'))
+STREAM_COMPLETE = REGISTRY.register(Histogram(
+    'stream_complete_seconds', 'Time from starting a streamed reply until its final version is on Discord'))
+
+class EventLoopLagMonitor:
+    """Measures how late a periodic sleep wakes up, i.e. how long the loop was blocked"""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            LOOP_LAG.observe(max(0.0, loop.time() - scheduled))
+
+class MetricsServer:
+    """Minimal HTTP server exposing the registry on GET /metrics"""
+
+    def __init__(self, registry: Registry, host: str = '127.0.0.1', port: int = 9100):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        print(f"Metrics available on http://{self.host}:{self.port}/metrics")
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Drain headers; the request body is never needed
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b'\r\n', b'\n', b''):
+                pass
+
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body = '200 OK', self.registry.render().encode('utf-8')
+            else:
+                status, body = '404 Not Found', b'Not Found\n'
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode('latin-1') + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
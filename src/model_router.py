@@ -0,0 +1,220 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+class _LostRace(Exception):
+    """A streamed attempt produced output after another attempt had already started streaming"""
+
+class ModelBackend:
+    """One model behind the router, with rolling latency and error statistics"""
+
+    def __init__(self, name: str, model, tier: int = 0, window: int = 200):
+        # model needs Gemini's generate_content_async(prompt, stream=...) interface
+        self.name = name
+        self.model = model
+        # 0 is the cheapest/fastest; higher tiers are stronger models
+        self.tier = tier
+
+        self._latencies: deque = deque(maxlen=window)
+        # Streamed calls are hedged on time to first chunk, so that is tracked separately
+        self._first_chunk: deque = deque(maxlen=window)
+        self._outcomes: deque = deque(maxlen=50)
+        self.stats = {'calls': 0, 'errors': 0, 'hedges': 0, 'hedge_wins': 0, 'hedges_skipped': 0,
+                      'cancelled': 0, 'censored': 0}
+
+    def record(self, latency: Optional[float], first_chunk: Optional[float] = None):
+        """Record a finished call; latency None means it failed"""
+        self.stats['calls'] += 1
+        self._outcomes.append(latency is not None)
+        if latency is None:
+            self.stats['errors'] += 1
+        else:
+            self._latencies.append(latency)
+            if first_chunk is not None:
+                self._first_chunk.append(first_chunk)
+
+    def record_censored(self, elapsed: float, streaming: bool = False):
+        """Record a call abandoned after elapsed seconds; its latency was at least that"""
+        self.stats['censored'] += 1
+        self._latencies.append(elapsed)
+        if streaming:
+            self._first_chunk.append(elapsed)
+
+    def latency_quantile(self, quantile: float, min_samples: int, first_chunk: bool = False) -> Optional[float]:
+        """Latency (or time to first chunk) at the given quantile of recent successful calls
+
+        None until there are at least min_samples calls to go on.
+        """
+        samples = self._first_chunk if first_chunk else self._latencies
+        if len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+    @property
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+class ModelRouter:
+    """Routes each call to the model tier its length calls for, hedging slow calls
+
+    Short messages go to the cheapest tier and long ones to the strongest.
+    Health and measured latency choose between models within that tier, and
+    fall back to the nearest other tier only when the whole tier is unhealthy.
+    """
+
+    def __init__(self, backends: Sequence[ModelBackend], short_message_chars: int = 280,
+                 hedging: bool = True, hedge_quantile: float = 0.95, hedge_delay: float = 3.0,
+                 min_hedge_delay: float = 0.5, min_samples: int = 20, max_error_rate: float = 0.5):
+        if not backends:
+            raise ValueError("ModelRouter needs at least one backend")
+        self.backends = list(backends)
+        self.short_message_chars = short_message_chars
+        self.hedging = hedging
+        self.hedge_quantile = hedge_quantile
+        # Used until a model has min_samples latencies to compute its quantile from
+        self.hedge_delay = hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+
+    def expected_latency(self, backend: ModelBackend) -> float:
+        """p95 latency scaled up by the error rate, since a failed call costs a retry
+
+        A model with no successful calls yet counts as instant, so it gets
+        tried and measured rather than never being chosen.
+        """
+        p95 = backend.latency_quantile(self.hedge_quantile, 1)
+        if p95 is None:
+            return 0.0
+        return p95 / max(0.05, 1 - backend.error_rate)
+
+    def choose(self, message: str) -> Tuple[ModelBackend, Optional[ModelBackend]]:
+        """Primary model for a message and the model to hedge on (None disables hedging)"""
+        tiers = [backend.tier for backend in self.backends]
+        preferred = min(tiers) if len(message) <= self.short_message_chars else max(tiers)
+
+        def rank(backend: ModelBackend):
+            unhealthy = backend.error_rate > self.max_error_rate
+            return unhealthy, abs(backend.tier - preferred), self.expected_latency(backend)
+
+        ranked = sorted(self.backends, key=rank)
+        if not self.hedging:
+            return ranked[0], None
+        # With a single model the hedge is a second request to the same model
+        return ranked[0], ranked[1] if len(ranked) > 1 else ranked[0]
+
+    def hedge_after(self, backend: ModelBackend, streaming: bool = False) -> float:
+        """Seconds to wait on a call (or on its first chunk, when streaming) before hedging it"""
+        p95 = backend.latency_quantile(self.hedge_quantile, self.min_samples, first_chunk=streaming)
+        return max(self.min_hedge_delay, p95 if p95 is not None else self.hedge_delay)
+
+    async def generate(self, prompt: str, message: str = '',
+                       on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
+                       slots: Optional[asyncio.Semaphore] = None):
+        """Run the call, hedging it if it is slow or fails, and return the first successful response
+
+        With on_chunk the reply is streamed; the first attempt to produce a
+        chunk owns the stream and the other attempt is abandoned. The caller
+        already holds one of slots for the call; a hedge next to a running
+        attempt needs another, and is skipped when none is free.
+        """
+        primary, hedge = self.choose(message)
+        streaming = on_chunk is not None
+        delay = self.hedge_after(primary, streaming)
+        streaming_owner: List[ModelBackend] = []
+
+        def claim(backend: ModelBackend) -> bool:
+            if not streaming_owner:
+                streaming_owner.append(backend)
+            return streaming_owner[0] is backend
+
+        first = asyncio.create_task(self._attempt(primary, prompt, on_chunk, claim, delay))
+        tasks: Dict[asyncio.Task, ModelBackend] = {first: primary}
+        hedged = hedge is None
+        last_error: Optional[BaseException] = None
+        try:
+            while True:
+                done, _ = await asyncio.wait(
+                    tasks, timeout=None if hedged else delay,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    backend = tasks.pop(task)
+                    try:
+                        response = task.result()
+                    except Exception as e:
+                        if not isinstance(e, _LostRace):
+                            last_error = e
+                        continue
+                    if task is not first:
+                        backend.stats['hedge_wins'] += 1
+                    return response
+
+                # Slow or failed; a reply that is already streaming can't be hedged
+                if not hedged and not streaming_owner:
+                    # A failed primary hands its slot over; a slow one still holds it
+                    if tasks and slots is not None and slots.locked():
+                        hedge.stats['hedges_skipped'] += 1
+                    else:
+                        extra_slot = bool(tasks) and slots is not None
+                        if extra_slot:
+                            await slots.acquire()
+                        task = asyncio.create_task(self._attempt(hedge, prompt, on_chunk, claim, delay))
+                        if extra_slot:
+                            task.add_done_callback(lambda _: slots.release())
+                        hedge.stats['hedges'] += 1
+                        tasks[task] = hedge
+                hedged = True
+                if not tasks:
+                    raise last_error or RuntimeError("Every model attempt failed")
+        finally:
+            # Cancel the loser (or everything, if the caller timed out)
+            for task, backend in tasks.items():
+                task.cancel()
+                backend.stats['cancelled'] += 1
+
+    async def _attempt(self, backend: ModelBackend, prompt: str,
+                       on_chunk: Optional[Callable[[str], Awaitable[None]]],
+                       claim: Callable[[ModelBackend], bool], censor_after: float):
+        started = time.perf_counter()
+        first_chunk = None
+        try:
+            if on_chunk is None:
+                response = await backend.model.generate_content_async(prompt)
+            else:
+                response = await backend.model.generate_content_async(prompt, stream=True)
+                async for chunk in response:
+                    if not claim(backend):
+                        raise _LostRace()
+                    if first_chunk is None:
+                        first_chunk = time.perf_counter() - started
+                    await on_chunk(chunk.text)
+        except asyncio.CancelledError:
+            # Abandoned after at least the hedge delay: a slow call that would
+            # otherwise never show up in this model's latency
+            elapsed = time.perf_counter() - started
+            if elapsed >= censor_after:
+                backend.record_censored(elapsed, streaming=on_chunk is not None and first_chunk is None)
+            raise
+        except _LostRace:
+            raise
+        except Exception:
+            backend.record(None)
+            raise
+        backend.record(time.perf_counter() - started, first_chunk)
+        return response
+
+    def backend_stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-model counters plus current p95 latency and error rate"""
+        return {
+            backend.name: dict(
+                backend.stats,
+                p95_latency=backend.latency_quantile(self.hedge_quantile, 1) or 0.0,
+                error_rate=backend.error_rate
+            )
+            for backend in self.backends
+        }
@@ -0,0 +1,230 @@
+import asyncio
+import random
+import time
+from typing import Optional, Dict, Any, Set, Tuple
+
+from database import DatabaseHandler
+from mantis_client import MantisHubClient
+from ticket_batcher import TicketBatcher
+
+# Appended to every ticket description, so a creation with an unknown outcome can be found again
+REFERENCE_MARKER = "(Bot reference: {})"
+
+class CircuitBreaker:
+    """Stops delivery attempts for a cooldown after repeated consecutive failures"""
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    def allow(self) -> bool:
+        """True when closed, or half-open after the cooldown has passed"""
+        if self.opened_at is None:
+            return True
+        return time.monotonic() - self.opened_at >= self.cooldown
+
+    @property
+    def half_open(self) -> bool:
+        """Open, but past the cooldown: one test request decides whether to close"""
+        return self.opened_at is not None and self.allow()
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                print(f"⚠️ Mantis circuit breaker open after {self.failures} failures")
+            self.opened_at = time.monotonic()
+
+class MantisOutbox:
+    """Durable, retried delivery of ticket creations and notes to Mantis"""
+
+    def __init__(self, db: DatabaseHandler, mantis_client: MantisHubClient, ticket_batcher: TicketBatcher,
+                 poll_interval: float = 10, batch_size: int = 20, max_attempts: int = 12,
+                 base_backoff: float = 5, max_backoff: float = 1800,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.db = db
+        self.mantis_client = mantis_client
+        self.ticket_batcher = ticket_batcher
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker(failure_threshold=5, cooldown=60)
+
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        # Entries currently being delivered, so a wake-up never sends one twice
+        self._in_flight: Set[int] = set()
+
+        self.stats = {'delivered': 0, 'retried': 0, 'gave_up': 0, 'deferred': 0, 'skipped_open_circuit': 0,
+                      'found_existing': 0}
+
+    def start(self):
+        """Start the background delivery worker"""
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop the delivery worker; undelivered entries stay queued in SQLite"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit_ticket(self, discord_user_id: str, idempotency_key: str, summary: str, description: str,
+                            reporter_name: str, category: str = "General", priority: int = 30,
+                            report: Optional[str] = None) -> str:
+        """Queue a ticket for delivery and return its provisional reference immediately
+
+        report is the user's own message, used to group duplicate reports.
+        """
+        marker = REFERENCE_MARKER.format(idempotency_key)
+        payload = {
+            'summary': summary,
+            'description': f"{description}\n\n{marker}",
+            'marker': marker,
+            'reporter_name': reporter_name,
+            'category': category,
+            'priority': priority,
+            'report': report,
+        }
+        reference = await self.db.enqueue_ticket_async(discord_user_id, idempotency_key, payload, summary)
+        self._notify()
+        return reference
+
+    async def submit_note(self, idempotency_key: str, ticket_ref: str, note: str) -> int:
+        """Queue a note for a ticket, which may still be a provisional reference"""
+        outbox_id = await self.db.enqueue_outbox_async('add_note', idempotency_key, {'ticket_ref': ticket_ref, 'note': note})
+        self._notify()
+        return outbox_id
+
+    def _notify(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.deliver_due()
+            except Exception as e:
+                print(f"Error delivering Mantis outbox: {e}")
+
+    async def deliver_due(self):
+        """Deliver every entry whose next attempt is due"""
+        if not self.breaker.allow():
+            self.stats['skipped_open_circuit'] += 1
+            return
+
+        limit = self.batch_size
+        if self.breaker.half_open:
+            # Only a single test request while Mantis may still be down
+            if self._in_flight:
+                return
+            limit = 1
+
+        entries = [entry for entry in await self.db.get_due_outbox_async(limit)
+                   if entry[0] not in self._in_flight]
+        await asyncio.gather(*(self._deliver(*entry) for entry in entries))
+
+    async def _deliver(self, outbox_id: int, kind: str, payload: Dict[str, Any], attempts: int):
+        self._in_flight.add(outbox_id)
+        try:
+            note = None
+            if kind == 'create_ticket':
+                result, is_new, error = await self._create_ticket(payload, attempts)
+                if result and not is_new:
+                    # Merged into a recent ticket: the report goes on it as a queued note
+                    note = f"Also reported by Discord user {payload['reporter_name']}:\n\n{payload['description']}"
+            elif kind == 'add_note':
+                state, ticket_id = await self.resolve_reference(payload['ticket_ref'])
+                if state != 'created':
+                    # Waiting on our own queue says nothing about Mantis' health
+                    await self._defer_note(outbox_id, payload['ticket_ref'], state)
+                    return
+                added = await self.mantis_client.add_note_to_ticket_async(ticket_id, payload['note'])
+                result, error = (ticket_id, None) if added else (None, "Mantis rejected the note")
+            else:
+                result, error = None, f"Unknown outbox kind {kind!r}"
+
+            if result:
+                if note is None:
+                    self.breaker.record_success()
+                await self.db.mark_outbox_delivered_async(outbox_id, str(result), note)
+                self.stats['delivered'] += 1
+                if note is not None:
+                    self._notify()
+                return
+
+            self.breaker.record_failure()
+            if attempts + 1 >= self.max_attempts:
+                print(f"❌ Giving up on outbox entry {outbox_id}: {error}")
+                await self.db.mark_outbox_failed_async(outbox_id, error, None)
+                self.stats['gave_up'] += 1
+            else:
+                # Exponential backoff with full jitter
+                delay = random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempts)))
+                await self.db.mark_outbox_failed_async(outbox_id, error, time.time() + delay)
+                self.stats['retried'] += 1
+        finally:
+            self._in_flight.discard(outbox_id)
+
+    async def _create_ticket(self, payload: Dict[str, Any], attempts: int) -> Tuple[Optional[str], bool, Optional[str]]:
+        """Create the ticket unless an earlier attempt already did; returns (ticket_id, is_new, error)"""
+        payload = dict(payload)
+        marker = payload.pop('marker', None)
+        if attempts and marker:
+            # A timed-out add may still have created the issue, so look for it before adding again
+            try:
+                existing = await self.mantis_client.find_ticket_by_text_async(marker)
+            except Exception as e:
+                return None, True, f"Could not check Mantis for an earlier attempt: {e}"
+            if existing:
+                self.stats['found_existing'] += 1
+                return existing, True, None
+        result, is_new = await self.ticket_batcher.submit(**payload)
+        return result, is_new, None if result else "Mantis did not return a ticket id"
+
+    async def _defer_note(self, outbox_id: int, ticket_ref: str, state: str):
+        """Retry a note once its ticket is delivered, or give up if the ticket never will be"""
+        if state != 'pending':
+            print(f"❌ Giving up on outbox entry {outbox_id}: ticket {ticket_ref} was never created")
+            await self.db.mark_outbox_failed_async(outbox_id, f"Ticket {ticket_ref} was never created", None)
+            self.stats['gave_up'] += 1
+            return
+        await self.db.defer_outbox_async(outbox_id, time.time() + self.poll_interval)
+        self.stats['deferred'] += 1
+
+    async def resolve_reference(self, ticket_ref: str) -> Tuple[str, Optional[str]]:
+        """State of a ticket reference and its real Mantis id, if it has one
+
+        The state is 'created' once the ticket is in Mantis, 'pending' while it
+        is still queued, 'failed' if delivery gave up and 'unknown' for a
+        provisional reference the outbox has no entry for.
+        """
+        if not ticket_ref.upper().startswith('P-'):
+            return 'created', ticket_ref
+        try:
+            entry = await self.db.get_outbox_entry_async(int(ticket_ref[2:]))
+        except ValueError:
+            entry = None
+        if entry is None:
+            return 'unknown', None
+        if entry[0] == 'delivered':
+            return 'created', entry[1]
+        return entry[0], None
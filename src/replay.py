@@ -0,0 +1,544 @@
+"""Offline replay benchmark for the support message path
+
+Feeds a JSONL message stream through the bot's admission scheduler and
+handle_support_message with fake Discord objects, a Gemini stub and an
+in-process fake Mantis SOAP service, then reports throughput, latency
+percentiles, event loop blocking and call counts. Nothing leaves the
+machine, so runs are comparable across changes.
+
+    python replay.py messages.jsonl --llm-latency lognormal:1.2,0.4
+    python replay.py --synthetic 300 --llm-latency lognormal:0.6,0.8 --llm-latency lognormal:2,0.3
+    python replay.py --synthetic 500 --users 50 --json results.json
+    python replay.py --synthetic 300 --channels 2 --direct-replies
+
+The fake Discord channels enforce the per-channel limit of 5 sends and 5
+edits per 5 seconds, sleeping through a 429 like discord.py does, so the
+outbound reply queue can be compared against replying inline.
+
+Each input line is an object with "content" and optionally "user_id",
+"at" (seconds from the start of the replay) and "reply" (the JSON object
+the Gemini stub should answer with for this message).
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+from config import Config
+from metrics import DB_QUERY_TIME, LLM_LATENCY, REPLY_DELAY, SOAP_LATENCY, STREAM_COMPLETE, STREAM_FIRST_VISIBLE
+
+SYNTHETIC_MESSAGES = [
+    "My washing machine won't drain, there's water sitting in the drum",
+    "Detergent is not dispensing from the drawer",
+    "The machine makes a loud banging noise during the spin cycle",
+    "My clothes aren't getting clean anymore",
+    "The washer won't start at all, no lights on the panel",
+    "Water is leaking from underneath the machine",
+    "Display shows error code E21 and stops mid cycle",
+    "The door is locked and won't open after the wash finished",
+    "It smells like something is burning when it runs",
+    "The water never gets hot even on the 60 degree program",
+    "Drum doesn't spin but I can hear the motor humming",
+    "How often should I clean the filter?",
+]
+
+def parse_distribution(spec: str, rng: random.Random) -> Callable[[], float]:
+    """Sampler for a latency spec: const:S, uniform:A,B, normal:MEAN,SD, lognormal:MEDIAN,SIGMA or exp:MEAN"""
+    kind, _, args = spec.partition(':')
+    values = [float(value) for value in args.split(',') if value]
+    if kind == 'const':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == 'normal':
+        return lambda: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == 'lognormal':
+        mu = math.log(values[0])
+        return lambda: rng.lognormvariate(mu, values[1])
+    if kind == 'exp':
+        return lambda: rng.expovariate(1 / values[0])
+    raise ValueError(f"Unknown latency distribution {spec!r}")
+
+def percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+# Fake Discord
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.display_name = f"user{user_id}"
+        self.mention = f"<@{user_id}>"
+        self.bot = False
+
+class _Typing:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+# Discord's per-channel limit, applied separately to sends and to edits
+DISCORD_CHANNEL_RATE = 5
+DISCORD_CHANNEL_PERIOD = 5.0
+
+class FakeChannel:
+    """Channel whose requests take a sampled Discord API latency and are rate limited like Discord's"""
+
+    def __init__(self, channel_id: int, api_latency: Callable[[], float]):
+        self.id = channel_id
+        self.api_latency = api_latency
+        self.sent = 0
+        self.edits = 0
+        # Replies that reached users: one per embed of a coalesced send
+        self.delivered = 0
+        self.last_delivery_at = 0.0
+        self.rate_limited = 0
+        self.rate_limited_seconds = 0.0
+        self._windows = {'send': deque(), 'edit': deque()}
+
+    def typing(self):
+        return _Typing()
+
+    async def request(self, kind: str):
+        """One API round trip; a 429 costs a wasted round trip plus the retry_after wait"""
+        window = self._windows[kind]
+        while True:
+            await asyncio.sleep(self.api_latency())
+            now = time.perf_counter()
+            while window and now - window[0] >= DISCORD_CHANNEL_PERIOD:
+                window.popleft()
+            if len(window) < DISCORD_CHANNEL_RATE:
+                window.append(now)
+                return
+            retry_after = window[0] + DISCORD_CHANNEL_PERIOD - now
+            self.rate_limited += 1
+            self.rate_limited_seconds += retry_after
+            await asyncio.sleep(retry_after)
+
+    async def send(self, content=None, embeds=None, **kwargs):
+        await self.request('send')
+        self.sent += 1
+        self.delivered += len(embeds) if embeds else 1
+        self.last_delivery_at = time.perf_counter()
+        return FakeMessage(next(_message_ids), FakeUser(0), self, content or '')
+
+class FakeMessage:
+    def __init__(self, message_id: int, author: FakeUser, channel: FakeChannel, content: str):
+        self.id = message_id
+        self.author = author
+        self.channel = channel
+        self.content = content
+        self.first_reply_at: Optional[float] = None
+
+    def answered(self):
+        if self.first_reply_at is None:
+            self.first_reply_at = time.perf_counter()
+
+    async def reply(self, content=None, **kwargs):
+        sent = await self.channel.send(content, **kwargs)
+        self.answered()
+        return sent
+
+    async def edit(self, **kwargs):
+        await self.channel.request('edit')
+        self.channel.edits += 1
+        return self
+
+_message_ids = itertools.count(1)
+
+# Gemini stub
+
+class _StubUsage:
+    def __init__(self, prompt: str, text: str):
+        self.prompt_token_count = (len(prompt) + 3) // 4
+        self.candidates_token_count = (len(text) + 3) // 4
+
+class _StubChunk:
+    def __init__(self, text: str):
+        self.text = text
+
+class _StubStream:
+    """Async-iterable response that releases its text in chunks over the sampled latency"""
+
+    def __init__(self, text: str, prompt: str, latency: float, chunks: int):
+        self.text = text
+        self.usage_metadata = _StubUsage(prompt, text)
+        self._latency = latency
+        self._chunks = chunks
+
+    async def __aiter__(self):
+        size = max(1, -(-len(self.text) // self._chunks))
+        for start in range(0, len(self.text), size):
+            await asyncio.sleep(self._latency / self._chunks)
+            yield _StubChunk(self.text[start:start + size])
+
+class StubGeminiModel:
+    """Stand-in for genai.GenerativeModel with a configurable latency distribution"""
+
+    def __init__(self, latency: Callable[[], float], replies: Optional[Dict[str, dict]] = None,
+                 rng: Optional[random.Random] = None, error_rate: float = 0.0, chunks: int = 8,
+                 blocking: bool = False):
+        self.latency = latency
+        # Reply objects keyed by user message; other messages get a generated reply
+        self.replies = replies or {}
+        self.rng = rng or random.Random(0)
+        self.error_rate = error_rate
+        self.chunks = chunks
+        # Block the event loop for the whole call, like the old synchronous generate_content
+        self.blocking = blocking
+        self.calls = 0
+
+    async def generate_content_async(self, prompt: str, stream: bool = False):
+        self.calls += 1
+        text = json.dumps(self._reply_for(prompt))
+        latency = self.latency()
+        if self.blocking:
+            time.sleep(latency)
+            latency = 0.0
+        if self.rng.random() < self.error_rate:
+            await asyncio.sleep(latency)
+            raise RuntimeError("Stub Gemini error")
+        if stream:
+            return _StubStream(text, prompt, latency, self.chunks)
+        await asyncio.sleep(latency)
+        return SimpleNamespace(text=text, usage_metadata=_StubUsage(prompt, text))
+
+    def _reply_for(self, prompt: str) -> dict:
+        message = prompt.rsplit("Current user message: ", 1)[-1].split("\n\nRespond with JSON only:", 1)[0]
+        if message in self.replies:
+            return self.replies[message]
+        # Deterministic mix of actions so every reply path is exercised
+        if any(word in message.lower() for word in ('leak', 'error', 'burning', 'humming', 'locked')):
+            return {
+                "action": "create_ticket",
+                "response": "This needs a technician, so I'm opening a support ticket for you.",
+                "ticket_summary": message[:60],
+                "category": "Hardware",
+                "priority": 20,
+            }
+        return {
+            "action": "troubleshoot",
+            "response": "Try these steps: check the filter, make sure the hose isn't kinked, then run a rinse cycle. " * 3,
+            "category": "Maintenance",
+            "priority": 40,
+        }
+
+# Fake Mantis
+
+class FakeMantisService:
+    """In-process stand-in for the MantisConnect SOAP operations the client uses"""
+
+    def __init__(self, latency: Callable[[], float], error_rate: float, rng: random.Random):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = rng
+        self._lock = threading.Lock()
+        self._issues: Dict[int, dict] = {}
+        self.notes: Dict[int, List[dict]] = {}
+        self._ids = itertools.count(1000)
+
+    def _respond(self):
+        # Runs on the client's SOAP worker threads, like a blocking HTTP call
+        time.sleep(self.latency())
+        with self._lock:
+            failed = self.rng.random() < self.error_rate
+        if failed:
+            raise requests.ConnectionError("Stub Mantis connection reset")
+
+    def mc_issue_add(self, username, password, issue):
+        self._respond()
+        with self._lock:
+            issue_id = next(self._ids)
+            self._issues[issue_id] = issue
+        return issue_id
+
+    def mc_issue_note_add(self, username, password, issue_id, note):
+        self._respond()
+        with self._lock:
+            self.notes.setdefault(issue_id, []).append(note)
+            return next(self._ids)
+
+    def mc_issue_get(self, username, password, issue_id):
+        self._respond()
+        with self._lock:
+            issue = self._issues.get(issue_id)
+        if issue is None:
+            return None
+        return SimpleNamespace(
+            id=issue_id,
+            summary=issue['summary'],
+            description=issue['description'],
+            status=SimpleNamespace(name='new'),
+            priority=SimpleNamespace(name='normal'),
+            handler=None
+        )
+
+    def mc_filter_search_issue_ids(self, username, password, filter, page_number, per_page):
+        self._respond()
+        # Like Mantis, every word has to appear somewhere in the issue
+        words = filter['search'].lower().split()
+        with self._lock:
+            matches = [issue_id for issue_id, issue in self._issues.items()
+                       if all(word in f"{issue['summary']} {issue['description']}".lower() for word in words)]
+        start = (page_number - 1) * per_page
+        return matches[start:start + per_page]
+
+    def mc_project_get_categories(self, username, password, project_id):
+        self._respond()
+        return ['General', 'Hardware', 'Maintenance', 'Software']
+
+    def mc_projects_get_user_accessible(self, username, password):
+        self._respond()
+        return []
+
+# Replay
+
+def load_messages(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def synthetic_messages(count: int, users: int, rate: float, rng: random.Random) -> List[Dict[str, Any]]:
+    """Poisson arrivals at `rate` messages per second (0 sends them all at once)"""
+    messages, at = [], 0.0
+    for _ in range(count):
+        if rate > 0:
+            at += rng.expovariate(rate)
+        messages.append({'user_id': rng.randrange(users) + 1, 'content': rng.choice(SYNTHETIC_MESSAGES), 'at': at})
+    return messages
+
+class LoopBlockingSampler:
+    """Samples how late short sleeps wake up to measure event loop blocking"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - scheduled))
+
+async def replay(messages: List[Dict[str, Any]], args) -> Dict[str, Any]:
+    import bot
+    from database import DatabaseHandler
+    from llm_handler import LLMHandler
+    from mantis_client import MantisHubClient
+    from model_router import ModelBackend, ModelRouter
+    from response_cache import ResponseCache
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='replay-')
+    db = DatabaseHandler(os.path.join(workdir, 'replay.db'), history_retention=Config.SESSION_HISTORY_RETENTION)
+    response_cache = ResponseCache(
+        db if Config.RESPONSE_CACHE_PERSIST else None,
+        max_entries=Config.RESPONSE_CACHE_MAX_ENTRIES,
+        ttl=Config.RESPONSE_CACHE_TTL,
+        similarity_threshold=Config.RESPONSE_CACHE_SIMILARITY
+    )
+    replies = {message['content']: message['reply'] for message in messages if 'reply' in message}
+    # One stub per --llm-latency, cheapest first, behind the real router
+    models = [StubGeminiModel(parse_distribution(spec, rng), replies, rng, args.llm_error_rate,
+                              blocking=args.blocking_llm)
+              for spec in args.llm_latency or ['lognormal:1.0,0.5']]
+    router = ModelRouter(
+        [ModelBackend(f"stub{tier}", model, tier=tier) for tier, model in enumerate(models)],
+        short_message_chars=Config.LLM_SHORT_MESSAGE_CHARS,
+        hedging=Config.LLM_HEDGING,
+        hedge_quantile=Config.LLM_HEDGE_QUANTILE,
+        hedge_delay=Config.LLM_HEDGE_DELAY,
+        min_hedge_delay=Config.LLM_HEDGE_MIN_DELAY
+    )
+    llm = LLMHandler(response_cache=response_cache, router=router)
+    service = FakeMantisService(parse_distribution(args.soap_latency, rng), args.soap_error_rate, rng)
+    mantis = MantisHubClient(soap_url='fake://mantis', client=SimpleNamespace(service=service))
+    bot.configure(db, llm, mantis)
+    bot.start_components()
+    bot.reply_queue.enabled = not args.direct_replies
+    queue_reply = bot.reply_queue.reply
+
+    async def reply_and_track(message, **kwargs):
+        # A coalesced send answers several messages, so time each one by its own reply
+        delivered = await queue_reply(message, **kwargs)
+        delivered.add_done_callback(lambda _: message.answered())
+        return delivered
+
+    bot.reply_queue.reply = reply_and_track
+
+    discord_latency = parse_distribution(args.discord_latency, rng)
+    channels = [FakeChannel(channel_id, discord_latency) for channel_id in range(1, args.channels + 1)]
+    sampler = LoopBlockingSampler()
+    sampler.start()
+
+    # Messages from one user are handled in order, as the coalescer would
+    user_locks: Dict[Any, asyncio.Lock] = {}
+    latencies: List[float] = []
+    handled: List[tuple] = []
+
+    async def handle(entry: Dict[str, Any]):
+        if args.speed > 0:
+            await asyncio.sleep(entry.get('at', 0) / args.speed)
+        user_id = entry.get('user_id', 1)
+        channel = channels[user_id % len(channels)]
+        message = FakeMessage(next(_message_ids), FakeUser(user_id), channel, entry['content'])
+        async with user_locks.setdefault(user_id, asyncio.Lock()):
+            started = time.perf_counter()
+            await bot.handle_message_burst([message])
+            latencies.append(time.perf_counter() - started)
+            handled.append((message, started))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(handle(entry) for entry in messages))
+    elapsed = time.perf_counter() - started
+    await bot.reply_queue.drain()
+    # Handlers finish before queued replies do, so delivery is timed separately
+    delivery_elapsed = max(channel.last_delivery_at for channel in channels) - started
+    delivered = sum(channel.delivered for channel in channels)
+    queued, queue_delay = REPLY_DELAY.totals().get((), (0, 0.0))
+    first_reply = [message.first_reply_at - started for message, started in handled
+                   if message.first_reply_at is not None]
+
+    # Give the outbox a chance to deliver queued tickets before measuring SOAP work
+    drain_deadline = time.monotonic() + args.drain_timeout
+    while await db.get_due_outbox_async(1) and time.monotonic() < drain_deadline:
+        await asyncio.sleep(0.05)
+
+    await sampler.close()
+    await bot.close_components()
+
+    return {
+        'messages': len(messages),
+        'elapsed_seconds': elapsed,
+        'throughput_per_second': len(messages) / elapsed if elapsed else 0.0,
+        # Time each handler held its user's lock and scheduler slot
+        'latency_seconds': {name: percentile(latencies, fraction)
+                            for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('max', 1.0))},
+        'first_reply_seconds': {name: percentile(first_reply, fraction)
+                                for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))},
+        'loop_blocking': {
+            'total_seconds': sum(sampler.lags),
+            'max_seconds': max(sampler.lags, default=0.0),
+            'p99_seconds': percentile(sampler.lags, 0.99),
+        },
+        'gemini_calls': sum(model.calls for model in models),
+        'models': router.backend_stats(),
+        'gemini_seconds': sum(total for _, total in LLM_LATENCY.totals().values()),
+        'discord_sends': sum(channel.sent for channel in channels),
+        'discord_edits': sum(channel.edits for channel in channels),
+        'delivered_replies': delivered,
+        'delivered_per_second': delivered / delivery_elapsed if delivery_elapsed > 0 else 0.0,
+        'rate_limited': sum(channel.rate_limited for channel in channels),
+        'rate_limited_seconds': sum(channel.rate_limited_seconds for channel in channels),
+        'reply_queue_mean_delay_seconds': queue_delay / queued if queued else 0.0,
+        'stream_first_visible_mean_seconds': mean_observation(STREAM_FIRST_VISIBLE),
+        'stream_complete_mean_seconds': mean_observation(STREAM_COMPLETE),
+        'reply_queue': dict(bot.reply_queue.stats),
+        'db_calls': {key[0]: count for key, (count, _) in sorted(DB_QUERY_TIME.totals().items())},
+        'soap_calls': {key[0]: count for key, (count, _) in sorted(SOAP_LATENCY.totals().items())},
+        'outbox': dict(bot.mantis_outbox.stats),
+        'scheduler': dict(bot.admission_scheduler.stats),
+        'response_cache_hit_rate': response_cache.hit_rate,
+        'intent_classifier': dict(llm.intent_classifier.stats),
+    }
+
+def mean_observation(histogram) -> float:
+    count, total = histogram.totals().get((), (0, 0.0))
+    return total / count if count else 0.0
+
+def print_report(results: Dict[str, Any]):
+    latency, first = results['latency_seconds'], results['first_reply_seconds']
+    blocking = results['loop_blocking']
+    print(f"Messages:        {results['messages']} in {results['elapsed_seconds']:.2f}s "
+          f"({results['throughput_per_second']:.1f}/s)")
+    print(f"Latency:         p50 {latency['p50']:.3f}s  p95 {latency['p95']:.3f}s  "
+          f"p99 {latency['p99']:.3f}s  max {latency['max']:.3f}s")
+    print(f"First reply:     p50 {first['p50']:.3f}s  p95 {first['p95']:.3f}s  p99 {first['p99']:.3f}s")
+    print(f"Loop blocking:   total {blocking['total_seconds']:.3f}s  max {blocking['max_seconds'] * 1000:.1f}ms  "
+          f"p99 {blocking['p99_seconds'] * 1000:.1f}ms")
+    print(f"Gemini calls:    {results['gemini_calls']} (cache hit rate {results['response_cache_hit_rate']:.0%})")
+    for name, stats in results['models'].items():
+        print(f"Model {name}:".ljust(17) + f"{stats['calls']} calls, {stats['errors']} errors, "
+              f"{stats['hedges']} hedges ({stats['hedge_wins']} won, {stats['hedges_skipped']} skipped), "
+              f"{stats['censored']} censored, p95 {stats['p95_latency']:.3f}s")
+    print(f"Discord:         {results['discord_sends']} sends, {results['discord_edits']} edits, "
+          f"{results['rate_limited']} rate limited ({results['rate_limited_seconds']:.1f}s waited)")
+    print(f"Delivered:       {results['delivered_replies']} replies ({results['delivered_per_second']:.2f}/s)")
+    print(f"Reply queue:     {results['reply_queue']} "
+          f"(mean wait {results['reply_queue_mean_delay_seconds']:.2f}s)")
+    print(f"Streamed:        first visible {results['stream_first_visible_mean_seconds']:.2f}s, "
+          f"complete {results['stream_complete_mean_seconds']:.2f}s (means)")
+    print(f"DB calls:        {results['db_calls']}")
+    print(f"SOAP calls:      {results['soap_calls']}")
+    print(f"Outbox:          {results['outbox']}")
+    print(f"Scheduler:       {results['scheduler']}")
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Replay a message stream through the bot against stubbed services")
+    parser.add_argument('messages', nargs='?', help="JSONL file of messages to replay")
+    parser.add_argument('--synthetic', type=int, default=0, help="Generate this many messages instead of reading a file")
+    parser.add_argument('--users', type=int, default=20, help="Distinct users for synthetic messages")
+    parser.add_argument('--rate', type=float, default=0, help="Synthetic arrival rate per second (0 = all at once)")
+    parser.add_argument('--speed', type=float, default=1.0, help="Replay speed multiplier for 'at' offsets (0 ignores them)")
+    parser.add_argument('--llm-latency', action='append',
+                        help="Gemini latency distribution; repeat to route across several stub models")
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--blocking-llm', action='store_true',
+                        help="Stub Gemini blocks the event loop, as the original synchronous call did")
+    parser.add_argument('--soap-latency', default='lognormal:0.3,0.5', help="Mantis SOAP latency distribution")
+    parser.add_argument('--soap-error-rate', type=float, default=0.0)
+    parser.add_argument('--discord-latency', default='const:0.05', help="Discord API latency distribution")
+    parser.add_argument('--channels', type=int, default=1, help="Spread users over this many channels")
+    parser.add_argument('--direct-replies', action='store_true',
+                        help="Reply inline from the handler instead of through the reply queue")
+    parser.add_argument('--drain-timeout', type=float, default=30, help="Seconds to wait for the outbox to empty")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="Also write the results to this file")
+    return parser
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+
+    if args.synthetic:
+        messages = synthetic_messages(args.synthetic, args.users, args.rate, random.Random(args.seed))
+    elif args.messages:
+        messages = load_messages(args.messages)
+    else:
+        parser.error("give a messages file or --synthetic N")
+
+    results = asyncio.run(replay(messages, args))
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
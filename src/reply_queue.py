@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, Hashable, List, Optional, Set, Tuple
+
+import discord
+
+from metrics import REPLY_DELAY
+
+logger = logging.getLogger(__name__)
+
+# Discord caps a message at 10 embeds and 6000 characters of embed text in total
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000
+
+class _Bucket:
+    """Sliding window allowing `rate` requests in any `per` seconds, like a Discord rate limit"""
+
+    def __init__(self, rate: int, per: float):
+        self.rate = rate
+        self.per = per
+        self._sent: Deque[float] = deque()
+
+    def delay(self) -> float:
+        """Seconds until a request may be made"""
+        now = time.monotonic()
+        while self._sent and now - self._sent[0] >= self.per:
+            self._sent.popleft()
+        return 0.0 if len(self._sent) < self.rate else self._sent[0] + self.per - now
+
+    async def acquire(self):
+        while True:
+            delay = self.delay()
+            if delay <= 0:
+                self._sent.append(time.monotonic())
+                return
+            await asyncio.sleep(delay)
+
+    def sent(self):
+        """Restamp the latest request once it completes, since Discord counts it on arrival"""
+        if self._sent:
+            self._sent[-1] = time.monotonic()
+
+class _PendingReply:
+    __slots__ = ('kind', 'target', 'content', 'embed', 'key', 'future', 'queued_at')
+
+    def __init__(self, kind: str, target, content: Optional[str], embed: Optional[discord.Embed],
+                 key: Optional[Hashable] = None):
+        # 'reply' answers target (a user's message); 'edit' rewrites target (one of ours)
+        self.kind = kind
+        self.target = target
+        self.content = content
+        self.embed = embed
+        # A newer item with the same key replaces this one while it is still queued
+        self.key = key
+        self.future = asyncio.get_running_loop().create_future()
+        self.queued_at = time.monotonic()
+
+    @property
+    def coalescable(self) -> bool:
+        # Keyed messages get edited later, which would wipe the other embeds of a batch
+        return self.kind == 'reply' and self.key is None and self.content is None and self.embed is not None
+
+class ReplyQueue:
+    """Per-channel outbound queue that paces sends to Discord's rate limits and merges pending embeds"""
+
+    def __init__(self, rate: int = 5, per: float = 5, global_rate: int = 50,
+                 max_embeds: int = MAX_EMBEDS_PER_MESSAGE, enabled: bool = True):
+        self.rate = rate
+        self.per = per
+        self.max_embeds = min(max_embeds, MAX_EMBEDS_PER_MESSAGE)
+        # When disabled, replies are sent inline by the caller (for comparison runs)
+        self.enabled = enabled
+
+        self._global = _Bucket(global_rate, 1)
+        self._buckets: Dict[Tuple[int, str], _Bucket] = {}
+        # Sends and edits are separate Discord rate-limit buckets, so each gets its own queue
+        self._queues: Dict[Tuple[int, str], Deque[_PendingReply]] = {}
+        self._workers: Dict[Tuple[int, str], asyncio.Task] = {}
+        self._keyed: Dict[Hashable, _PendingReply] = {}
+        # Strong references so running workers aren't garbage collected
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.stats = {'queued': 0, 'messages_sent': 0, 'coalesced_replies': 0, 'edits': 0,
+                      'replaced': 0, 'failed': 0}
+
+    async def reply(self, message, content: Optional[str] = None, embed: Optional[discord.Embed] = None,
+                    key: Optional[Hashable] = None) -> asyncio.Future:
+        """Queue a reply to message; the returned future resolves to the sent message (None on failure)"""
+        return await self._submit(_PendingReply('reply', message, content, embed, key), message.channel.id)
+
+    async def edit(self, sent_message, content: Optional[str] = None, embed: Optional[discord.Embed] = None,
+                   key: Optional[Hashable] = None) -> asyncio.Future:
+        """Queue an edit of one of the bot's messages"""
+        return await self._submit(_PendingReply('edit', sent_message, content, embed, key), sent_message.channel.id)
+
+    def replace(self, key: Hashable, content: Optional[str] = None, embed: Optional[discord.Embed] = None,
+                last: bool = False) -> bool:
+        """Swap in new content for the queued item with this key; False if it isn't waiting any more
+
+        last=True promises nothing will replace or edit it again, so it may be
+        batched with other replies.
+        """
+        item = self._keyed.get(key)
+        if item is None:
+            return False
+        item.content = content
+        item.embed = embed
+        if last:
+            del self._keyed[key]
+            item.key = None
+        self.stats['replaced'] += 1
+        return True
+
+    async def _submit(self, item: _PendingReply, channel_id: int) -> asyncio.Future:
+        if not self.enabled:
+            await self._deliver([item])
+            return item.future
+
+        if item.key is not None:
+            if self.replace(item.key, item.content, item.embed):
+                return self._keyed[item.key].future
+            self._keyed[item.key] = item
+
+        queue_key = (channel_id, item.kind)
+        self._queues.setdefault(queue_key, deque()).append(item)
+        self.stats['queued'] += 1
+        if queue_key not in self._workers:
+            task = asyncio.create_task(self._drain(queue_key))
+            self._workers[queue_key] = task
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return item.future
+
+    async def _drain(self, queue_key: Tuple[int, str]):
+        queue = self._queues[queue_key]
+        bucket = self._buckets.get(queue_key)
+        if bucket is None:
+            bucket = self._buckets[queue_key] = _Bucket(self.rate, self.per)
+        try:
+            while queue:
+                await bucket.acquire()
+                await self._global.acquire()
+                # Everything that piled up while waiting is eligible for the same message
+                await self._deliver(self._take_batch(queue))
+                bucket.sent()
+        finally:
+            del self._workers[queue_key]
+            if not queue:
+                del self._queues[queue_key]
+
+    def _take_batch(self, queue: Deque[_PendingReply]) -> List[_PendingReply]:
+        batch = [queue.popleft()]
+        if batch[0].key is not None:
+            del self._keyed[batch[0].key]
+        if not batch[0].coalescable:
+            return batch
+        chars = len(batch[0].embed)
+        while queue and queue[0].coalescable and len(batch) < self.max_embeds:
+            size = len(queue[0].embed)
+            if chars + size > MAX_EMBED_CHARS_PER_MESSAGE:
+                break
+            chars += size
+            batch.append(queue.popleft())
+        return batch
+
+    async def _deliver(self, batch: List[_PendingReply]):
+        first = batch[0]
+        try:
+            if first.kind == 'edit':
+                sent = await first.target.edit(content=first.content, embed=first.embed)
+                self.stats['edits'] += 1
+            elif len(batch) == 1:
+                sent = await first.target.reply(content=first.content, embed=first.embed)
+            else:
+                # One message can only reply to one other, so mention everyone it answers
+                mentions = " ".join(dict.fromkeys(item.target.author.mention for item in batch))
+                sent = await first.target.channel.send(
+                    content=mentions,
+                    embeds=[item.embed for item in batch],
+                    allowed_mentions=discord.AllowedMentions(everyone=False, roles=False, users=True)
+                )
+                self.stats['coalesced_replies'] += len(batch)
+            if first.kind != 'edit':
+                self.stats['messages_sent'] += 1
+        except Exception as e:
+            # Keep the channel's worker alive for the replies behind this one
+            logger.warning(f"Could not deliver reply: {e}")
+            self.stats['failed'] += len(batch)
+            sent = None
+
+        now = time.monotonic()
+        for item in batch:
+            REPLY_DELAY.observe(now - item.queued_at)
+            if not item.future.done():
+                item.future.set_result(sent)
+
+    @property
+    def depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def drain(self):
+        """Wait until every queued reply has been delivered"""
+        while True:
+            # Let delivery callbacks queue their follow-ups (e.g. a preview's final edit) first
+            for _ in range(2):
+                await asyncio.sleep(0)
+            if not self._workers:
+                return
+            await asyncio.gather(*list(self._workers.values()), return_exceptions=True)
+
+    async def close(self, timeout: float = 10):
+        """Deliver what is queued (up to timeout seconds), then stop the workers"""
+        try:
+            await asyncio.wait_for(self.drain(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {self.depth} undelivered replies on shutdown")
+        for task in list(self._workers.values()):
+            task.cancel()
@@ -0,0 +1,178 @@
+import hashlib
+import math
+import re
+import time
+from collections import Counter, OrderedDict
+from typing import Optional, Dict, Any, Set
+
+from database import DatabaseHandler
+
+# Words that carry no meaning for matching support questions
+STOPWORDS = {
+    'a', 'an', 'the', 'my', 'is', 'it', 'its', 'i', 'me', 'and', 'or', 'of', 'to', 'in',
+    'on', 'at', 'for', 'with', 'this', 'that', 'be', 'am', 'are', 'was', 'has', 'have',
+    'do', 'does', 'please', 'help', 'hi', 'hello', 'any', 'some', 'can', 'you', 'all',
+    'just', 'really', 'still', 'so', 'very', 'again', 'now', 'anymore',
+}
+
+def normalize_message(text: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace"""
+    text = text.lower().replace("'", "")
+    return ' '.join(re.findall(r'[a-z0-9]+', text))
+
+def context_hash(conversation_history: Optional[list], depth: int = 2) -> str:
+    """Short hash of the last few conversation messages"""
+    if not conversation_history:
+        return ''
+    recent = '\n'.join(f"{msg['role']}:{normalize_message(msg['content'])}"
+                       for msg in conversation_history[-depth:])
+    return hashlib.sha1(recent.encode('utf-8')).hexdigest()[:12]
+
+class _CachedResponse:
+    __slots__ = ('context', 'tokens', 'response', 'latency', 'expires_at')
+
+    def __init__(self, context: str, tokens: Counter, response: Dict[str, Any], latency: float, expires_at: float):
+        self.context = context
+        self.tokens = tokens
+        self.response = response
+        self.latency = latency
+        self.expires_at = expires_at
+
+class ResponseCache:
+    """LLM response cache with exact and TF-IDF near-duplicate matching"""
+
+    def __init__(self, db: Optional[DatabaseHandler] = None, max_entries: int = 1000,
+                 ttl: float = 86400, similarity_threshold: float = 0.85):
+        # db is the optional persistent tier; without it the cache is memory only
+        self.db = db
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+
+        self._entries: "OrderedDict[str, _CachedResponse]" = OrderedDict()
+        # Inverted index and document frequencies for the similarity search
+        self._postings: Dict[str, Set[str]] = {}
+        self._doc_freq: Counter = Counter()
+
+        self.stats = {'exact_hits': 0, 'similar_hits': 0, 'persistent_hits': 0, 'misses': 0,
+                      'saved_api_calls': 0, 'saved_latency_seconds': 0.0}
+
+    @property
+    def hit_rate(self) -> float:
+        hits = self.stats['saved_api_calls']
+        total = hits + self.stats['misses']
+        return hits / total if total else 0.0
+
+    async def get(self, user_message: str, conversation_history: Optional[list] = None) -> Optional[Dict[str, Any]]:
+        """Look up a cached response for this message in this context"""
+        normalized = normalize_message(user_message)
+        context = context_hash(conversation_history)
+        key = f"{context}:{normalized}"
+        now = time.monotonic()
+
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= now:
+            self._remove(key)
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return self._hit('exact_hits', entry)
+
+        entry = self._most_similar(context, self._tokenize(normalized), now)
+        if entry is not None:
+            return self._hit('similar_hits', entry)
+
+        if self.db is not None:
+            stored = await self.db.get_cached_response_async(key)
+            if stored is not None:
+                response, latency, ttl_left = stored
+                entry = self._insert(key, context, normalized, response, latency, now + ttl_left)
+                return self._hit('persistent_hits', entry)
+
+        self.stats['misses'] += 1
+        return None
+
+    async def put(self, user_message: str, conversation_history: Optional[list],
+                  response: Dict[str, Any], latency: float):
+        """Store an LLM response along with how long it took to produce"""
+        normalized = normalize_message(user_message)
+        if not normalized:
+            return
+        context = context_hash(conversation_history)
+        key = f"{context}:{normalized}"
+        self._insert(key, context, normalized, dict(response), latency, time.monotonic() + self.ttl)
+
+        if self.db is not None:
+            await self.db.put_cached_response_async(key, response, latency, self.ttl)
+
+    def _hit(self, kind: str, entry: _CachedResponse) -> Dict[str, Any]:
+        self.stats[kind] += 1
+        self.stats['saved_api_calls'] += 1
+        self.stats['saved_latency_seconds'] += entry.latency
+        # Callers get their own copy of the action/category/priority dict
+        return dict(entry.response)
+
+    @staticmethod
+    def _tokenize(normalized: str) -> Counter:
+        return Counter(word for word in normalized.split() if word not in STOPWORDS)
+
+    def _insert(self, key: str, context: str, normalized: str, response: Dict[str, Any],
+                latency: float, expires_at: float) -> _CachedResponse:
+        if key in self._entries:
+            self._remove(key)
+
+        entry = _CachedResponse(context, self._tokenize(normalized), response, latency, expires_at)
+        self._entries[key] = entry
+        for token in entry.tokens:
+            self._postings.setdefault(token, set()).add(key)
+            self._doc_freq[token] += 1
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+        return entry
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        for token in entry.tokens:
+            keys = self._postings.get(token)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[token]
+            self._doc_freq[token] -= 1
+            if self._doc_freq[token] <= 0:
+                del self._doc_freq[token]
+
+    def _most_similar(self, context: str, tokens: Counter, now: float) -> Optional[_CachedResponse]:
+        """Best cached entry in the same context above the cosine similarity threshold"""
+        if not tokens:
+            return None
+
+        candidates: Set[str] = set()
+        for token in tokens:
+            candidates.update(self._postings.get(token, ()))
+
+        query = self._weights(tokens)
+        query_norm = math.sqrt(sum(w * w for w in query.values()))
+        best_key, best_score = None, self.similarity_threshold
+
+        for key in candidates:
+            entry = self._entries[key]
+            if entry.context != context or entry.expires_at <= now:
+                continue
+            weights = self._weights(entry.tokens)
+            norm = math.sqrt(sum(w * w for w in weights.values()))
+            dot = sum(w * weights.get(token, 0.0) for token, w in query.items())
+            score = dot / (query_norm * norm) if query_norm and norm else 0.0
+            if score >= best_score:
+                best_key, best_score = key, score
+
+        if best_key is None:
+            return None
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key]
+
+    def _weights(self, tokens: Counter) -> Dict[str, float]:
+        total = len(self._entries) + 1
+        return {token: count * (math.log(total / (self._doc_freq.get(token, 0) + 1)) + 1)
+                for token, count in tokens.items()}
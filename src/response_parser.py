@@ -0,0 +1,139 @@
+import json
+import re
+from typing import Dict, Any, Optional, Tuple
+
+VALID_ACTIONS = ('troubleshoot', 'create_ticket', 'clarify')
+VALID_CATEGORIES = ('Hardware', 'Software', 'Maintenance', 'General')
+VALID_PRIORITIES = (10, 20, 30, 40, 50)
+SMART_QUOTES = '“”'
+
+_decoder = json.JSONDecoder()
+
+class ResponseParseError(ValueError):
+    """Raised when an LLM reply can't be turned into a valid response dict"""
+
+def parse_llm_response(text: str) -> Tuple[Dict[str, Any], bool]:
+    """Parse and validate an LLM reply; returns (response, was_repaired)"""
+    start = text.find('{')
+    if start == -1:
+        raise ResponseParseError("No JSON object in reply")
+
+    # Fast path: decode in place from the first brace, ignoring surrounding text
+    try:
+        obj, _ = _decoder.raw_decode(text, start)
+        return validate_response(obj), False
+    except json.JSONDecodeError:
+        pass
+
+    repaired = repair_json(text[start:])
+    try:
+        obj, _ = _decoder.raw_decode(repaired)
+    except json.JSONDecodeError as e:
+        raise ResponseParseError(f"Unrepairable JSON: {e}") from e
+    return validate_response(obj), True
+
+def repair_json(fragment: str) -> str:
+    """Fix common LLM JSON defects in a fragment that starts at an opening brace
+
+    Handles smart quotes used as JSON quotes, raw newlines inside strings,
+    trailing commas and Python literals. A reply cut off before its object
+    closes is rejected rather than guessed at, so the caller re-asks.
+    """
+    out = []
+    closers = []
+    in_string = False
+    smart_string = False
+    escaped = False
+    for index, char in enumerate(fragment):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif smart_string and (char == '"' or char in SMART_QUOTES):
+                # A string opened with a smart quote only ends where the JSON
+                # continues; any other quote inside it is prose
+                if _closes_string(fragment, index + 1):
+                    in_string = False
+                    char = '"'
+                elif char == '"':
+                    char = '\\"'
+            elif char == '"':
+                # Smart quotes inside a plain string are prose and stay as they are
+                in_string = False
+            elif char == '\n':
+                char = '\\n'
+            elif char == '\r':
+                char = '\\r'
+            elif char == '\t':
+                char = '\\t'
+            out.append(char)
+            continue
+
+        if char == '"' or char in SMART_QUOTES:
+            in_string = True
+            smart_string = char != '"'
+            char = '"'
+        elif char in '{[':
+            closers.append('}' if char == '{' else ']')
+        elif char in '}]':
+            if not closers:
+                break
+            closers.pop()
+            out.append(char)
+            if not closers:
+                # End of the first balanced object; ignore trailing text
+                break
+            continue
+        out.append(char)
+
+    if in_string or closers:
+        raise ResponseParseError("Reply was cut off before the JSON object ended")
+    repaired = ''.join(out)
+
+    # These only need to apply outside strings, but the patterns are specific
+    # enough that touching prose inside "response" is unlikely
+    repaired = re.sub(r',\s*([}\]])', r'\1', repaired)
+    repaired = re.sub(r':\s*True\b', ': true', repaired)
+    repaired = re.sub(r':\s*False\b', ': false', repaired)
+    repaired = re.sub(r':\s*None\b', ': null', repaired)
+    return repaired
+
+def _closes_string(fragment: str, index: int) -> bool:
+    """True if the text after a smart quote reads like the end of a JSON string"""
+    rest = fragment[index:].lstrip()
+    return not rest or rest[0] in ':,}]'
+
+def _match_enum(value: Any, choices: Tuple[str, ...]) -> Optional[str]:
+    normalized = str(value).strip().lower().replace(' ', '_').replace('-', '_')
+    for choice in choices:
+        if choice.lower() == normalized:
+            return choice
+    return None
+
+def validate_response(obj: Any) -> Dict[str, Any]:
+    """Check required fields and coerce category/priority onto their allowed values"""
+    if not isinstance(obj, dict):
+        raise ResponseParseError("Reply is not a JSON object")
+
+    action = _match_enum(obj.get('action', ''), VALID_ACTIONS)
+    if action is None:
+        raise ResponseParseError(f"Invalid action: {obj.get('action')!r}")
+
+    text = obj.get('response')
+    if not isinstance(text, str) or not text.strip():
+        raise ResponseParseError("Missing response text")
+
+    category = _match_enum(obj.get('category', 'General'), VALID_CATEGORIES) or 'General'
+
+    try:
+        priority = int(obj.get('priority', 30))
+    except (TypeError, ValueError, OverflowError):
+        priority = 30
+    priority = min(VALID_PRIORITIES, key=lambda valid: abs(valid - priority))
+
+    result = dict(obj)
+    result.update({'action': action, 'response': text, 'category': category, 'priority': priority})
+    if action == 'create_ticket' and not result.get('ticket_summary'):
+        result['ticket_summary'] = 'Washing Machine Issue'
+    return result
@@ -0,0 +1,121 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, Optional
+
+from metrics import SCHEDULER_QUEUE_DEPTH, SCHEDULER_SHED, SCHEDULER_WAIT
+
+# Priority classes from the system prompt: 10=immediate, 20=urgent, 30=high, 40=normal, 50=low
+PRIORITY_CLASSES = (10, 20, 30, 40, 50)
+
+class _Waiter:
+    __slots__ = ('user_id', 'future', 'queued_at')
+
+    def __init__(self, user_id: str, future: asyncio.Future):
+        self.user_id = user_id
+        self.future = future
+        self.queued_at = time.monotonic()
+
+class AdmissionScheduler:
+    """Admits support messages by priority class, fairly across users, shedding when queues overflow"""
+
+    def __init__(self, concurrency: int = 8, class_limits: Optional[Dict[int, int]] = None,
+                 max_queue: int = 50):
+        self.concurrency = concurrency
+        # Most messages of each class that may run at once, so low classes never fill every slot
+        self.class_limits = {priority: concurrency for priority in PRIORITY_CLASSES}
+        self.class_limits.update(class_limits or {})
+        self.max_queue = max_queue
+
+        # Per class, each user's waiting messages; users are served round-robin
+        self._queues: Dict[int, "OrderedDict[str, Deque[_Waiter]]"] = {
+            priority: OrderedDict() for priority in PRIORITY_CLASSES
+        }
+        self._depth = {priority: 0 for priority in PRIORITY_CLASSES}
+        self._running = {priority: 0 for priority in PRIORITY_CLASSES}
+        self._running_total = 0
+
+        self.stats = {'admitted': 0, 'queued': 0, 'shed': 0}
+        for priority in PRIORITY_CLASSES:
+            SCHEDULER_QUEUE_DEPTH.set_function(lambda priority=priority: self._depth[priority], priority=priority)
+
+    @staticmethod
+    def priority_class(priority: int) -> int:
+        """Class a priority falls into, rounding toward less urgent"""
+        for priority_class in PRIORITY_CLASSES:
+            if priority <= priority_class:
+                return priority_class
+        return PRIORITY_CLASSES[-1]
+
+    async def run(self, priority: int, user_id: str, job: Callable[[], Awaitable[None]]) -> bool:
+        """Run job once admitted; returns False without running it if the class queue is full"""
+        priority = self.priority_class(priority)
+        if self._depth[priority] >= self.max_queue:
+            self.stats['shed'] += 1
+            SCHEDULER_SHED.inc(priority=priority)
+            return False
+
+        waiter = _Waiter(user_id, asyncio.get_running_loop().create_future())
+        self._queues[priority].setdefault(user_id, deque()).append(waiter)
+        self._depth[priority] += 1
+        self._dispatch()
+
+        if not waiter.future.done():
+            self.stats['queued'] += 1
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.cancelled():
+                self._remove(priority, waiter)
+            else:
+                # Admitted just as we were cancelled; give the slot back
+                self._release(priority)
+            raise
+
+        SCHEDULER_WAIT.observe(time.monotonic() - waiter.queued_at, priority=priority)
+        try:
+            await job()
+        finally:
+            self._release(priority)
+        return True
+
+    def _dispatch(self):
+        """Admit waiters, most urgent class first, while slots are free"""
+        while self._running_total < self.concurrency:
+            for priority in PRIORITY_CLASSES:
+                if self._depth[priority] and self._running[priority] < self.class_limits[priority]:
+                    break
+            else:
+                return
+
+            # Take the user at the front, then move them to the back if they have more waiting
+            users = self._queues[priority]
+            user_id, waiters = next(iter(users.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                users.move_to_end(user_id)
+            else:
+                del users[user_id]
+            self._depth[priority] -= 1
+
+            self._running[priority] += 1
+            self._running_total += 1
+            self.stats['admitted'] += 1
+            waiter.future.set_result(None)
+
+    def _release(self, priority: int):
+        self._running[priority] -= 1
+        self._running_total -= 1
+        self._dispatch()
+
+    def _remove(self, priority: int, waiter: _Waiter):
+        waiters = self._queues[priority].get(waiter.user_id)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            self._depth[priority] -= 1
+            if not waiters:
+                del self._queues[priority][waiter.user_id]
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(self._depth.values())
@@ -0,0 +1,232 @@
+"""Benchmark of conversation session reads and writes, old store against new
+
+Runs the same read/write cycle a support message makes (load the user's
+recent context, then record the user message and the reply) against three
+session stores:
+
+  old       the original DatabaseHandler session code: a new sqlite3
+            connection and commit per call, the whole history as one JSON
+            blob rewritten with INSERT OR REPLACE, called on the event loop
+  database  DatabaseHandler's session_messages table through its async
+            facade on the long-lived WAL connection
+  cached    SessionCache in front of that, as the bot runs it, including the
+            final flush
+
+    python session_benchmark.py
+    python session_benchmark.py --cycles 10000 --users 1000 --dir /var/tmp --json results.json
+
+With --history it instead measures the cost of one message for a user who
+already has 10, 1,000 and 10,000 prior messages (or the counts given). The
+old store reads and rewrites the whole history every time; the new one
+keeps only the retention window, so its cost doesn't depend on how long
+the user has been talking.
+
+    python session_benchmark.py --history
+    python session_benchmark.py --history 10 100 1000 10000 100000
+
+Use --dir to put the databases on the disk the bot uses; a tmpfs hides the
+cost of the old store's fsync per write.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from config import Config
+from database import DatabaseHandler
+from replay import LoopBlockingSampler
+from session_cache import SessionCache
+
+MODES = ('old', 'database', 'cached')
+HISTORY_LENGTHS = [10, 1_000, 10_000]
+
+class BlobSessionStore:
+    """The session storage DatabaseHandler had before session_messages"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS user_sessions (
+                    discord_user_id TEXT PRIMARY KEY,
+                    conversation_history TEXT,
+                    last_interaction TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.commit()
+
+    def update_session(self, discord_user_id: str, conversation_history: dict):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO user_sessions (discord_user_id, conversation_history, last_interaction)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+            ''', (discord_user_id, json.dumps(conversation_history)))
+            conn.commit()
+
+    def get_session(self, discord_user_id: str) -> Optional[dict]:
+        with sqlite3.connect(self.db_path) as conn:
+            result = conn.execute('''
+                SELECT conversation_history FROM user_sessions
+                WHERE discord_user_id = ?
+            ''', (discord_user_id,)).fetchone()
+            if result:
+                return json.loads(result[0])
+            return None
+
+def exchange(rng: random.Random) -> List[Dict[str, str]]:
+    """A user message and a reply of typical support-chat length"""
+    question = "My washer " + " ".join(rng.choice(('stops', 'leaks', 'beeps', 'shakes', 'drains')) for _ in range(30))
+    answer = "Please try " + " ".join(rng.choice(('checking', 'the', 'filter', 'hose', 'door', 'seal')) for _ in range(100))
+    return [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+
+async def run_cycles(mode: str, path: str, args) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    users = [str(100000 + index) for index in range(args.users)]
+    timings = []
+
+    old = db = cache = None
+    if mode == 'old':
+        old = BlobSessionStore(path)
+    else:
+        db = DatabaseHandler(path, history_retention=Config.SESSION_HISTORY_RETENTION)
+        if mode == 'cached':
+            cache = SessionCache(db, context_size=Config.SESSION_CONTEXT_MESSAGES,
+                                 flush_interval=Config.SESSION_FLUSH_INTERVAL)
+            cache.start()
+
+    sampler = LoopBlockingSampler()
+    sampler.start()
+    started = time.perf_counter()
+    for _ in range(args.cycles):
+        user_id = rng.choice(users)
+        messages = exchange(rng)
+        cycle_started = time.perf_counter()
+        if old is not None:
+            history = old.get_session(user_id) or {'messages': []}
+            context = history['messages'][-Config.SESSION_CONTEXT_MESSAGES:]
+            history['messages'].extend(messages)
+            old.update_session(user_id, history)
+        elif cache is not None:
+            context = await cache.get_recent_messages(user_id)
+            await cache.append_messages(user_id, messages)
+        else:
+            context = await db.get_recent_messages_async(user_id, Config.SESSION_CONTEXT_MESSAGES)
+            await db.append_session_messages_async(user_id, messages)
+        timings.append(time.perf_counter() - cycle_started)
+        # Other handlers get the loop between messages
+        await asyncio.sleep(0)
+    if cache is not None:
+        # Pending writes are part of the cost
+        await cache.close()
+    elapsed = time.perf_counter() - started
+    await sampler.close()
+    if db is not None:
+        db.close()
+
+    return {
+        'mode': mode,
+        'cycles': args.cycles,
+        'total_seconds': elapsed,
+        'cycles_per_second': args.cycles / elapsed,
+        'mean_us': statistics.fmean(timings) * 1e6,
+        'p95_us': sorted(timings)[int(0.95 * len(timings))] * 1e6,
+        'max_loop_stall_ms': max(sampler.lags, default=0.0) * 1000,
+        'database_bytes': os.path.getsize(path),
+    }
+
+async def message_cost(mode: str, path: str, prior: int, args) -> Dict[str, Any]:
+    """Per-message cost for one user who already has `prior` messages"""
+    rng = random.Random(args.seed)
+    user_id = 'chatty-user'
+    seed = [message for _ in range(prior // 2) for message in exchange(rng)]
+    timings = []
+
+    if mode == 'old':
+        store = BlobSessionStore(path)
+        store.update_session(user_id, {'messages': seed})
+        for _ in range(args.messages):
+            messages = exchange(rng)
+            started = time.perf_counter()
+            history = store.get_session(user_id)
+            context = history['messages'][-Config.SESSION_CONTEXT_MESSAGES:]
+            history['messages'].extend(messages)
+            store.update_session(user_id, history)
+            timings.append(time.perf_counter() - started)
+        stored = len(store.get_session(user_id)['messages'])
+    else:
+        db = DatabaseHandler(path, history_retention=Config.SESSION_HISTORY_RETENTION)
+        # The same history arriving through the normal path, so retention applies to it
+        await db.append_session_messages_async(user_id, seed)
+        for _ in range(args.messages):
+            messages = exchange(rng)
+            started = time.perf_counter()
+            context = await db.get_recent_messages_async(user_id, Config.SESSION_CONTEXT_MESSAGES)
+            await db.append_session_messages_async(user_id, messages)
+            timings.append(time.perf_counter() - started)
+        stored = db._execute(lambda: db._conn.execute(
+            'SELECT COUNT(*) FROM session_messages WHERE discord_user_id = ?', (user_id,)).fetchone()[0])
+        db.close()
+
+    return {
+        'mode': mode,
+        'prior_messages': prior,
+        'stored_messages': stored,
+        'mean_us': statistics.fmean(timings) * 1e6,
+        'p95_us': sorted(timings)[int(0.95 * len(timings))] * 1e6,
+    }
+
+def print_history_report(results: List[Dict[str, Any]], args):
+    print(f"Cost per message over {args.messages} messages, retention {Config.SESSION_HISTORY_RETENTION}")
+    print(f"{'store':<9} {'prior':>7} {'stored':>7} {'mean us':>9} {'p95 us':>9}")
+    for result in results:
+        print(f"{result['mode']:<9} {result['prior_messages']:>7} {result['stored_messages']:>7} "
+              f"{result['mean_us']:>9.0f} {result['p95_us']:>9.0f}")
+
+def print_report(results: List[Dict[str, Any]], args):
+    print(f"{args.cycles} read/write cycles over {args.users} users")
+    print(f"{'store':<9} {'total s':>8} {'cycles/s':>9} {'mean us':>9} {'p95 us':>9} {'loop stall ms':>14} {'db bytes':>10}")
+    for result in results:
+        print(f"{result['mode']:<9} {result['total_seconds']:>8.2f} {result['cycles_per_second']:>9.0f} "
+              f"{result['mean_us']:>9.0f} {result['p95_us']:>9.0f} {result['max_loop_stall_ms']:>14.1f} "
+              f"{result['database_bytes']:>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Time session read/write cycles, old blob store against new")
+    parser.add_argument('--cycles', type=int, default=10_000, help="Read/write cycles per store")
+    parser.add_argument('--users', type=int, default=1_000, help="Users the cycles are spread over")
+    parser.add_argument('--history', type=int, nargs='*',
+                        help=f"Measure per-message cost at these prior history lengths (default {HISTORY_LENGTHS})")
+    parser.add_argument('--messages', type=int, default=200, help="Messages timed per history length")
+    parser.add_argument('--dir', help="Directory for the throwaway databases (default: system temp)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        if args.history is not None:
+            for prior in args.history or HISTORY_LENGTHS:
+                for mode in ('old', 'database'):
+                    path = os.path.join(tmp, f"{mode}-{prior}.db")
+                    results.append(asyncio.run(message_cost(mode, path, prior, args)))
+        else:
+            for mode in MODES:
+                results.append(asyncio.run(run_cycles(mode, os.path.join(tmp, f"{mode}.db"), args)))
+
+    if args.history is not None:
+        print_history_report(results, args)
+    else:
+        print_report(results, args)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'cycles': args.cycles, 'users': args.users, 'results': results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, List
+
+from database import DatabaseHandler
+
+# Rough per-message overhead (dict + two strings) on top of the content length
+MESSAGE_OVERHEAD_BYTES = 200
+
+class _SessionEntry:
+    __slots__ = ('messages', 'expires_at', 'size')
+
+    def __init__(self, messages: List[Dict[str, str]], expires_at: float):
+        self.messages = messages
+        self.expires_at = expires_at
+        self.size = sum(len(msg['content']) + MESSAGE_OVERHEAD_BYTES for msg in messages)
+
+class SessionCache:
+    """Write-behind LRU cache of recent conversation messages in front of DatabaseHandler"""
+
+    def __init__(self, db: DatabaseHandler, context_size: int, max_entries: int = 10000,
+                 max_bytes: int = 50_000_000, ttl: float = 1800, flush_interval: float = 5):
+        self.db = db
+        self.context_size = context_size
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+
+        self._entries: "OrderedDict[str, _SessionEntry]" = OrderedDict()
+        self._bytes = 0
+        # Appends not yet written to SQLite, kept apart from the LRU so eviction never loses them
+        self._pending: Dict[str, List[Dict[str, str]]] = {}
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'flushes': 0, 'flushed_messages': 0}
+
+    def start(self):
+        """Start the periodic background flush"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        """Stop the background flush and write out everything still pending"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+    async def get_recent_messages(self, discord_user_id: str) -> List[Dict[str, str]]:
+        """Get a user's recent messages, from memory when possible"""
+        entry = self._entries.get(discord_user_id)
+        if entry is not None and entry.expires_at > time.monotonic():
+            self._entries.move_to_end(discord_user_id)
+            self.stats['hits'] += 1
+            return list(entry.messages)
+
+        self.stats['misses'] += 1
+        messages = await self.db.get_recent_messages_async(discord_user_id, self.context_size)
+        # Unflushed appends are newer than anything in SQLite
+        messages = (messages + self._pending.get(discord_user_id, []))[-self.context_size:]
+        self._store(discord_user_id, messages)
+        return list(messages)
+
+    async def append_messages(self, discord_user_id: str, messages: List[Dict[str, str]]):
+        """Record new messages in memory and queue them for the next flush"""
+        recent = await self.get_recent_messages(discord_user_id)
+        self._store(discord_user_id, (recent + messages)[-self.context_size:])
+        self._pending.setdefault(discord_user_id, []).extend(messages)
+
+    async def flush(self):
+        """Write all pending appends to SQLite in one batch"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            # The write is queued on the database thread before we yield, so
+            # any read issued after this point already sees the batch
+            try:
+                await self.db.append_session_batch_async(batch)
+            except Exception:
+                # Put the batch back in front of anything appended meanwhile
+                for discord_user_id, messages in batch.items():
+                    self._pending[discord_user_id] = messages + self._pending.get(discord_user_id, [])
+                raise
+            self.stats['flushes'] += 1
+            self.stats['flushed_messages'] += sum(len(messages) for messages in batch.values())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error flushing session cache: {e}")
+
+    def _store(self, discord_user_id: str, messages: List[Dict[str, str]]):
+        old = self._entries.pop(discord_user_id, None)
+        if old is not None:
+            self._bytes -= old.size
+
+        entry = _SessionEntry(messages, time.monotonic() + self.ttl)
+        self._entries[discord_user_id] = entry
+        self._bytes += entry.size
+
+        # Evict least recently used entries until both limits are met
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.stats['evictions'] += 1
@@ -0,0 +1,135 @@
+"""Benchmark of ticket creation against a local fake MantisConnect server
+
+Starts FakeMantisServer on localhost and creates tickets through zeep over
+real HTTP at several concurrency levels, comparing the two ways the bot has
+called Mantis:
+
+  old  a plain zeep Client called directly inside the coroutines, as
+       handle_ticket_creation used to, so every request blocks the event loop
+  new  MantisHubClient.create_ticket_async on the pooled keep-alive session
+       and SOAP worker threads
+
+For each it reports throughput, per-ticket latency, the longest event loop
+stall and how many new TCP connections the run opened.
+
+    python soap_benchmark.py
+    python soap_benchmark.py --latency 0.2 --tickets 200 --concurrency 1 10 50 --json results.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import statistics
+import time
+from typing import Any, Dict, List
+
+from zeep import Client
+
+from config import Config
+from fake_mantis_server import FakeMantisServer
+from mantis_client import MantisHubClient
+from replay import LoopBlockingSampler
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+async def create_tickets(mode: str, client: MantisHubClient, tickets: int, concurrency: int) -> Dict[str, Any]:
+    latencies = []
+    created = 0
+    remaining = iter(range(tickets))
+
+    async def worker():
+        nonlocal created
+        for index in remaining:
+            started = time.perf_counter()
+            args = (f"Benchmark ticket {index}", f"Synthetic report {index}", "Benchmark", "Hardware")
+            if mode == 'old':
+                ticket_id = client.create_ticket(*args)
+            else:
+                ticket_id = await client.create_ticket_async(*args)
+            latencies.append(time.perf_counter() - started)
+            created += ticket_id is not None
+            # Let the other coroutines in, as the bot's other handlers would
+            await asyncio.sleep(0)
+
+    sampler = LoopBlockingSampler()
+    sampler.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    await sampler.close()
+    return {
+        'mode': mode,
+        'concurrency': concurrency,
+        'created': created,
+        'tickets_per_second': tickets / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'max_loop_stall_ms': max(sampler.lags, default=0.0) * 1000,
+    }
+
+def build_client(mode: str, server: FakeMantisServer) -> MantisHubClient:
+    if mode == 'old':
+        # The pre-pool setup: zeep's default transport, no timeouts, no retries
+        client = MantisHubClient(soap_url=server.wsdl_url, client=Client(server.wsdl_url))
+        client.max_retries = 0
+    else:
+        client = MantisHubClient(soap_url=server.wsdl_url)
+    # Load the WSDL and the category list up front; only ticket creation is timed
+    with contextlib.redirect_stdout(io.StringIO()):
+        client.get_categories()
+    return client
+
+def benchmark(args) -> List[Dict[str, Any]]:
+    results = []
+    for concurrency in args.concurrency:
+        for mode in ('old', 'new'):
+            server = FakeMantisServer(latency=args.latency)
+            server.start()
+            try:
+                client = build_client(mode, server)
+                connections = server.stats['connections']
+                # The client logs every ticket it creates; keep the report readable
+                with contextlib.redirect_stdout(io.StringIO()):
+                    result = asyncio.run(create_tickets(mode, client, args.tickets, concurrency))
+                result['connections'] = server.stats['connections'] - connections
+                results.append(result)
+            finally:
+                server.stop()
+    return results
+
+def print_report(results: List[Dict[str, Any]], args):
+    print(f"{args.tickets} tickets per run, {args.latency * 1000:.0f}ms server latency, "
+          f"pool of {Config.MANTIS_POOL_SIZE}")
+    print(f"{'mode':<5} {'conc':>5} {'tickets/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'loop stall ms':>14} {'conns':>6}")
+    for result in results:
+        print(f"{result['mode']:<5} {result['concurrency']:>5} {result['tickets_per_second']:>10.1f} "
+              f"{result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['max_loop_stall_ms']:>14.1f} "
+              f"{result['connections']:>6}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Time ticket creation against a local fake Mantis SOAP server")
+    parser.add_argument('--tickets', type=int, default=100, help="Tickets created per run")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50],
+                        help="Concurrent ticket requests to compare")
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds the server takes per SOAP call")
+    parser.add_argument('--pool-size', type=int, default=Config.MANTIS_POOL_SIZE,
+                        help="MANTIS_POOL_SIZE for the new client")
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    Config.MANTIS_POOL_SIZE = args.pool_size
+    Config.MANTIS_USERNAME = Config.MANTIS_USERNAME or 'benchmark'
+    Config.MANTIS_PASSWORD = Config.MANTIS_PASSWORD or 'benchmark'
+
+    results = benchmark(args)
+    print_report(results, args)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'tickets': args.tickets, 'latency': args.latency, 'results': results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
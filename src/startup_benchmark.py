@@ -0,0 +1,121 @@
+"""Startup time of the bot with a cold and a warm WSDL cache
+
+Starts FakeMantisServer on localhost, with a delay on every WSDL/XSD
+download to stand in for a slow Mantis, and launches fresh Python
+processes that start the bot the way main() does: import bot, then
+configure(). Connecting to Discord is left out, so "on_ready" is when the
+bot would begin that handshake. Each process then builds the SOAP client
+(MantisHubClient.client), which on_ready's warm-up does in the background,
+to show when the first ticket could go out.
+
+  old   the SOAP client is built eagerly, before on_ready, with no cache
+  cold  lazy client with an empty SqliteCache (first start after a deploy)
+  warm  lazy client with the SqliteCache the cold start filled (a restart)
+
+    python startup_benchmark.py
+    python startup_benchmark.py --document-latency 1.0 --repeat 5 --json results.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from fake_mantis_server import FakeMantisServer
+
+SCENARIOS = ('old', 'cold', 'warm')
+
+def start_bot(mode: str) -> Dict[str, float]:
+    """Runs in the child process; times each startup step"""
+    started = time.perf_counter()
+    import bot
+    imported = time.perf_counter()
+
+    if mode == 'old':
+        # What the bot did before: download and parse the WSDL before connecting
+        from mantis_client import MantisHubClient
+        from zeep import Client
+        bot.configure(mantis=MantisHubClient(client=Client(bot.Config.MANTIS_BASE_URL)))
+    else:
+        bot.configure()
+    ready = time.perf_counter()
+    bot.mantis_client.client
+    client_ready = time.perf_counter()
+    bot.db.close()
+    return {
+        'import_seconds': imported - started,
+        'on_ready_seconds': ready - started,
+        'first_ticket_seconds': client_ready - started,
+    }
+
+def run_child(mode: str, server: FakeMantisServer, cache_path: str, workdir: str) -> Dict[str, Any]:
+    env = dict(os.environ,
+               MANTIS_BASE_URL=server.wsdl_url,
+               MANTIS_WSDL_CACHE_PATH=cache_path,
+               MANTIS_USERNAME='benchmark',
+               MANTIS_PASSWORD='benchmark',
+               PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    documents = server.stats['documents']
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode],
+                            cwd=workdir, env=env, capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['documents_downloaded'] = server.stats['documents'] - documents
+    return result
+
+def benchmark(args) -> List[Dict[str, Any]]:
+    server = FakeMantisServer(document_latency=args.document_latency)
+    server.start()
+    runs: Dict[str, List[Dict[str, Any]]] = {mode: [] for mode in SCENARIOS}
+    try:
+        for _ in range(args.repeat):
+            with tempfile.TemporaryDirectory() as workdir:
+                cache_path = os.path.join(workdir, 'wsdl_cache.db')
+                runs['old'].append(run_child('old', server, cache_path, workdir))
+                # The first lazy start fills the cache the next one reads
+                runs['cold'].append(run_child('cold', server, cache_path, workdir))
+                runs['warm'].append(run_child('warm', server, cache_path, workdir))
+    finally:
+        server.stop()
+
+    results = []
+    for mode in SCENARIOS:
+        result = {'scenario': mode}
+        for key in ('import_seconds', 'on_ready_seconds', 'first_ticket_seconds'):
+            result[key] = statistics.median(run[key] for run in runs[mode])
+        result['documents_downloaded'] = max(run['documents_downloaded'] for run in runs[mode])
+        results.append(result)
+    return results
+
+def print_report(results: List[Dict[str, Any]], args):
+    print(f"Median of {args.repeat} starts, {args.document_latency * 1000:.0f}ms per WSDL/XSD download")
+    print(f"{'scenario':<9} {'import s':>9} {'on_ready s':>11} {'first ticket s':>15} {'downloads':>10}")
+    for result in results:
+        print(f"{result['scenario']:<9} {result['import_seconds']:>9.2f} {result['on_ready_seconds']:>11.2f} "
+              f"{result['first_ticket_seconds']:>15.2f} {result['documents_downloaded']:>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Time bot startup with a cold and a warm WSDL cache")
+    parser.add_argument('--document-latency', type=float, default=0.5,
+                        help="Seconds the fake Mantis takes to serve each WSDL/XSD document")
+    parser.add_argument('--repeat', type=int, default=3, help="Starts per scenario")
+    parser.add_argument('--json', help="Also write the results to this file")
+    parser.add_argument('--child', choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(start_bot(args.child)))
+        return
+
+    results = benchmark(args)
+    print_report(results, args)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'document_latency': args.document_latency, 'results': results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
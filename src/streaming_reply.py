@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from typing import Optional, Tuple
+
+import discord
+
+from metrics import STREAM_COMPLETE, STREAM_FIRST_VISIBLE
+from reply_queue import ReplyQueue
+
+logger = logging.getLogger(__name__)
+
+# Discord rejects embed descriptions longer than this
+EMBED_DESCRIPTION_LIMIT = 4096
+
+class StreamingReply:
+    """Shows a streamed LLM reply as one Discord message edited at a fixed cadence
+
+    The preview is posted and edited through the reply queue, so a newer
+    version replaces one still waiting there and the handler never waits
+    on Discord's rate limits.
+    """
+
+    def __init__(self, message: discord.Message, interval: float, reply_queue: ReplyQueue):
+        self.message = message
+        self.interval = interval
+        self.reply_queue = reply_queue
+        self.reply: Optional[discord.Message] = None
+
+        self._key = ('stream', message.id)
+        self._latest = ''
+        self._shown = ''
+        self._last_edit = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._sending = False
+        # Future for the preview's first post, and what to show once it lands
+        self._posting: Optional[asyncio.Future] = None
+        self._waiting: Optional[Tuple[Optional[str], Optional[discord.Embed], bool]] = None
+        self._follow_up: Optional[asyncio.Task] = None
+        self._started = time.perf_counter()
+        self.first_visible_after: Optional[float] = None
+        self.complete_after: Optional[float] = None
+
+    async def update(self, text: str):
+        """Record the latest partial text; a background task queues it for Discord"""
+        self._latest = text
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._push())
+
+    async def _push(self):
+        # Wait out the edit interval, then show whatever text is newest by then
+        delay = self._last_edit + self.interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self._latest == self._shown:
+            return
+
+        text = self._latest
+        embed = discord.Embed(
+            title="🤖 Support Assistant",
+            description=(text[:EMBED_DESCRIPTION_LIMIT - 1] + "▌"),
+            color=0xffaa00
+        )
+        self._sending = True
+        try:
+            await self._show(embed=embed)
+            self._shown = text
+        finally:
+            self._sending = False
+        self._last_edit = time.monotonic()
+
+    async def _show(self, content: Optional[str] = None, embed: Optional[discord.Embed] = None,
+                    last: bool = False):
+        """Queue the preview's new look, replacing a stale version still waiting in the queue"""
+        if self.reply is not None:
+            sent = await self.reply_queue.edit(self.reply, content=content, embed=embed, key=self._key)
+        elif self._posting is not None and not self._posting.done():
+            if not self.reply_queue.replace(self._key, content=content, embed=embed, last=last):
+                # The first post is already on its way; show this once it has landed
+                self._waiting = (content, embed, last)
+                return
+            sent = self._posting
+        else:
+            # First post, or another try after it failed
+            sent = self._posting = await self.reply_queue.reply(self.message, content=content, embed=embed,
+                                                                key=self._key)
+            self._posting.add_done_callback(self._posted)
+        if last:
+            sent.add_done_callback(self._completed)
+
+    def _posted(self, future: asyncio.Future):
+        self.reply = future.result()
+        if self.reply is not None:
+            self.first_visible_after = time.perf_counter() - self._started
+            STREAM_FIRST_VISIBLE.observe(self.first_visible_after)
+            logger.debug(f"Streamed reply visible after {self.first_visible_after:.2f}s")
+        if self._waiting is not None:
+            content, embed, last = self._waiting
+            self._waiting = None
+            self._follow_up = asyncio.create_task(self._show(content, embed, last))
+
+    def _completed(self, future: asyncio.Future):
+        if not future.cancelled() and future.result() is not None and self.complete_after is None:
+            self.complete_after = time.perf_counter() - self._started
+            STREAM_COMPLETE.observe(self.complete_after)
+            logger.debug(f"Streamed reply complete after {self.complete_after:.2f}s")
+
+    async def finish(self, content: Optional[str] = None, embed: Optional[discord.Embed] = None) -> bool:
+        """Queue the final reply in place of the preview; False if no preview was started"""
+        if self._task is not None and not self._task.done():
+            if self._sending:
+                # Only waits on Discord when the reply queue is disabled
+                await self._task
+            else:
+                # Still waiting out the interval; the final reply supersedes it
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+        if self._posting is None:
+            return False
+        await self._show(content, embed, last=True)
+        return True
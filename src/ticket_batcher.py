@@ -0,0 +1,110 @@
+import asyncio
+import time
+from typing import Optional, List, Set, Tuple
+
+from mantis_client import MantisHubClient
+from response_cache import STOPWORDS, normalize_message
+
+# Reports with fewer content words than this say too little to be matched safely
+MIN_REPORT_TOKENS = 3
+
+class _TicketGroup:
+    __slots__ = ('category', 'tokens', 'created_at', 'ticket')
+
+    def __init__(self, category: str, tokens: Set[str], ticket: asyncio.Future):
+        self.category = category
+        self.tokens = tokens
+        self.created_at = time.monotonic()
+        # Resolves to the Mantis issue id (or None if creation failed)
+        self.ticket = ticket
+
+class TicketBatcher:
+    """Folds near-identical ticket reports within a time window into one Mantis issue
+
+    Reports are matched on the user's own words, never on the summary: the
+    LLM's ticket_summary is often canned intent text or a default, which
+    would merge unrelated customers.
+    """
+
+    def __init__(self, mantis_client: MantisHubClient, window: float = 600,
+                 similarity_threshold: float = 0.7, max_workers: int = 4):
+        self.mantis_client = mantis_client
+        self.window = window
+        self.similarity_threshold = similarity_threshold
+        self.max_workers = max_workers
+
+        self._groups: List[_TicketGroup] = []
+        self._workers: Optional[asyncio.Semaphore] = None
+
+        self.stats = {'created': 0, 'merged': 0, 'failed': 0}
+
+    async def submit(self, summary: str, description: str, reporter_name: str,
+                     category: str = "General", priority: int = 30,
+                     report: Optional[str] = None) -> Tuple[Optional[str], bool]:
+        """Create a ticket or attach to a matching recent one; returns (ticket_id, is_new)
+
+        report is the user's own message; without it the ticket is never grouped.
+        A merged report is not sent anywhere: the caller attaches it to the
+        returned ticket as a note. The ticket id is None if Mantis rejected
+        the creation.
+        """
+        if self._workers is None:
+            self._workers = asyncio.Semaphore(self.max_workers)
+
+        tokens = self._tokens(report) if report else set()
+        if len(tokens) < MIN_REPORT_TOKENS:
+            tokens = set()
+        group = self._find_group(category, tokens)
+        if group is not None:
+            ticket_id = await asyncio.shield(group.ticket)
+            if ticket_id:
+                self.stats['merged'] += 1
+                return ticket_id, False
+            # The original creation failed, so this report tries on its own
+
+        ticket = asyncio.get_running_loop().create_future()
+        group = _TicketGroup(category, tokens, ticket)
+        self._groups.append(group)
+        try:
+            async with self._workers:
+                ticket_id = await self.mantis_client.create_ticket_async(
+                    summary=summary,
+                    description=description,
+                    reporter_name=reporter_name,
+                    category=category,
+                    priority=priority
+                )
+        except BaseException:
+            ticket.set_result(None)
+            self._discard(group)
+            raise
+
+        ticket.set_result(ticket_id)
+        if ticket_id:
+            self.stats['created'] += 1
+        else:
+            self.stats['failed'] += 1
+            self._discard(group)
+        return ticket_id, True
+
+    def _discard(self, group: _TicketGroup):
+        if group in self._groups:
+            self._groups.remove(group)
+
+    @staticmethod
+    def _tokens(text: str) -> Set[str]:
+        return {word for word in normalize_message(text).split() if word not in STOPWORDS}
+
+    def _find_group(self, category: str, tokens: Set[str]) -> Optional[_TicketGroup]:
+        """Most similar open group in the same category, dropping expired groups"""
+        cutoff = time.monotonic() - self.window
+        self._groups = [group for group in self._groups if group.created_at >= cutoff]
+
+        best, best_score = None, self.similarity_threshold
+        for group in self._groups:
+            if group.category != category or not tokens or not group.tokens:
+                continue
+            score = len(tokens & group.tokens) / len(tokens | group.tokens)
+            if score >= best_score:
+                best, best_score = group, score
+        return best
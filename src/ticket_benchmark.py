@@ -0,0 +1,148 @@
+"""Benchmark of the !tickets queries against a large user_tickets table
+
+Fills a throwaway database with synthetic tickets (one power user holding a
+large share of them, the rest spread over ordinary users), then times the
+queries TicketPager makes: the first page, following Next, jumping straight
+to a deep page and filtering by status. For comparison it also times the
+old unpaginated query, which sorted and fetched every row the user had.
+
+    python ticket_benchmark.py
+    python ticket_benchmark.py --rows 200000 --power-user-rows 20000 --json results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+from database import DatabaseHandler
+
+STATUSES = ('closed', 'resolved', 'open', 'acknowledged')
+STATUS_WEIGHTS = (60, 20, 15, 5)
+POWER_USER = 'power-user'
+
+def populate(path: str, rows: int, users: int, power_user_rows: int, rng: random.Random):
+    """Insert synthetic tickets spread evenly over the past year, in large transactions"""
+    started_at = time.time() - 365 * 24 * 3600
+    step = 365 * 24 * 3600 / rows
+    conn = sqlite3.connect(path)
+    batch = []
+    for index in range(rows):
+        if power_user_rows and index % max(1, rows // power_user_rows) == 0:
+            user_id = POWER_USER
+        else:
+            user_id = f"user-{rng.randrange(users)}"
+        created_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(started_at + index * step))
+        status = rng.choices(STATUSES, STATUS_WEIGHTS)[0]
+        batch.append((user_id, str(100000 + index), f"Synthetic ticket {index}", created_at, status))
+        if len(batch) == 50000:
+            conn.executemany('''
+                INSERT INTO user_tickets (discord_user_id, mantis_ticket_id, ticket_summary, created_at, status)
+                VALUES (?, ?, ?, ?, ?)
+            ''', batch)
+            conn.commit()
+            batch = []
+    if batch:
+        conn.executemany('''
+            INSERT INTO user_tickets (discord_user_id, mantis_ticket_id, ticket_summary, created_at, status)
+            VALUES (?, ?, ?, ?, ?)
+        ''', batch)
+        conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+async def measure(name: str, query: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await query()
+        timings.append(time.perf_counter() - started)
+    return {
+        'query': name,
+        'rows': len(result) if isinstance(result, list) else int(result is not None),
+        'p50_ms': statistics.median(timings) * 1000,
+        'p95_ms': percentile(timings, 0.95) * 1000,
+    }
+
+async def benchmark(db: DatabaseHandler, args) -> List[Dict[str, Any]]:
+    page_size = args.page_size
+    # Without a power user, the busiest path left is an ordinary user's
+    subject = POWER_USER if args.power_user_rows else 'user-0'
+    first_page = await db.get_user_tickets_async(subject, page_size + 1)
+    cursor = (first_page[-1][2], first_page[-1][4]) if first_page else None
+
+    async def jump(page: int, status=None):
+        start = await db.get_ticket_page_start_async(subject, page, page_size, status)
+        return await db.get_user_tickets_async(subject, page_size + 1, start, status)
+
+    def unpaginated():
+        # What !tickets ran before: every row for the user, sorted, then sliced to five
+        return db._conn.execute('''
+            SELECT mantis_ticket_id, ticket_summary, created_at, status
+            FROM user_tickets NOT INDEXED
+            WHERE discord_user_id = ?
+            ORDER BY created_at DESC
+        ''', (subject,)).fetchall()
+
+    queries = [
+        ('first page', lambda: db.get_user_tickets_async(subject, page_size + 1)),
+        ('next page', lambda: db.get_user_tickets_async(subject, page_size + 1, cursor)),
+        ('jump to page 100', lambda: jump(100)),
+        (f'jump to page {args.deep_page}', lambda: jump(args.deep_page)),
+        ("first page, status 'open'", lambda: db.get_user_tickets_async(subject, page_size + 1, None, 'open')),
+        ("jump to page 100, status 'open'", lambda: jump(100, 'open')),
+        ('ordinary user, first page', lambda: db.get_user_tickets_async('user-1', page_size + 1)),
+        ('old unpaginated query', lambda: db._execute_async(unpaginated)),
+    ]
+    return [await measure(name, query, args.repeat) for name, query in queries]
+
+def print_report(results: List[Dict[str, Any]], args, populate_seconds: float):
+    print(f"{args.rows} tickets, {args.power_user_rows} for the power user, "
+          f"{args.users} other users (filled in {populate_seconds:.1f}s)")
+    print(f"{'query':<36} {'rows':>7} {'p50 ms':>9} {'p95 ms':>9}")
+    for result in results:
+        print(f"{result['query']:<36} {result['rows']:>7} {result['p50_ms']:>9.3f} {result['p95_ms']:>9.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the !tickets queries against a large synthetic table")
+    parser.add_argument('--rows', type=int, default=1_000_000, help="Total tickets to generate")
+    parser.add_argument('--users', type=int, default=50_000, help="Ordinary users sharing the other tickets")
+    parser.add_argument('--power-user-rows', type=int, default=50_000, help="Tickets belonging to one heavy user")
+    parser.add_argument('--page-size', type=int, default=5)
+    parser.add_argument('--deep-page', type=int, default=5000, help="Page number for the deep jump")
+    parser.add_argument('--repeat', type=int, default=50, help="Timed runs per query")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'tickets.db')
+        DatabaseHandler(path).close()
+        started = time.perf_counter()
+        populate(path, args.rows, args.users, args.power_user_rows, random.Random(args.seed))
+        populate_seconds = time.perf_counter() - started
+
+        db = DatabaseHandler(path)
+        try:
+            results = asyncio.run(benchmark(db, args))
+        finally:
+            db.close()
+
+    print_report(results, args, populate_seconds)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'rows': args.rows, 'results': results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
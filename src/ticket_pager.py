@@ -0,0 +1,82 @@
+from typing import Optional, List
+
+import discord
+
+from database import DatabaseHandler
+
+class TicketPager(discord.ui.View):
+    """Button-driven, keyset-paginated view of a user's tickets"""
+
+    def __init__(self, db: DatabaseHandler, discord_user_id: str, page_size: int = 5,
+                 status: Optional[str] = None, timeout: float = 180):
+        super().__init__(timeout=timeout)
+        self.db = db
+        self.discord_user_id = discord_user_id
+        self.page_size = page_size
+        self.status = status
+
+        self.page = 1
+        # Keyset cursor for the start of each page visited so far, so Previous needs no query offset
+        self._cursors: List[Optional[tuple]] = []
+        self._has_next = False
+        self._next_cursor: Optional[tuple] = None
+
+    async def load(self, page: int = 1) -> Optional[discord.Embed]:
+        """Load a page (jumping there directly); None if it has no tickets"""
+        cursor = await self.db.get_ticket_page_start_async(self.discord_user_id, page, self.page_size, self.status)
+        if page > 1 and cursor is None:
+            return None
+        self.page = page
+        self._cursors = [None] * (page - 1) + [cursor]
+        return await self._render()
+
+    async def _render(self) -> Optional[discord.Embed]:
+        # Fetch one extra row to know whether a next page exists
+        rows = await self.db.get_user_tickets_async(
+            self.discord_user_id, self.page_size + 1, self._cursors[-1], self.status
+        )
+        if not rows:
+            return None
+        self._has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self._next_cursor = (rows[-1][2], rows[-1][4])
+
+        self.previous_button.disabled = self.page <= 1
+        self.next_button.disabled = not self._has_next
+
+        title = "📋 Your Support Tickets"
+        if self.status:
+            title += f" ({self.status})"
+        embed = discord.Embed(title=title, color=0x0099ff)
+        for ticket_id, summary, created_at, status, _ in rows:
+            embed.add_field(
+                name=f"Ticket #{ticket_id}",
+                value=f"**{summary}**\nCreated: {created_at}\nStatus: {status}",
+                inline=False
+            )
+        embed.set_footer(text=f"Page {self.page}")
+        return embed
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if str(interaction.user.id) != self.discord_user_id:
+            await interaction.response.send_message("These buttons only work for the person who asked.", ephemeral=True)
+            return False
+        return True
+
+    @discord.ui.button(label="◀ Previous", style=discord.ButtonStyle.secondary)
+    async def previous_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if self._cursors[-2:-1] == [None] and self.page > 2:
+            # Arrived by jumping to a page; rebuild the cursor for the one before
+            embed = await self.load(self.page - 1)
+        else:
+            self._cursors.pop()
+            self.page -= 1
+            embed = await self._render()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self._cursors.append(self._next_cursor)
+        self.page += 1
+        embed = await self._render()
+        await interaction.response.edit_message(embed=embed, view=self)
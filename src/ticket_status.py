@@ -0,0 +1,86 @@
+import asyncio
+import time
+from typing import Optional, Dict, Any, Tuple
+
+from database import DatabaseHandler
+from mantis_client import MantisHubClient
+
+class TicketStatusTracker:
+    """TTL cache of Mantis ticket statuses, kept fresh by a background bulk sync"""
+
+    def __init__(self, db: DatabaseHandler, mantis_client: MantisHubClient,
+                 ttl: float = 300, sync_interval: float = 300, concurrency: int = 5):
+        self.db = db
+        self.mantis_client = mantis_client
+        self.ttl = ttl
+        self.sync_interval = sync_interval
+        self.concurrency = concurrency
+
+        self._cache: Dict[str, Tuple[Dict[str, Any], float]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+        self.stats = {'hits': 0, 'misses': 0, 'syncs': 0, 'synced_tickets': 0}
+
+    def start(self):
+        """Start the periodic background refresh"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._sync_loop())
+
+    async def close(self):
+        """Stop the background refresh"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def get(self, ticket_id: str) -> Optional[Dict[str, Any]]:
+        """Ticket details from the cache, fetching from Mantis on a miss"""
+        cached = self._cache.get(ticket_id)
+        if cached is not None and time.monotonic() - cached[1] < self.ttl:
+            self.stats['hits'] += 1
+            return cached[0]
+
+        self.stats['misses'] += 1
+        info = await self.mantis_client.get_ticket_status_async(ticket_id)
+        if info is not None:
+            self._cache[ticket_id] = (info, time.monotonic())
+            await self.db.update_ticket_statuses_async({ticket_id: str(info['status']).lower()})
+        return info
+
+    async def sync(self):
+        """Refresh every open ticket concurrently and write the statuses back"""
+        ticket_ids = await self.db.get_open_ticket_ids_async()
+        if not ticket_ids:
+            return
+
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(ticket_id: str):
+            async with slots:
+                return ticket_id, await self.mantis_client.get_ticket_status_async(ticket_id)
+
+        statuses = {}
+        now = time.monotonic()
+        for ticket_id, info in await asyncio.gather(*(fetch(ticket_id) for ticket_id in ticket_ids)):
+            if info is not None:
+                self._cache[ticket_id] = (info, now)
+                statuses[ticket_id] = str(info['status']).lower()
+
+        await self.db.update_ticket_statuses_async(statuses)
+        self.stats['syncs'] += 1
+        self.stats['synced_tickets'] += len(statuses)
+
+        # Drop entries the sync no longer refreshes once they go stale
+        self._cache = {ticket_id: entry for ticket_id, entry in self._cache.items()
+                       if now - entry[1] < self.ttl}
+
+    async def _sync_loop(self):
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                print(f"Error syncing ticket statuses: {e}")
+            await asyncio.sleep(self.sync_interval)
@@ -0,0 +1,33 @@
+import pytest
+
+from config import Config
+from intent_classifier import IntentClassifier
+from intent_eval import DEFAULT_LABELS, evaluate, load_labels
+
+@pytest.mark.parametrize('message', [
+    "My washer won't drain and there are sparks coming from the back",
+    "it's not draining anymore after I cleaned the filter",
+    "I already tried the drain filter and it still won't drain",
+    "won't drain and water is leaking onto the floor",
+])
+def test_hazards_and_fix_attempts_go_to_the_llm(message):
+    assert IntentClassifier().answer(message, Config.INTENT_CONFIDENCE_THRESHOLD) is None
+
+@pytest.mark.parametrize('message', [
+    "My washer won't start when I press the button",
+    "The machine won't drain when I run the spin cycle",
+])
+def test_symptom_with_a_when_clause_is_answered_locally(message):
+    assert IntentClassifier().answer(message, Config.INTENT_CONFIDENCE_THRESHOLD) is not None
+
+def test_plain_report_is_answered_locally():
+    answer = IntentClassifier().answer("My washing machine won't drain", Config.INTENT_CONFIDENCE_THRESHOLD)
+    assert answer is not None and answer['category'] == 'Hardware'
+
+def test_configured_threshold_on_labelled_set():
+    result = evaluate(load_labels(DEFAULT_LABELS), Config.INTENT_CONFIDENCE_THRESHOLD)
+    assert result['should_escalate'] == []
+    assert result['wrong_intent'] == []
+    assert result['recall'] >= 0.6
+    assert result['llm_calls_avoided'] > 0
+    assert result['mean_us'] > 0
@@ -0,0 +1,43 @@
+import asyncio
+import json
+
+from intent_classifier import IMMEDIATE_PRIORITY
+from llm_handler import LLMHandler
+from replay import StubGeminiModel
+
+GEMINI_REPLY = json.dumps({
+    "action": "create_ticket",
+    "response": "Switch the machine off at the wall and unplug it.",
+    "ticket_summary": "Washer not draining",
+    "category": "Hardware",
+    "priority": 20,
+})
+
+def test_immediate_priority_skips_the_canned_answer():
+    model = StubGeminiModel(lambda: 0.01, {"My washing machine won't drain": json.loads(GEMINI_REPLY)})
+    handler = LLMHandler(model=model)
+
+    async def run():
+        local = await handler.process_query("My washing machine won't drain")
+        urgent = await handler.process_query("My washing machine won't drain", priority=IMMEDIATE_PRIORITY)
+        return local, urgent
+
+    local, urgent = asyncio.run(run())
+    assert local['action'] == 'troubleshoot'
+    assert urgent['response'].startswith("Switch the machine off")
+    assert model.calls == 1
+
+def test_shed_call_never_opens_a_ticket():
+    handler = LLMHandler(model=StubGeminiModel(lambda: 0.01))
+    # No slots and no queue, so every call is shed
+    handler.max_in_flight = handler.max_queue_depth = 0
+
+    async def run(message):
+        return await handler.process_query(message)
+
+    busy = asyncio.run(run("The display shows E21 and the drum stops"))
+    assert busy['action'] == 'clarify'
+    assert "try again" in busy['response']
+    # Weak keyword matches: a canned answer that opens a ticket isn't used under overload
+    assert asyncio.run(run("The washer seems dead"))['action'] == 'clarify'
+    assert asyncio.run(run("Soap keeps piling up"))['action'] == 'troubleshoot'
@@ -0,0 +1,45 @@
+"""200 concurrent users through the replay harness, with a stub Gemini model
+
+Run with -s to see the before/after latency figures.
+"""
+
+import asyncio
+import random
+
+import pytest
+
+import replay
+from config import Config
+
+USERS = 200
+
+def run(monkeypatch, *flags):
+    # Every message is distinct so each one reaches the model or the classifier
+    monkeypatch.setattr(Config, 'LLM_STREAMING', False)
+    monkeypatch.setattr(Config, 'RESPONSE_CACHE_PERSIST', False)
+    monkeypatch.setattr(Config, 'RESPONSE_CACHE_SIMILARITY', 1.01)
+    args = replay.build_parser().parse_args([
+        '--synthetic', str(USERS), '--users', str(USERS), '--speed', '0', '--channels', '50',
+        '--llm-latency', 'const:0.05', '--soap-latency', 'const:0.01', '--discord-latency', 'const:0.01',
+        *flags,
+    ])
+    messages = replay.synthetic_messages(args.synthetic, args.users, args.rate, random.Random(args.seed))
+    for index, message in enumerate(messages):
+        message['user_id'] = index
+        message['content'] = f"{message['content']} (report {index})"
+    return asyncio.run(replay.replay(messages, args))
+
+@pytest.mark.slow
+def test_two_hundred_concurrent_users(monkeypatch):
+    before = run(monkeypatch, '--blocking-llm')
+    after = run(monkeypatch)
+    for name, results in (('blocking', before), ('async pool', after)):
+        latency = results['latency_seconds']
+        print(f"{name}: p50 {latency['p50']:.3f}s  p99 {latency['p99']:.3f}s  "
+              f"loop blocked {results['loop_blocking']['total_seconds']:.2f}s "
+              f"for {results['gemini_calls']} model calls")
+
+    assert after['gemini_calls'] == before['gemini_calls'] > 0
+    # Model calls no longer stall the event loop, so other users aren't held up by them
+    assert after['loop_blocking']['total_seconds'] < before['loop_blocking']['total_seconds'] / 4
+    assert after['latency_seconds']['p99'] < before['latency_seconds']['p99'] / 2
@@ -0,0 +1,47 @@
+import asyncio
+import sqlite3
+
+from database import DatabaseHandler
+from maintenance import MaintenanceJob
+
+def make_legacy_database(path):
+    """A database created before incremental vacuum, with free pages to reclaim"""
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE filler (data TEXT)')
+    conn.executemany('INSERT INTO filler VALUES (?)', [('x' * 1000,) for _ in range(500)])
+    conn.commit()
+    conn.execute('DELETE FROM filler')
+    conn.commit()
+    conn.close()
+
+def test_maintenance_never_runs_a_full_vacuum_on_a_legacy_database(tmp_path):
+    path = str(tmp_path / 'bot.db')
+    make_legacy_database(path)
+    db = DatabaseHandler(path)
+    job = MaintenanceJob(db, quiet_period=0)
+    vacuums = []
+    db._conn.set_trace_callback(lambda sql: vacuums.append(sql) if sql.strip().upper() == 'VACUUM' else None)
+
+    report = asyncio.run(job.run())
+    assert vacuums == []
+    assert report['reclaimed_bytes'] == 0
+    assert report['free_bytes'] > 0
+    assert 'filler' in report['tables'] or 'filler_rows' in report['tables']
+    assert not db._execute(db._incremental_vacuum_enabled)
+    db.close()
+
+def test_migration_enables_incremental_vacuum_for_later_runs(tmp_path):
+    path = str(tmp_path / 'bot.db')
+    make_legacy_database(path)
+    db = DatabaseHandler(path)
+    db.enable_incremental_vacuum()
+    assert db._execute(db._incremental_vacuum_enabled)
+
+    # Free some pages again; maintenance now returns them in small steps
+    db._execute(lambda: db._conn.executemany('INSERT INTO filler VALUES (?)', [('x' * 1000,) for _ in range(500)]))
+    db._execute(lambda: db._conn.execute('DELETE FROM filler'))
+    db._execute(db._conn.commit)
+    report = asyncio.run(MaintenanceJob(db, quiet_period=0, vacuum_pages=200).run())
+    assert report['reclaimed_bytes'] > 0
+    assert report['free_bytes'] == 0
+    db.close()
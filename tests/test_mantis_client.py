@@ -0,0 +1,38 @@
+import pytest
+
+from config import Config
+from fake_mantis_server import FakeMantisServer
+from mantis_client import MantisHubClient
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(Config, 'MANTIS_USERNAME', 'test')
+    monkeypatch.setattr(Config, 'MANTIS_PASSWORD', 'test')
+    monkeypatch.setattr(Config, 'MANTIS_WSDL_CACHE_PATH', '')
+    server = FakeMantisServer()
+    server.start()
+    yield server
+    server.stop()
+
+def test_ticket_round_trip_over_http(server):
+    client = MantisHubClient(soap_url=server.wsdl_url)
+    ticket_id = client.create_ticket("Noisy drum", "Grinds <loudly> & shakes\n\n(Bot reference: msg-1)",
+                                     "User", "hardware")
+    assert ticket_id is not None
+    assert client.get_ticket_status(ticket_id)['summary'] == "Noisy drum"
+    assert client.add_note_to_ticket(ticket_id, "Customer sent a photo")
+    assert server.notes[int(ticket_id)] == ["Customer sent a photo"]
+    assert client.find_ticket_by_text("(Bot reference: msg-1)") == ticket_id
+    assert client.find_ticket_by_text("(Bot reference: msg-2)") is None
+    assert client.get_categories() == ['General', 'Hardware', 'Maintenance', 'Software']
+
+def test_read_timeout_on_add_is_not_retried_but_can_be_found(server, monkeypatch):
+    monkeypatch.setattr(Config, 'MANTIS_READ_TIMEOUT', 0.2)
+    client = MantisHubClient(soap_url=server.wsdl_url)
+    client.get_categories()
+    server.latency = 0.5
+    assert client.create_ticket("Door leaks", "Water on the floor\n\n(Bot reference: msg-3)", "User") is None
+    server.latency = 0.0
+    # The server still created it, once
+    assert len(server._issues) == 1
+    assert client.find_ticket_by_text("(Bot reference: msg-3)") == str(next(iter(server._issues)))
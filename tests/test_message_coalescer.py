@@ -0,0 +1,44 @@
+import asyncio
+import random
+
+from message_coalescer import MessageCoalescer
+
+def test_interleaved_bursts_are_handled_once_in_order_without_overlap():
+    users, rounds = 30, 6
+    rng = random.Random(7)
+    handled = {}
+    active = set()
+    overlaps = []
+
+    async def handler(batch):
+        user_id = batch[0][0]
+        if user_id in active:
+            overlaps.append(user_id)
+        active.add(user_id)
+        # Long enough that a user's next burst is ready while this one runs
+        await asyncio.sleep(rng.uniform(0.01, 0.06))
+        handled.setdefault(user_id, []).extend(sequence for _, sequence in batch)
+        active.discard(user_id)
+
+    async def run():
+        coalescer = MessageCoalescer(handler, window=0.02, max_delay=0.05)
+        for sequence in range(rounds):
+            order = list(range(users))
+            rng.shuffle(order)
+            for user in order:
+                coalescer.submit(str(user), (str(user), sequence))
+                if rng.random() < 0.2:
+                    await asyncio.sleep(rng.uniform(0, 0.03))
+        while coalescer._tasks:
+            await asyncio.sleep(0.01)
+        return coalescer
+
+    coalescer = asyncio.run(run())
+    assert coalescer.stats['messages'] == users * rounds == 180
+    assert sum(len(sequences) for sequences in handled.values()) == 180
+    assert overlaps == []
+    for user in range(users):
+        assert handled[str(user)] == list(range(rounds))
+    assert coalescer.stats['batches'] < 180
+    # Idle users leave no lock behind
+    assert coalescer._locks == {}
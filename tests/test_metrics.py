@@ -0,0 +1,61 @@
+import asyncio
+import random
+import time
+
+import replay
+from config import Config
+from metrics import REGISTRY, Counter, Gauge, Histogram
+
+# Instrumentation allowed per handled message, far below a Gemini or SOAP round trip
+PER_MESSAGE_BUDGET = 200e-6
+# A /metrics scrape renders every metric and calls every component's stats callback
+SCRAPE_BUDGET = 0.05
+MESSAGES = 100
+
+def cost_per_call(record, iterations: int = 50000) -> float:
+    """Best of several runs, so a busy machine doesn't fail the test"""
+    best = float('inf')
+    for _ in range(5):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            record()
+        best = min(best, (time.perf_counter() - started) / iterations)
+    return best
+
+def test_instrumentation_stays_within_the_per_message_budget(monkeypatch):
+    # The most expensive primitive the bot uses: a labelled histogram observation
+    histogram = Histogram('budget_probe_seconds', 'test', ['operation'])
+    per_call = cost_per_call(lambda: histogram.observe(0.001, operation='get_session_messages'))
+
+    # Count every metric recorded while real messages go through the bot
+    calls = []
+    for cls, method in ((Histogram, 'observe'), (Counter, 'inc'), (Gauge, 'set')):
+        def counted(self, *args, _original=getattr(cls, method), **kwargs):
+            calls.append(self.name)
+            return _original(self, *args, **kwargs)
+        monkeypatch.setattr(cls, method, counted)
+
+    monkeypatch.setattr(Config, 'RESPONSE_CACHE_PERSIST', False)
+    args = replay.build_parser().parse_args([
+        '--synthetic', str(MESSAGES), '--users', '50', '--speed', '0', '--channels', '50',
+        '--llm-latency', 'const:0.001', '--soap-latency', 'const:0.001', '--discord-latency', 'const:0.001',
+    ])
+    messages = replay.synthetic_messages(args.synthetic, args.users, args.rate, random.Random(args.seed))
+    asyncio.run(replay.replay(messages, args))
+
+    calls_per_message = len(calls) / MESSAGES
+    overhead = calls_per_message * per_call
+    print(f"{calls_per_message:.1f} metric calls per message at {per_call * 1e6:.2f}us each "
+          f"= {overhead * 1e6:.1f}us per message")
+    assert 'bot_message_latency_seconds' in calls
+    assert overhead < PER_MESSAGE_BUDGET
+
+    # The scrape itself, with the components the replay configured
+    started = time.perf_counter()
+    for _ in range(20):
+        text = REGISTRY.render()
+    scrape = (time.perf_counter() - started) / 20
+    assert 'bot_message_latency_seconds_count' in text
+    assert 'reply_queue_depth' in text
+    assert 'mantis_outbox_delivered' in text
+    assert scrape < SCRAPE_BUDGET
@@ -0,0 +1,83 @@
+import asyncio
+
+from model_router import ModelBackend, ModelRouter
+from replay import StubGeminiModel
+
+def stub(latency=0.1):
+    return StubGeminiModel(lambda: latency)
+
+def make_router(*backends, **options):
+    options.setdefault('min_samples', 3)
+    options.setdefault('hedge_delay', 0.05)
+    options.setdefault('min_hedge_delay', 0.01)
+    return ModelRouter(list(backends), **options)
+
+def test_message_length_picks_the_tier_whatever_the_latency():
+    cheap = ModelBackend('cheap', stub(), tier=0)
+    strong = ModelBackend('strong', stub(), tier=1)
+    router = make_router(cheap, strong)
+    for _ in range(5):
+        cheap.record(1.0)
+        strong.record(2.0)
+    assert router.choose('short question')[0] is cheap
+    # A faster cheap model doesn't take long messages away from the strong one
+    assert router.choose('x' * 1000)[0] is strong
+
+    # An unhealthy tier falls back to the other one
+    for _ in range(10):
+        strong.record(None)
+    assert router.choose('x' * 1000)[0] is cheap
+
+def test_latency_picks_within_a_tier():
+    slow = ModelBackend('slow', stub(), tier=1)
+    fast = ModelBackend('fast', stub(), tier=1)
+    router = make_router(ModelBackend('cheap', stub(), tier=0), slow, fast)
+    for _ in range(5):
+        slow.record(2.0)
+        fast.record(0.5)
+    primary, hedge = router.choose('x' * 1000)
+    assert primary is fast and hedge is slow
+
+def test_error_rate_counts_against_a_model():
+    first = ModelBackend('first', stub(), tier=0)
+    second = ModelBackend('second', stub(), tier=0)
+    router = make_router(first, second)
+    for _ in range(5):
+        first.record(0.5)
+        second.record(0.5)
+    for _ in range(3):
+        first.record(None)
+    assert router.choose('hi')[0] is second
+
+def test_abandoned_slow_calls_count_toward_latency():
+    slow = ModelBackend('slow', stub(1.0), tier=0)
+    fast = ModelBackend('fast', stub(0.01), tier=1)
+    router = make_router(slow, fast)
+
+    async def run():
+        for _ in range(3):
+            await router.generate('prompt', 'hi')
+
+    asyncio.run(run())
+    assert fast.stats['hedge_wins'] >= 1
+    assert slow.stats['censored'] == fast.stats['hedge_wins']
+    # Without the censored samples the slow model would have no latency at all
+    assert slow.latency_quantile(0.95, 3) >= 0.05
+
+def test_hedge_needs_a_free_pool_slot():
+    slow = ModelBackend('slow', stub(0.2), tier=0)
+    fast = ModelBackend('fast', stub(0.01), tier=1)
+    # Short messages stay on tier 0, so the faster model is only ever the hedge
+    router = make_router(slow, fast)
+
+    async def run(free_slots):
+        slots = asyncio.Semaphore(1 + free_slots)
+        async with slots:
+            await router.generate('prompt', 'hi', slots=slots)
+        # Every slot is handed back once the call is over
+        assert not slots.locked()
+
+    asyncio.run(run(free_slots=0))
+    assert fast.stats['hedges'] == 0 and fast.stats['hedges_skipped'] == 1
+    asyncio.run(run(free_slots=1))
+    assert fast.stats['hedges'] == 1 and fast.stats['hedge_wins'] == 1
@@ -0,0 +1,158 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+import requests
+
+from database import DatabaseHandler
+from mantis_client import MantisHubClient
+from outbox import CircuitBreaker, MantisOutbox
+from replay import FakeMantisService
+from ticket_batcher import TicketBatcher
+
+REPORTS = [
+    "The drum makes a grinding noise when it spins",
+    "Water leaks from the door seal during the wash",
+    "Display shows error code E21 and stops mid cycle",
+]
+
+def make_outbox(tmp_path, error_rate, breaker=None, seed=1):
+    service = FakeMantisService(lambda: 0.0, error_rate, random.Random(seed))
+    mantis = MantisHubClient(soap_url='fake://mantis', client=SimpleNamespace(service=service))
+    # Leave every failure to the outbox rather than the client's own retries
+    mantis.max_retries = 0
+    db = DatabaseHandler(str(tmp_path / 'bot.db'))
+    outbox = MantisOutbox(db, mantis, TicketBatcher(mantis), poll_interval=0, base_backoff=0,
+                          max_backoff=0, max_attempts=100,
+                          breaker=breaker or CircuitBreaker(failure_threshold=1000, cooldown=0))
+    return service, db, outbox
+
+async def submit_reports(outbox, copies):
+    references = []
+    for index, report in enumerate(REPORTS):
+        for copy in range(copies):
+            references.append(await outbox.submit_ticket(
+                f"user-{index}-{copy}", f"msg-{index}-{copy}", report[:40], report, f"User {index}-{copy}",
+                category="Hardware", report=report))
+    return references
+
+def test_every_report_reaches_a_flaky_mantis(tmp_path):
+    service, db, outbox = make_outbox(tmp_path, error_rate=0.3)
+
+    async def run():
+        references = await submit_reports(outbox, copies=4)
+        await outbox.submit_note('follow-up', references[0], "Customer sent a photo")
+        for _ in range(200):
+            await outbox.deliver_due()
+            if not await db.get_due_outbox_async(1):
+                break
+        return references
+
+    references = asyncio.run(run())
+    assert outbox.stats['retried'] > 0
+    assert outbox.stats['gave_up'] == 0
+
+    for reference in references:
+        status, ticket_id, _, _ = db.get_outbox_entry(int(reference[2:]))
+        assert status == 'delivered'
+        assert int(ticket_id) in service._issues
+
+    # Every report is either its own issue or a note on the issue it matched
+    merged = sum(1 for notes in service.notes.values() for note in notes if 'Also reported' in note['text'])
+    assert len(service._issues) + merged == len(references)
+    assert len(service._issues) < len(references)
+    first_ticket = int(db.get_outbox_entry(int(references[0][2:]))[1])
+    assert any(note['text'] == "Customer sent a photo" for note in service.notes[first_ticket])
+    db.close()
+
+def test_note_waiting_on_its_ticket_does_not_trip_the_breaker(tmp_path):
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=60)
+    _, db, outbox = make_outbox(tmp_path, error_rate=0.0, breaker=breaker)
+
+    async def run():
+        reference = await outbox.submit_ticket("user", "msg", "Noisy drum", "Noisy drum", "User")
+        # The ticket itself isn't due yet, so the note has nothing to attach to
+        await db.defer_outbox_async(int(reference[2:]), float('inf'))
+        await outbox.submit_note('note', reference, "More details")
+        await outbox.deliver_due()
+
+    asyncio.run(run())
+    assert outbox.stats['deferred'] == 1
+    assert breaker.failures == 0
+    assert breaker.allow()
+    db.close()
+
+def test_half_open_breaker_sends_a_single_test_request(tmp_path):
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0)
+    service, db, outbox = make_outbox(tmp_path, error_rate=1.0, breaker=breaker)
+    calls = []
+    for operation in ('mc_issue_add', 'mc_filter_search_issue_ids'):
+        original = getattr(service, operation)
+        setattr(service, operation, lambda *args, _original=original, **kwargs: calls.append(1) or _original(*args, **kwargs))
+
+    async def run():
+        for index in range(5):
+            await outbox.submit_ticket(f"user-{index}", f"msg-{index}", f"Problem {index}", f"Problem {index}", "User")
+        await outbox.deliver_due()
+        first_pass = len(calls)
+        await outbox.deliver_due()
+        probe = len(calls) - first_pass
+
+        service.error_rate = 0.0
+        await outbox.deliver_due()
+        recovered = len(calls) - first_pass - probe
+        await outbox.deliver_due()
+        return first_pass, probe, recovered
+
+    first_pass, probe, recovered = asyncio.run(run())
+    assert first_pass == 5
+    # A retry first looks for the issue in case the failed add went through
+    assert probe == 1
+    assert recovered == 2
+    assert breaker.opened_at is None
+    assert outbox.stats['delivered'] == 5
+    db.close()
+
+def test_timed_out_creation_is_found_instead_of_filed_twice(tmp_path):
+    service, db, outbox = make_outbox(tmp_path, error_rate=0.0)
+    add = service.mc_issue_add
+
+    def add_then_time_out(*args, **kwargs):
+        # Mantis creates the issue but the reply never arrives
+        service.mc_issue_add = add
+        add(*args, **kwargs)
+        raise requests.ReadTimeout("Stub Mantis read timed out")
+    service.mc_issue_add = add_then_time_out
+
+    async def run():
+        reference = await outbox.submit_ticket("user", "msg-timeout", "Noisy drum", "Noisy drum", "User")
+        other = await outbox.submit_ticket("user", "msg-other", "Door leaks", "Door leaks", "User")
+        await outbox.deliver_due()
+        await outbox.deliver_due()
+        return reference, other
+
+    reference, other = asyncio.run(run())
+    assert len(service._issues) == 2
+    assert outbox.stats['found_existing'] == 1
+    state, ticket_id = asyncio.run(outbox.resolve_reference(reference))
+    assert state == 'created'
+    assert "(Bot reference: msg-timeout)" in service._issues[int(ticket_id)]['description']
+    assert asyncio.run(outbox.resolve_reference(other))[1] != ticket_id
+    db.close()
+
+def test_references_report_failed_and_unknown_tickets(tmp_path):
+    _, db, outbox = make_outbox(tmp_path, error_rate=1.0)
+    outbox.max_attempts = 1
+
+    async def run():
+        reference = await outbox.submit_ticket("user", "msg", "Noisy drum", "Noisy drum", "User")
+        pending = await outbox.resolve_reference(reference)
+        await outbox.deliver_due()
+        return pending, await outbox.resolve_reference(reference), await outbox.resolve_reference('P-999')
+
+    pending, failed, unknown = asyncio.run(run())
+    assert pending == ('pending', None)
+    assert failed == ('failed', None)
+    assert unknown == ('unknown', None)
+    assert asyncio.run(outbox.resolve_reference('1234')) == ('created', '1234')
+    db.close()
@@ -0,0 +1,24 @@
+import json
+import os
+
+import pytest
+
+from response_parser import ResponseParseError, parse_llm_response
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'malformed_replies.jsonl')
+
+with open(FIXTURES, encoding='utf-8') as f:
+    CASES = [json.loads(line) for line in f if line.strip()]
+
+@pytest.mark.parametrize('case', CASES, ids=[case['name'] for case in CASES])
+def test_malformed_reply(case):
+    if case['expected'] is None:
+        # Rejected replies are re-asked, never guessed at
+        with pytest.raises(ResponseParseError):
+            parse_llm_response(case['reply'])
+        return
+
+    response, repaired = parse_llm_response(case['reply'])
+    assert repaired == case['repaired']
+    for field, value in case['expected'].items():
+        assert response[field] == value
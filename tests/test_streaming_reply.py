@@ -0,0 +1,26 @@
+import asyncio
+
+from metrics import STREAM_COMPLETE, STREAM_FIRST_VISIBLE
+from replay import FakeChannel, FakeMessage, FakeUser
+from reply_queue import ReplyQueue
+from streaming_reply import StreamingReply
+
+def test_stream_timings_are_exported():
+    before_visible = STREAM_FIRST_VISIBLE.totals().get((), (0, 0.0))[0]
+    before_complete = STREAM_COMPLETE.totals().get((), (0, 0.0))[0]
+
+    async def run():
+        queue = ReplyQueue()
+        message = FakeMessage(1, FakeUser(1), FakeChannel(1, lambda: 0.01), "My washer won't drain")
+        stream = StreamingReply(message, interval=0.05, reply_queue=queue)
+        for text in ("Unplug", "Unplug the machine", "Unplug the machine and open the filter"):
+            await stream.update(text)
+            await asyncio.sleep(0.06)
+        assert await stream.finish(content="Unplug the machine, then open the drain filter.")
+        await queue.drain()
+        return stream
+
+    stream = asyncio.run(run())
+    assert 0 < stream.first_visible_after <= stream.complete_after
+    assert STREAM_FIRST_VISIBLE.totals()[()][0] == before_visible + 1
+    assert STREAM_COMPLETE.totals()[()][0] == before_complete + 1